@@ -1,6 +1,20 @@
+import threading
+
 import pandas as pd
 import numpy as np
 
+import metrics
+from cube import add_cubes, aggregate, build_cube, cube_daily, empty_cube
+from timeseries import empty_time_series, time_series_from_daily, trades_time_series
+from trade_table import TradeTable
+
+# Tipo de saída das posições fechadas cuja ordem de fechamento não é Stop Loss, Take Profit,
+# Trailing Stop ou liquidação (ou não foi encontrada no histórico de ordens; ver order_history.py)
+CLOSED_POSITION_EXIT_TYPE = 'Manual'
+
+# Campos da ordem de fechamento usados na classificação do tipo de saída
+EXIT_ORDER_FIELDS = ('stopOrderType', 'orderLinkId', 'createType')
+
 def get_exit_type(row):
     """
     Determina o tipo de saída de forma mais precisa, priorizando a coluna stopOrderType.
@@ -18,139 +32,20 @@ def get_exit_type(row):
     return 'Parcial'
 
 
-def process_closed_positions_data(closed_positions_df, leverage, account_balance=None, transactions_df=None):
+def _column_as_float(df, col, default=0.0):
     """
-    Processa dados da API de posições fechadas da Bybit.
-    Esta função usa dados já processados pela Bybit para maior precisão.
+    Retorna a coluna como array float64, ou um array preenchido com o valor
+    padrão quando a coluna não existe (equivalente ao row.get(col, default)).
+    """
+    if col in df.columns:
+        return df[col].to_numpy(dtype='float64', na_value=np.nan)
+    return np.full(len(df), default, dtype='float64')
+
+
+def build_account_info(account_balance):
+    """
+    Processa informações da conta a partir dos saldos de fetch_account_balance.
     """
-    if closed_positions_df.empty:
-        return {
-            'kpis': {
-                'total_pnl': 0,
-                'win_rate': 0,
-                'total_margin_cost': 0,
-                'total_trades': 0,
-                'avg_roi': 0
-            },
-            'winners_summary': [],
-            'losers_summary': [],
-            'exit_type_summary': [],
-            'all_trades': [],
-            'raw_df': closed_positions_df,
-            'account_info': {},
-            'transactions_summary': {}
-        }
-    
-    df = closed_positions_df.copy()
-    
-    # Converter timestamps para datetime
-    df['createdTime'] = pd.to_numeric(df['createdTime'], errors='coerce')
-    df['updatedTime'] = pd.to_numeric(df['updatedTime'], errors='coerce')
-    df['createdTime'] = pd.to_datetime(df['createdTime'], unit='ms')
-    df['updatedTime'] = pd.to_datetime(df['updatedTime'], unit='ms')
-    
-    # Converter campos numéricos
-    numeric_cols = ['closedPnl', 'fillFee', 'qty', 'avgEntryPrice', 'avgExitPrice']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Remover linhas com dados inválidos
-    df = df.dropna(subset=['closedPnl', 'qty', 'avgEntryPrice'])
-    
-    # Calcular métricas adicionais
-    trades = []
-    for index, row in df.iterrows():
-        symbol = row.get('symbol', '')
-        side = row.get('side', '')
-        qty = abs(float(row.get('qty', 0)))
-        avg_entry_price = float(row.get('avgEntryPrice', 0))
-        avg_exit_price = float(row.get('avgExitPrice', 0))
-        closed_pnl = float(row.get('closedPnl', 0))
-        fill_fee = float(row.get('fillFee', 0))
-        created_time = row.get('createdTime')
-        updated_time = row.get('updatedTime')
-        
-        # Calcular valor nocional e margem
-        valor_nocional = qty * avg_entry_price
-        margem = valor_nocional / leverage if leverage > 0 else valor_nocional
-        
-        # PnL líquido (já inclui taxas na API da Bybit)
-        pnl_net = closed_pnl
-        
-        # ROI baseado na margem utilizada
-        roi = (pnl_net / margem) * 100 if margem > 0 else 0
-        
-        # Duração da posição
-        duration = updated_time - created_time if created_time and updated_time else pd.Timedelta(0)
-        
-        # Determinar tipo de saída (simplificado, pois a API não fornece detalhes)
-        exit_type = 'Manual'  # Pode ser expandido com lógica adicional se necessário
-        
-        trades.append({
-            'symbol': symbol,
-            'position_side': 'Long' if side == 'Buy' else 'Short',
-            'entry_time': created_time,
-            'exit_time': updated_time,
-            'duration': str(duration).replace('0 days ', '') if duration else '0:00:00',
-            'quantity': qty,
-            'avg_entry_price': avg_entry_price,
-            'exit_price': avg_exit_price,
-            'valor_nocional': valor_nocional,
-            'margem': margem,
-            'pnl_net': pnl_net,
-            'roi': roi,
-            'result': 'Lucro' if pnl_net > 0 else 'Perda',
-            'exit_type': exit_type,
-            'fill_fee': fill_fee
-        })
-    
-    analysis_df = pd.DataFrame(trades)
-    
-    # Calcular KPIs
-    total_pnl = analysis_df['pnl_net'].sum()
-    total_trades = len(analysis_df)
-    winning_trades = analysis_df[analysis_df['pnl_net'] > 0]
-    win_rate = (len(winning_trades) / total_trades) * 100 if total_trades > 0 else 0
-    total_margin_cost = analysis_df['margem'].sum()
-    avg_roi = (total_pnl / total_margin_cost) * 100 if total_margin_cost > 0 else 0
-    
-    kpis = {
-        'total_pnl': total_pnl,
-        'win_rate': win_rate,
-        'total_margin_cost': total_margin_cost,
-        'total_trades': total_trades,
-        'avg_roi': avg_roi
-    }
-    
-    # Resumo por símbolo
-    if not analysis_df.empty:
-        symbol_summary = analysis_df.groupby('symbol').agg(
-            total_pnl_net=('pnl_net', 'sum'),
-            total_margin=('margem', 'sum'),
-            win_rate=('result', lambda x: (x == 'Lucro').sum() / x.count() * 100),
-            trade_count=('symbol', 'count')
-        ).reset_index()
-        symbol_summary['roi_agregado'] = (symbol_summary['total_pnl_net'] / symbol_summary['total_margin']) * 100
-        
-        winners_summary = symbol_summary[symbol_summary['total_pnl_net'] >= 0].sort_values(by='total_pnl_net', ascending=False)
-        losers_summary = symbol_summary[symbol_summary['total_pnl_net'] < 0].sort_values(by='total_pnl_net', ascending=True)
-        
-        # Resumo por tipo de saída (simplificado para posições fechadas)
-        exit_type_summary = analysis_df.groupby('exit_type').agg(
-            total_pnl_net=('pnl_net', 'sum'),
-            total_margin=('margem', 'sum'),
-            win_rate=('result', lambda x: (x == 'Lucro').sum() / x.count() * 100),
-            exit_count=('exit_type', 'count')
-        ).reset_index()
-        exit_type_summary['roi_agregado'] = (exit_type_summary['total_pnl_net'] / exit_type_summary['total_margin']) * 100
-        exit_type_summary = exit_type_summary.sort_values(by='total_pnl_net', ascending=False)
-    else:
-        winners_summary = pd.DataFrame()
-        losers_summary = pd.DataFrame()
-        exit_type_summary = pd.DataFrame()
-
-    # Processar informações da conta
     account_info = {}
     if account_balance:
         account_info = {
@@ -160,8 +55,13 @@ def process_closed_positions_data(closed_positions_df, leverage, account_balance
                 balance.get('unrealized_pnl', 0) for coin, balance in account_balance.items()
             ])
         }
-    
-    # Processar transações (sem transferências internas por limitação da API)
+    return account_info
+
+
+def build_transactions_summary(transactions_df):
+    """
+    Processa transações (sem transferências internas por limitação da API).
+    """
     transactions_summary = {}
     if transactions_df is not None and not transactions_df.empty:
         # Separar por tipo
@@ -183,174 +83,479 @@ def process_closed_positions_data(closed_positions_df, leverage, account_balance
             ),
             'transactions_detail': transactions_df.to_dict('records') if not transactions_df.empty else []
         }
+    return transactions_summary
+
+
+def _prepare_closed_positions(closed_positions_df):
+    """
+    Converte timestamps e campos numéricos das posições fechadas e remove linhas inválidas.
+    """
+    df = closed_positions_df.copy()
+    
+    # Converter timestamps para datetime
+    df['createdTime'] = pd.to_numeric(df['createdTime'], errors='coerce')
+    df['updatedTime'] = pd.to_numeric(df['updatedTime'], errors='coerce')
+    df['createdTime'] = pd.to_datetime(df['createdTime'], unit='ms')
+    df['updatedTime'] = pd.to_datetime(df['updatedTime'], unit='ms')
+    
+    # Converter campos numéricos
+    numeric_cols = ['closedPnl', 'fillFee', 'qty', 'avgEntryPrice', 'avgExitPrice']
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
     
+    # Remover linhas com dados inválidos
+    return df.dropna(subset=['closedPnl', 'qty', 'avgEntryPrice'])
+
+
+def _column_as_object(df, col, default=''):
+    if col in df.columns:
+        return df[col].to_numpy()
+    return np.full(len(df), default, dtype=object)
+
+
+def _closed_positions_margin(df, leverage):
+    """
+    Calcula valor nocional e margem de cada posição fechada.
+    :return: (quantidade, preço médio de entrada, valor nocional, margem) como arrays.
+    """
+    qty = np.abs(_column_as_float(df, 'qty'))
+    avg_entry_price = _column_as_float(df, 'avgEntryPrice')
+    valor_nocional = qty * avg_entry_price
+    margem = valor_nocional / leverage if leverage > 0 else valor_nocional.copy()
+    return qty, avg_entry_price, valor_nocional, margem
+
+
+def _closed_positions_exit_types(df):
+    """
+    Tipo de saída de cada posição fechada, a partir dos campos da ordem de fechamento
+    acrescentados por order_history.enrich_exit_orders; sem eles, CLOSED_POSITION_EXIT_TYPE.
+    """
+    if not any(field in df.columns for field in EXIT_ORDER_FIELDS):
+        return CLOSED_POSITION_EXIT_TYPE
+    return _fill_exit_types(df, default=CLOSED_POSITION_EXIT_TYPE)
+
+
+def _build_closed_positions_trades(df, leverage):
+    """
+    Monta a TradeTable a partir das posições fechadas já convertidas,
+    calculando nocional, margem e ROI em uma única passada vetorizada sobre as colunas.
+    """
+    qty, avg_entry_price, valor_nocional, margem = _closed_positions_margin(df, leverage)
+    avg_exit_price = _column_as_float(df, 'avgExitPrice')
+    pnl_net = _column_as_float(df, 'closedPnl')
+    fill_fee = _column_as_float(df, 'fillFee')
+
+    symbol = _column_as_object(df, 'symbol')
+    side = _column_as_object(df, 'side')
+
+    # ROI baseado na margem utilizada (PnL da API da Bybit já inclui taxas)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(margem > 0, (pnl_net / margem) * 100, 0.0)
+
+    # Duração e resultado (Lucro/Perda) são derivados pela TradeTable na leitura
+    return TradeTable.from_columns(
+        symbol=symbol,
+        position_side=np.where(side == 'Buy', 'Long', 'Short'),
+        entry_time=df['createdTime'],
+        exit_time=df['updatedTime'],
+        exit_type=_closed_positions_exit_types(df),
+        quantity=qty,
+        avg_entry_price=avg_entry_price,
+        exit_price=avg_exit_price,
+        valor_nocional=valor_nocional,
+        margem=margem,
+        pnl_net=pnl_net,
+        roi=roi,
+        fill_fee=fill_fee
+    )
+
+
+def symbol_aggregates_from_cube(cube):
+    """
+    Índice de agregados aditivos por (symbol, exit_type) a partir do cubo (ver cube.py): soma
+    de PnL, soma de margem, soma do valor nocional, número de trades vencedores e número de
+    trades. Como todas as colunas são somas, remover um símbolo é apenas subtrair as suas linhas.
+    A margem com outra alavancagem é o nocional dividido por ela (ver leverage_sweep.py).
+    """
+    return aggregate(cube, ['symbol', 'exit_type'])
+
+
+def build_symbol_aggregates(trades):
+    """
+    Índice de agregados por (symbol, exit_type) direto dos trades (TradeTable ou DataFrame
+    com as colunas de cube.build_cube).
+    """
+    return symbol_aggregates_from_cube(build_cube(trades))
+
+
+def _win_rate(win_count, trade_count):
+    return win_count / trade_count * 100
+
+
+def summarize_symbol_aggregates(symbol_aggregates, blacklist=None):
+    """
+    Calcula KPIs, ranking de ganhadores/perdedores e resumo por tipo de saída a partir
+    do índice de agregados, opcionalmente excluindo os símbolos da blacklist.
+    O custo é proporcional ao número de símbolos, não ao número de trades.
+    """
+    if blacklist:
+        symbols = symbol_aggregates.index.get_level_values('symbol')
+        symbol_aggregates = symbol_aggregates[~symbols.isin(list(blacklist))]
+
+    total_pnl = symbol_aggregates['total_pnl_net'].sum()
+    total_trades = int(symbol_aggregates['trade_count'].sum())
+    win_rate = (int(symbol_aggregates['win_count'].sum()) / total_trades) * 100 if total_trades > 0 else 0
+    total_margin_cost = symbol_aggregates['total_margin'].sum()
+    avg_roi = (total_pnl / total_margin_cost) * 100 if total_margin_cost > 0 else 0
+
+    kpis = {
+        'total_pnl': total_pnl,
+        'win_rate': win_rate,
+        'total_margin_cost': total_margin_cost,
+        'total_trades': total_trades,
+        'avg_roi': avg_roi
+    }
+
+    if total_trades == 0:
+        return {'kpis': kpis, 'winners_summary': [], 'losers_summary': [], 'exit_type_summary': []}
+
+    # Resumo por símbolo
+    symbol_summary = symbol_aggregates.groupby(level='symbol').sum()
+    symbol_summary['win_rate'] = _win_rate(symbol_summary['win_count'], symbol_summary['trade_count'])
+    symbol_summary = symbol_summary.reset_index()[['symbol', 'total_pnl_net', 'total_margin', 'win_rate', 'trade_count']]
+    symbol_summary['roi_agregado'] = (symbol_summary['total_pnl_net'] / symbol_summary['total_margin']) * 100
+
+    winners_summary = symbol_summary[symbol_summary['total_pnl_net'] >= 0].sort_values(by='total_pnl_net', ascending=False)
+    losers_summary = symbol_summary[symbol_summary['total_pnl_net'] < 0].sort_values(by='total_pnl_net', ascending=True)
+
+    # Resumo por tipo de saída
+    exit_type_summary = symbol_aggregates.groupby(level='exit_type').sum()
+    exit_type_summary['win_rate'] = _win_rate(exit_type_summary['win_count'], exit_type_summary['trade_count'])
+    exit_type_summary = exit_type_summary.reset_index().rename(columns={'trade_count': 'exit_count'})
+    exit_type_summary = exit_type_summary[['exit_type', 'total_pnl_net', 'total_margin', 'win_rate', 'exit_count']]
+    exit_type_summary['roi_agregado'] = (exit_type_summary['total_pnl_net'] / exit_type_summary['total_margin']) * 100
+    exit_type_summary = exit_type_summary.sort_values(by='total_pnl_net', ascending=False)
+
     return {
         'kpis': kpis,
         'winners_summary': winners_summary.to_dict('records') if not winners_summary.empty else [],
         'losers_summary': losers_summary.to_dict('records') if not losers_summary.empty else [],
         'exit_type_summary': exit_type_summary.to_dict('records') if not exit_type_summary.empty else [],
-        'all_trades': analysis_df.to_dict('records'),
+    }
+
+
+def sort_trades_by_symbol(trades):
+    """
+    Ordena a TradeTable por símbolo (de forma estável, preservando a ordem original
+    dentro de cada símbolo) e monta o índice de partições por símbolo.
+    Os códigos de símbolo já seguem a ordem alfabética das categorias.
+    :return: (tabela ordenada, {symbol: (linha_inicial, linha_final)})
+    """
+    codes = trades.codes('symbol')
+    symbols = trades.categories('symbol')
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(symbols))
+    stops = np.cumsum(counts)
+    starts = stops - counts
+    symbol_index = {symbol: (int(start), int(stop))
+                    for symbol, start, stop, count in zip(symbols, starts, stops, counts) if count}
+    return trades.take(order), symbol_index
+
+
+def process_closed_positions_data(closed_positions_df, leverage, account_balance=None, transactions_df=None):
+    """
+    Processa dados da API de posições fechadas da Bybit.
+    Esta função usa dados já processados pela Bybit para maior precisão.
+    O retorno traz 'all_trades' como TradeTable (uma linha por trade), ordenada por símbolo,
+    e 'symbol_index' com o intervalo de linhas de cada símbolo.
+    """
+    if closed_positions_df.empty:
+        return {
+            'kpis': {
+                'total_pnl': 0,
+                'win_rate': 0,
+                'total_margin_cost': 0,
+                'total_trades': 0,
+                'avg_roi': 0
+            },
+            'winners_summary': [],
+            'losers_summary': [],
+            'exit_type_summary': [],
+            'all_trades': TradeTable.empty(),
+            'symbol_index': {},
+            'symbol_aggregates': symbol_aggregates_from_cube(empty_cube()),
+            'cube': empty_cube(),
+            'time_series': empty_time_series(),
+            'raw_df': closed_positions_df,
+            'account_info': {},
+            'transactions_summary': {}
+        }
+    
+    with metrics.span('analysis.prepare'):
+        df = _prepare_closed_positions(closed_positions_df)
+    
+    # Calcular métricas adicionais (colunar, sem iterar linha a linha)
+    with metrics.span('analysis.trades'):
+        trades = _build_closed_positions_trades(df, leverage)
+
+        # Tabela de trades particionada por símbolo: /trades/<symbol> lê apenas a sua fatia
+        trades, symbol_index = sort_trades_by_symbol(trades)
+    
+    # Cubo por (símbolo, lado, tipo de saída, dia) em uma passada sobre os trades. O índice de
+    # agregados por (símbolo, tipo de saída) sai dele: KPIs e resumos vêm desse índice, e a
+    # simulação com blacklist só precisa filtrá-lo
+    with metrics.span('analysis.aggregates'):
+        cube = build_cube(trades)
+        symbol_aggregates = symbol_aggregates_from_cube(cube)
+    with metrics.span('analysis.summaries'):
+        summary = summarize_symbol_aggregates(symbol_aggregates)
+    # Curva de capital, drawdown e PnL por período, calculados uma vez e guardados com os resumos
+    with metrics.span('analysis.time_series'):
+        time_series = trades_time_series(trades)
+
+    with metrics.span('analysis.account'):
+        account_info = build_account_info(account_balance)
+        transactions_summary = build_transactions_summary(transactions_df)
+    
+    return {
+        **summary,
+        'all_trades': trades,
+        'symbol_index': symbol_index,
+        'symbol_aggregates': symbol_aggregates,
+        'cube': cube,
+        'time_series': time_series,
         'raw_df': df,
         'account_info': account_info,
         'transactions_summary': transactions_summary
     }
 
 
+class StreamingClosedPositionsAnalyzer:
+    """
+    Análise incremental de posições fechadas: cada página recebida da API é convertida
+    e somada ao cubo de agregados em execução (por símbolo, lado, tipo de saída e dia; ver
+    cube.py), e as linhas são descartadas em seguida. A memória fica limitada ao tamanho
+    da página e a análise acontece enquanto as outras janelas ainda estão sendo baixadas.
+    add_page() pode ser chamado de várias threads ao mesmo tempo.
+    """
+
+    def __init__(self, leverage):
+        self.leverage = leverage
+        self.pages_processed = 0
+        self.rows_processed = 0
+        self._cube = empty_cube()
+        self._lock = threading.Lock()
+
+    def add_page(self, positions):
+        """
+        Processa uma página de posições fechadas (lista de dicionários da API).
+        """
+        if not positions:
+            return
+        with metrics.span('analysis.streaming_page'):
+            df = _prepare_closed_positions(pd.DataFrame(positions))
+            _, _, valor_nocional, margem = _closed_positions_margin(df, self.leverage)
+            page_cube = build_cube(pd.DataFrame({
+                'symbol': _column_as_object(df, 'symbol'),
+                'position_side': np.where(_column_as_object(df, 'side') == 'Buy', 'Long', 'Short'),
+                'exit_type': _closed_positions_exit_types(df),
+                'exit_time': df['updatedTime'].to_numpy(dtype='datetime64[ms]'),
+                'pnl_net': _column_as_float(df, 'closedPnl'),
+                'margem': margem,
+                'valor_nocional': valor_nocional,
+            }))
+
+        with self._lock:
+            self._cube = add_cubes(self._cube, page_cube)
+            self.pages_processed += 1
+            self.rows_processed += len(df)
+
+    def result(self, account_balance=None, transactions_df=None):
+        """
+        Retorna o resultado no mesmo formato de process_closed_positions_data, sem a
+        tabela de trades (que não é mantida no modo streaming).
+        """
+        with self._lock:
+            cube = self._cube
+        symbol_aggregates = symbol_aggregates_from_cube(cube)
+        return {
+            **summarize_symbol_aggregates(symbol_aggregates),
+            'all_trades': TradeTable.empty(),
+            'symbol_index': {},
+            'symbol_aggregates': symbol_aggregates,
+            'cube': cube,
+            # Sem a ordem dos trades, curva e drawdown ficam na resolução diária
+            'time_series': time_series_from_daily(cube_daily(cube)),
+            'raw_df': pd.DataFrame(),
+            'account_info': build_account_info(account_balance),
+            'transactions_summary': build_transactions_summary(transactions_df),
+            'streaming': True
+        }
+
+
+# Quantidades são convertidas para inteiros (1e-8 de unidade) antes da soma acumulada,
+# para que a posição volte exatamente a zero sem erro de ponto flutuante
+_QTY_SCALE = 10**8
+
+
+def _fill_exit_types(df, default='Parcial'):
+    """
+    Versão vetorizada de get_exit_type para várias linhas de uma vez (execuções, ou posições
+    fechadas com os campos da ordem de fechamento). Além de stopOrderType e orderLinkId, o
+    createType da ordem identifica liquidações (CreateByLiq).
+    Os textos distintos são poucos, então apenas eles são classificados.
+    :param default: Tipo das linhas sem nenhuma das marcas.
+    """
+    def text_column(col):
+        return df[col].astype(str) if col in df.columns else pd.Series('', index=df.index)
+
+    codes, texts = pd.factorize(
+        text_column('stopOrderType') + ' ' + text_column('orderLinkId') + ' ' + text_column('createType'))
+    texts = pd.Series(texts, dtype=object)
+    classified = np.select(
+        [texts.str.contains('StopLoss', regex=False).to_numpy(dtype=bool),
+         texts.str.contains('TakeProfit', regex=False).to_numpy(dtype=bool),
+         texts.str.contains('TrailingStop', regex=False).to_numpy(dtype=bool),
+         texts.str.contains('CreateByLiq', regex=False).to_numpy(dtype=bool)],
+        ['StopLoss', 'TakeProfit', 'TrailingStop', 'Liquidation'],
+        default
+    ).astype(object)
+    return classified[codes]
+
+
+def _reconstruct_round_trips(df, leverage):
+    """
+    Reconstrói os trades (de posição zerada a posição zerada) a partir das execuções,
+    sem iterar linha a linha:
+    1. ordena as execuções por (símbolo, execTime) e calcula a posição acumulada com sinal;
+    2. divide as execuções que invertem a posição (ex: de +1 para -2) em uma parte que
+       zera a posição e outra que abre a nova;
+    3. cada segmento começa numa execução feita com a posição zerada e termina quando
+       ela volta a zero; segmentos ainda abertos no fim do período são ignorados;
+    4. somas por segmento (bincount) dão preço médio ponderado de entrada e de saída,
+       PnL pelo fluxo de caixa (aumentos e reduções parciais incluídos) e taxas.
+    :param df: Execuções já convertidas (execTime em datetime, campos numéricos em float).
+    :return: TradeTable com um trade por segmento fechado.
+    """
+    if df.empty:
+        return TradeTable.empty()
+
+    symbol_codes, symbols = pd.factorize(df['symbol'].to_numpy(dtype=object), sort=True)
+    exec_ms = df['execTime'].to_numpy(dtype='datetime64[ms]').astype('int64')
+    order = np.lexsort((exec_ms, symbol_codes))
+
+    sign = np.where(df['side'].to_numpy() == 'Buy', 1, -1)[order]
+    lots = np.rint(df['execQty'].to_numpy(dtype='float64')[order] * _QTY_SCALE).astype('int64') * sign
+    keep = lots != 0
+    order, lots = order[keep], lots[keep]
+    if len(order) == 0:
+        return TradeTable.empty()
+    symbol_codes, exec_ms = symbol_codes[order], exec_ms[order]
+    price = df['execPrice'].to_numpy(dtype='float64')[order]
+    fee = df['execFee'].to_numpy(dtype='float64')[order]
+
+    # Posição após cada execução, acumulada separadamente por símbolo
+    position = np.cumsum(lots)
+    symbol_starts = np.flatnonzero(np.r_[True, symbol_codes[1:] != symbol_codes[:-1]])
+    symbol_lengths = np.diff(np.r_[symbol_starts, len(lots)])
+    position -= np.repeat((position - lots)[symbol_starts], symbol_lengths)
+    previous = position - lots
+
+    # Execuções que atravessam o zero viram duas linhas: fechamento e abertura
+    crosses = np.sign(previous) * np.sign(position) < 0
+    rows = np.repeat(np.arange(len(lots)), np.where(crosses, 2, 1))
+    first_copy = np.r_[True, rows[1:] != rows[:-1]]
+    closing_part = crosses[rows] & first_copy
+    opening_part = crosses[rows] & ~first_copy
+
+    part_lots = np.where(closing_part, -previous[rows], np.where(opening_part, position[rows], lots[rows]))
+    part_position = np.where(closing_part, 0, position[rows])
+    part_fee = fee[rows] * (np.abs(part_lots) / np.abs(lots[rows]))
+
+    # Segmentos: cada um começa numa execução feita com a posição zerada
+    segment_starts = np.flatnonzero(part_position - part_lots == 0)
+    segment_ends = np.r_[segment_starts[1:] - 1, len(part_lots) - 1]
+    segment_id = np.cumsum(part_position - part_lots == 0) - 1
+    n_segments = len(segment_starts)
+
+    direction = np.sign(part_lots[segment_starts])
+    is_entry = np.sign(part_lots) == direction[segment_id]
+    quantity = np.abs(part_lots) / _QTY_SCALE
+    notional = quantity * price[rows]
+
+    def segment_sum(weights):
+        return np.bincount(segment_id, weights=weights, minlength=n_segments)
+
+    entry_qty = segment_sum(np.where(is_entry, quantity, 0.0))
+    entry_value = segment_sum(np.where(is_entry, notional, 0.0))
+    exit_qty = segment_sum(np.where(is_entry, 0.0, quantity))
+    exit_value = segment_sum(np.where(is_entry, 0.0, notional))
+    fees = segment_sum(part_fee)
+
+    closed = part_position[segment_ends] == 0
+    entry_qty, entry_value, exit_qty, exit_value, fees, direction = (
+        values[closed] for values in (entry_qty, entry_value, exit_qty, exit_value, fees, direction))
+    first, last = rows[segment_starts[closed]], rows[segment_ends[closed]]
+
+    avg_entry_price = entry_value / entry_qty
+    exit_price = exit_value / exit_qty
+    pnl_net = direction * (exit_value - entry_value) - fees
+    valor_nocional = entry_qty * avg_entry_price
+    margem = valor_nocional / leverage if leverage > 0 else valor_nocional.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(margem > 0, (pnl_net / margem) * 100, 0.0)
+
+    return TradeTable.from_columns(
+        symbol=np.asarray(symbols, dtype=object)[symbol_codes[first]],
+        position_side=np.where(direction > 0, 'Long', 'Short'),
+        entry_time=pd.Series(exec_ms[first]),
+        exit_time=pd.Series(exec_ms[last]),
+        exit_type=_fill_exit_types(df.iloc[order[last]]),
+        quantity=entry_qty,
+        avg_entry_price=avg_entry_price,
+        exit_price=exit_price,
+        valor_nocional=valor_nocional,
+        margem=margem,
+        pnl_net=pnl_net,
+        roi=roi,
+        fill_fee=fees
+    )
+
+
 def process_trades_data(raw_df, leverage, account_balance=None, transactions_df=None):
+    """
+    Processa execuções (get_executions) reconstruindo os trades de posição zerada a posição
+    zerada, com aumentos de posição, fechamentos parciais e inversões de lado.
+    O retorno tem o mesmo formato de process_closed_positions_data.
+    """
     df = raw_df.copy()
     
     # Corrigir conversão de timestamp
     df['execTime'] = pd.to_numeric(df['execTime'], errors='coerce')
     df['execTime'] = pd.to_datetime(df['execTime'], unit='ms')
-    df = df.sort_values(by='execTime').reset_index(drop=True)
     
     numeric_cols = ['execFee', 'execQty', 'execPrice', 'orderQty', 'orderPrice']
     for col in numeric_cols:
         df[col] = pd.to_numeric(df[col], errors='coerce')
-    df = df.dropna(subset=numeric_cols)
-
-    trades = []
-    open_positions = {}
+    df = df.dropna(subset=numeric_cols + ['execTime'])
 
-    for index, row in df.iterrows():
-        symbol = row['symbol']
-        side = row['side']
-        qty = row['execQty']
-        price = row['execPrice']
-        fee = row['execFee']
-        exec_time = row['execTime']
-
-        if symbol not in open_positions:
-            open_positions[symbol] = {'qty': 0, 'cost': 0, 'entry_time': None, 'entry_price': 0, 'entry_fee': 0}
-
-        is_new_position = open_positions[symbol]['qty'] == 0
-        
-        if is_new_position:
-            open_positions[symbol] = {
-                'qty': qty if side == 'Buy' else -qty,
-                'cost': qty * price,
-                'entry_time': exec_time,
-                'entry_price': price,
-                'entry_fee': fee
-            }
-        else:
-            current_qty = open_positions[symbol]['qty']
-            is_closing_long = side == 'Sell' and current_qty > 0
-            is_closing_short = side == 'Buy' and current_qty < 0
-
-            if is_closing_long or is_closing_short:
-                entry_qty = open_positions[symbol]['qty']
-                avg_entry_price = open_positions[symbol]['entry_price']
-                
-                pnl = (price - avg_entry_price) * entry_qty if is_closing_long else (avg_entry_price - price) * abs(entry_qty)
-                pnl_net = pnl - open_positions[symbol]['entry_fee'] - fee
-                
-                valor_nocional = abs(entry_qty * avg_entry_price)
-                margem = valor_nocional / leverage if leverage > 0 else valor_nocional
-                
-                roi = (pnl_net / margem) * 100 if margem > 0 else 0
-
-                exit_type = get_exit_type(row)
-
-                trades.append({
-                    'symbol': symbol, 'position_side': 'Long' if entry_qty > 0 else 'Short',
-                    'entry_time': open_positions[symbol]['entry_time'], 'exit_time': exec_time,
-                    'duration': exec_time - open_positions[symbol]['entry_time'],
-                    'quantity': abs(entry_qty), 'avg_entry_price': avg_entry_price,
-                    'exit_price': price, 'valor_nocional': valor_nocional,
-                    'margem': margem, 'pnl_net': pnl_net, 'roi': roi,
-                    'result': 'Lucro' if pnl_net > 0 else 'Perda', 'exit_type': exit_type
-                })
-                open_positions.pop(symbol, None)
-
-    analysis_df = pd.DataFrame(trades)
-    if not trades:
-        analysis_df = pd.DataFrame(columns=['pnl_net', 'result', 'roi', 'symbol', 'exit_type', 'margem'])
-    else:
-        analysis_df['duration'] = analysis_df['duration'].astype(str).str.replace('0 days ', '')
-
-    pnl_de_trades = analysis_df['pnl_net'].sum()
-    total_trades = len(analysis_df)
-    winning_trades = analysis_df[analysis_df['pnl_net'] > 0]
-    win_rate = (len(winning_trades) / total_trades) * 100 if total_trades > 0 else 0
-    total_margin_cost = analysis_df['margem'].sum()
-    
-    kpis = {
-        'total_pnl': pnl_de_trades, 
-        'win_rate': win_rate,
-        'total_margin_cost': total_margin_cost,
-        'total_trades': total_trades
-    }
-
-    if not analysis_df.empty:
-        symbol_summary = analysis_df.groupby('symbol').agg(
-            total_pnl_net=('pnl_net', 'sum'),
-            total_margin=('margem', 'sum'),
-            win_rate=('result', lambda x: (x == 'Lucro').sum() / x.count() * 100),
-            trade_count=('symbol', 'count')
-        ).reset_index()
-        symbol_summary['roi_agregado'] = (symbol_summary['total_pnl_net'] / symbol_summary['total_margin']) * 100
-        
-        kpis['avg_roi'] = (analysis_df['pnl_net'].sum() / analysis_df['margem'].sum()) * 100 if analysis_df['margem'].sum() > 0 else 0
-
-        winners_summary = symbol_summary[symbol_summary['total_pnl_net'] >= 0].sort_values(by='total_pnl_net', ascending=False)
-        losers_summary = symbol_summary[symbol_summary['total_pnl_net'] < 0].sort_values(by='total_pnl_net', ascending=True)
-
-        exit_type_summary = analysis_df.groupby('exit_type').agg(
-            total_pnl_net=('pnl_net', 'sum'),
-            total_margin=('margem', 'sum'),
-            win_rate=('result', lambda x: (x == 'Lucro').sum() / x.count() * 100),
-            exit_count=('exit_type', 'count')
-        ).reset_index()
-        exit_type_summary['roi_agregado'] = (exit_type_summary['total_pnl_net'] / exit_type_summary['total_margin']) * 100
-        exit_type_summary = exit_type_summary.sort_values(by='total_pnl_net', ascending=False)
-    else:
-        kpis['avg_roi'] = 0
-        winners_summary = pd.DataFrame()
-        losers_summary = pd.DataFrame()
-        exit_type_summary = pd.DataFrame()
-
-    # Processar informações da conta
-    account_info = {}
-    if account_balance:
-        account_info = {
-            'balances': account_balance,
-            'total_balance_usdt': account_balance.get('USDT', {}).get('wallet_balance', 0),
-            'total_unrealized_pnl': sum([
-                balance.get('unrealized_pnl', 0) for coin, balance in account_balance.items()
-            ])
-        }
-    
-    # Processar transações (sem transferências internas por limitação da API)
-    transactions_summary = {}
-    if transactions_df is not None and not transactions_df.empty:
-        # Separar por tipo
-        deposits = transactions_df[transactions_df['type'] == 'Depósito']
-        withdrawals = transactions_df[transactions_df['type'] == 'Retirada']
-        
-        transactions_summary = {
-            'total_deposits': deposits['amount'].sum() if not deposits.empty else 0,
-            'total_withdrawals': withdrawals['amount'].sum() if not withdrawals.empty else 0,
-            'total_transfers_in': 0,  # Não disponível na API pública
-            'total_transfers_out': 0,  # Não disponível na API pública
-            'deposits_count': len(deposits),
-            'withdrawals_count': len(withdrawals),
-            'transfers_in_count': 0,
-            'transfers_out_count': 0,
-            'net_flow': (
-                (deposits['amount'].sum() if not deposits.empty else 0) -
-                (withdrawals['amount'].sum() if not withdrawals.empty else 0)
-            ),
-            'transactions_detail': transactions_df.to_dict('records') if not transactions_df.empty else []
-        }
+    with metrics.span('analysis.round_trips'):
+        trades, symbol_index = sort_trades_by_symbol(_reconstruct_round_trips(df, leverage))
+    with metrics.span('analysis.aggregates'):
+        cube = build_cube(trades)
+        symbol_aggregates = symbol_aggregates_from_cube(cube)
+    with metrics.span('analysis.time_series'):
+        time_series = trades_time_series(trades)
 
     return {
-        'kpis': kpis,
-        'winners_summary': winners_summary.to_dict('records') if not winners_summary.empty else [],
-        'losers_summary': losers_summary.to_dict('records') if not losers_summary.empty else [],
-        'exit_type_summary': exit_type_summary.to_dict('records') if not exit_type_summary.empty else [],
-        'all_trades': analysis_df.to_dict('records'),
+        **summarize_symbol_aggregates(symbol_aggregates),
+        'all_trades': trades,
+        'symbol_index': symbol_index,
+        'symbol_aggregates': symbol_aggregates,
+        'cube': cube,
+        'time_series': time_series,
         'raw_df': raw_df,
-        'account_info': account_info,
-        'transactions_summary': transactions_summary
+        'account_info': build_account_info(account_balance),
+        'transactions_summary': build_transactions_summary(transactions_df)
     }
@@ -1,13 +1,26 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from flask_session import Session
+import math
 import os
 import shutil
 from datetime import datetime, timedelta
 import pandas as pd
 
 # Meus módulos - APENAS MUDANÇA: usar API de posições fechadas
-from bybit_client import fetch_closed_positions, fetch_account_balance, fetch_account_transactions
-from analysis import process_closed_positions_data
+from fetch_orchestrator import fetch_analysis_inputs
+from analysis import process_closed_positions_data, summarize_symbol_aggregates, StreamingClosedPositionsAnalyzer
+from bybit_client import get_session
+from position_cache import ClosedPositionCache, account_id, sync_closed_positions
+from result_cache import SharedResultCache, is_shared_result, new_shared_result_id, result_cache_key
+from result_store import ResultStore
+from trade_table import TradeTable
+from jobs import JobError, JobManager
+import metrics
+from batch import analyze_accounts, batch_summary
+from cube import DIMENSIONS as CUBE_DIMENSIONS, roll_up
+from leverage_sweep import MAX_LEVERAGES, sweep_leverage
+from optimizer import METHODS, OBJECTIVES, optimize_blacklist
+from data_api import RESULT_TABLES, SEARCH_COLUMNS, TRADE_COLUMNS, parse_table_query, query_records, query_trades, table_payload
 
 # --- CONFIGURAÇÃO INICIAL ---
 app = Flask(__name__)
@@ -20,108 +33,278 @@ if os.path.exists(app.config["SESSION_FILE_DIR"]):
     shutil.rmtree(app.config["SESSION_FILE_DIR"])
 os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
 
+# Resultados de análise ficam fora da sessão; a sessão guarda apenas o handle
+result_store = ResultStore()
+job_manager = JobManager()
+# Resultados reaproveitados entre sessões e workers para a mesma conta, período e alavancagem
+result_cache = SharedResultCache(result_store)
+closed_position_cache = ClosedPositionCache()
+
+def release_result(result_id):
+    """
+    Apaga o resultado de uma sessão; um compartilhado só é apagado quando nenhuma outra
+    sessão o exibe e ele não está mais no índice do cache.
+    """
+    if is_shared_result(result_id):
+        result_cache.detach(result_id, session.sid)
+    else:
+        result_store.delete(result_id)
+
+def load_analysis_results():
+    """
+    Carrega do ResultStore o resultado da análise referenciado pela sessão.
+    :return: O resultado, ou None se não houver análise ou se ela tiver expirado.
+    """
+    if not session.get('analysis_done'):
+        return None
+    return result_store.get(session.get('result_id'))
+
 # --- ROTAS DA APLICAÇÃO ---
 
 @app.route('/', methods=['GET'])
 def index():
     return render_template('dashboard.html')
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    form_data = request.form.to_dict()
-    session['form_data'] = form_data
-    
+def run_analysis(form_data, progress):
+    """
+    Busca e analisa os dados da conta (executada em segundo plano pelo JobManager).
+    Os spans e contadores da análise (ver metrics.py) são anexados ao resultado em 'metrics'.
+    :return: Handle do resultado no ResultStore.
+    """
+    analysis_metrics = metrics.AnalysisMetrics()
     try:
-        # APENAS MUDANÇA: usar fetch_closed_positions em vez de fetch_all_trades
-        raw_df = fetch_closed_positions(
+        with metrics.recording(analysis_metrics):
+            result_id = _run_analysis(form_data, progress, analysis_metrics)
+        metrics.count('bybit_analyses_total', status='success')
+        return result_id
+
+    except JobError:
+        metrics.count('bybit_analyses_total', status='empty')
+        raise
+    except Exception as e:
+        metrics.count('bybit_analyses_total', status='error')
+        raise JobError(f'Erro ao processar a solicitação: {e}') from e
+
+def _run_analysis(form_data, progress, analysis_metrics):
+    """
+    Corpo de run_analysis, executado com `analysis_metrics` ativo.
+    """
+    leverage = float(form_data.get('leverage', 10))
+    progress.set_stage('fetching')
+
+    if form_data.get('streaming'):
+        # Modo streaming: cada página é analisada assim que chega, sem guardar as linhas
+        analyzer = StreamingClosedPositionsAnalyzer(leverage)
+        inputs = fetch_analysis_inputs(
             form_data['api_key'], 
             form_data['api_secret'],
             form_data['start_date'], 
-            form_data['end_date']
+            form_data['end_date'],
+            on_page=analyzer.add_page,
+            progress=progress
         )
+        if analyzer.rows_processed == 0:
+            raise JobError('Nenhuma posição fechada encontrada no período especificado.')
+        progress.set_stage('analyzing')
+        analysis_results = analyzer.result(inputs['account_balance'], inputs['transactions_df'])
+    else:
+        # Só a cauda ainda não sincronizada é buscada; a versão dos dados lida depois dela
+        # já inclui posições novas, que invalidam o resultado de outra sessão
+        account = account_id(form_data['api_key'])
+        session = get_session(form_data['api_key'], form_data['api_secret'])
+        with metrics.span('fetch.closed_positions_sync'):
+            state = sync_closed_positions(form_data['api_key'], form_data['api_secret'], form_data['start_date'],
+                                          form_data['end_date'], cache=closed_position_cache, session=session,
+                                          progress=progress)
+        data_version = state['data_version']
+
+        # Mesma conta, período, alavancagem e versão dos dados: reaproveita o resultado de outra sessão
+        cached_id = result_cache.get(_result_cache_key(form_data, leverage, data_version))
+        if cached_id is not None:
+            metrics.count('bybit_result_cache_total', outcome='hit')
+            return cached_id
+        metrics.count('bybit_result_cache_total', outcome='miss')
+
+        # Posições fechadas (já sincronizadas, lidas do cache local), saldo e movimentações em paralelo
+        inputs = fetch_analysis_inputs(
+            form_data['api_key'], 
+            form_data['api_secret'],
+            form_data['start_date'], 
+            form_data['end_date'],
+            session=session,
+            progress=progress,
+            closed_synced=True
+        )
+        raw_df = inputs['closed_positions']
         
         if raw_df.empty:
-            return jsonify({'status': 'error', 'message': 'Nenhuma posição fechada encontrada no período especificado.'})
-
-        # Buscar saldo da conta
-        try:
-            account_balance = fetch_account_balance(form_data['api_key'], form_data['api_secret'])
-        except Exception as e:
-            print(f"Aviso: Não foi possível buscar saldo da conta: {e}")
-            account_balance = None
-
-        # Buscar movimentações
-        try:
-            transactions_df = fetch_account_transactions(
-                form_data['api_key'], 
-                form_data['api_secret'],
-                form_data['start_date'], 
-                form_data['end_date']
-            )
-        except Exception as e:
-            print(f"Aviso: Não foi possível buscar movimentações: {e}")
-            transactions_df = None
+            raise JobError('Nenhuma posição fechada encontrada no período especificado.')
 
+        progress.set_stage('analyzing')
         # APENAS MUDANÇA: usar process_closed_positions_data em vez de process_trades_data
         analysis_results = process_closed_positions_data(
             raw_df, 
-            float(form_data.get('leverage', 10)),
-            account_balance,
-            transactions_df
+            leverage,
+            inputs['account_balance'],
+            inputs['transactions_df']
         )
-        
-        session['analysis_results'] = analysis_results
+    analysis_results['fetch_timings'] = inputs['timings']
+    # As posições brutas não são usadas depois da análise; só a TradeTable é armazenada
+    analysis_results.pop('raw_df', None)
+    analysis_results['metrics'] = analysis_metrics.to_dict()
+    if form_data.get('streaming'):
+        with metrics.span('store.put'):
+            return result_store.put(analysis_results)
+
+    with metrics.span('store.put'):
+        result_id = result_store.put(analysis_results, new_shared_result_id())
+        result_cache.put(_result_cache_key(form_data, leverage, data_version), account, data_version, result_id)
+    return result_id
+
+def _result_cache_key(form_data, leverage, data_version):
+    return result_cache_key(form_data['api_key'], form_data['api_secret'], form_data['start_date'],
+                            form_data['end_date'], leverage, data_version)
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    # Uma análise por sessão: enquanto a anterior estiver na fila ou em execução, o navegador
+    # volta a acompanhá-la (um job abandonado ocuparia o pool e deixaria um resultado órfão)
+    current = job_manager.status(session.get('job_id'))
+    if current is not None and current['status'] in ('queued', 'running'):
+        return jsonify({'status': 'queued', 'job_id': current['job_id'],
+                        'message': 'Já existe uma análise em andamento nesta sessão.'})
+
+    form_data = request.form.to_dict()
+    session['form_data'] = form_data
+
+    # A análise roda em segundo plano; o navegador acompanha por /analyze/status/<job_id>
+    job_manager.delete(session.get('job_id'))
+    job_id = job_manager.submit(run_analysis, form_data)
+    session['job_id'] = job_id
+
+    return jsonify({'status': 'queued', 'job_id': job_id})
+
+@app.route('/analyze/status/<job_id>', methods=['GET'])
+def analyze_status(job_id):
+    job = job_manager.status(job_id) if job_id == session.get('job_id') else None
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Análise não encontrada.'}), 404
+
+    if job['status'] == 'error':
+        return jsonify({'status': 'error', 'message': job.get('message')})
+    if job['status'] != 'done':
+        return jsonify({'status': job['status'], 'progress': job['progress']})
+
+    # Primeira consulta após a conclusão: a sessão passa a apontar para o novo resultado
+    if session.get('result_id') != job['result']:
+        release_result(session.get('result_id'))
+        session['result_id'] = job['result']
+        if is_shared_result(job['result']):
+            result_cache.attach(job['result'], session.sid)
         session['analysis_done'] = True
         session['blacklist'] = []
         session['is_simulation'] = False
 
-        return jsonify({
-            'status': 'success',
-            'template': render_template('partials/results.html', **analysis_results, form_data=form_data, blacklist=[], is_simulation=False)
-        })
+    analysis_results = load_analysis_results()
+    if analysis_results is None:
+        return jsonify({'status': 'error', 'message': 'O resultado da análise expirou. Analise novamente.'})
 
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': f'Erro ao processar a solicitação: {e}'})
+    with metrics.span('render.results'):
+        template = render_template('partials/results.html', **analysis_results, side_summary=side_summary(analysis_results), form_data=session['form_data'], blacklist=session.get('blacklist', []), is_simulation=False)
+
+    return jsonify({
+        'status': 'success',
+        'template': template,
+        'timings': analysis_results.get('fetch_timings'),
+        'metrics': analysis_results.get('metrics'),
+        'progress': job['progress']
+    })
+
+def side_summary(results, blacklist=None):
+    """
+    Resumo Long x Short (aba "Long x Short"), somado a partir do cubo de agregados.
+    """
+    cube = results.get('cube')
+    if cube is None or cube.empty:
+        return []
+    return roll_up(cube, ['position_side'], blacklist=blacklist).to_dict('records')
+
+def run_batch_analysis(accounts, start_date, end_date, leverage, progress):
+    """
+    Analisa várias contas em lote (executada em segundo plano pelo JobManager).
+    :return: Resumo serializável (KPIs por conta e consolidados).
+    """
+    progress.set_stage('fetching')
+    return batch_summary(analyze_accounts(accounts, start_date, end_date, leverage, progress=progress))
+
+@app.route('/batch_analyze', methods=['POST'])
+def batch_analyze():
+    data = request.get_json(silent=True) or {}
+    accounts = data.get('accounts') or []
+    if not accounts or not all(account.get('api_key') and account.get('api_secret') for account in accounts):
+        return jsonify({'status': 'error', 'message': 'Informe a lista de contas com api_key e api_secret.'}), 400
+    if not data.get('start_date') or not data.get('end_date'):
+        return jsonify({'status': 'error', 'message': 'Informe start_date e end_date.'}), 400
+
+    job_id = job_manager.submit(run_batch_analysis, accounts, data['start_date'], data['end_date'],
+                                float(data.get('leverage', 10)))
+    session['batch_job_id'] = job_id
+    return jsonify({'status': 'queued', 'job_id': job_id})
+
+@app.route('/batch_analyze/status/<job_id>', methods=['GET'])
+def batch_analyze_status(job_id):
+    job = job_manager.status(job_id) if job_id == session.get('batch_job_id') else None
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Análise em lote não encontrada.'}), 404
+
+    if job['status'] == 'error':
+        return jsonify({'status': 'error', 'message': job.get('message')})
+    if job['status'] != 'done':
+        return jsonify({'status': job['status'], 'progress': job['progress']})
+    return jsonify({'status': 'success', **job['result']})
 
 @app.route('/recalculate', methods=['POST'])
 def recalculate():
-    if not session.get('analysis_done'):
+    original_results = load_analysis_results()
+    if original_results is None:
         return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'})
 
-    original_results = session['analysis_results']
     blacklist = session.get('blacklist', [])
     
-    filtered_df = original_results['raw_df'][~original_results['raw_df']['symbol'].isin(blacklist)]
+    # Subtrai os símbolos da blacklist do índice de agregados (O(símbolos), sem reprocessar os trades)
+    with metrics.span('analysis.recalculate'):
+        recalculated_results = summarize_symbol_aggregates(original_results['symbol_aggregates'], blacklist)
     
-    if filtered_df.empty:
+    if recalculated_results['kpis']['total_trades'] == 0:
         return jsonify({'status': 'error', 'message': 'Nenhum trade restante após aplicar a blacklist.'})
 
-    # APENAS MUDANÇA: usar process_closed_positions_data
-    recalculated_results = process_closed_positions_data(
-        filtered_df, 
-        float(session['form_data'].get('leverage', 10)),
-        original_results.get('account_info'),
-        original_results.get('transactions_summary')
-    )
+    recalculated_results['account_info'] = original_results.get('account_info')
+    recalculated_results['transactions_summary'] = original_results.get('transactions_summary')
     
     session['is_simulation'] = True
+    # As linhas das tabelas são servidas por /api/results com a blacklist usada neste recálculo
+    session['simulation_blacklist'] = list(blacklist)
 
+    with metrics.span('render.results'):
+        template = render_template('partials/results.html', **recalculated_results, side_summary=side_summary(original_results, blacklist), form_data=session['form_data'], blacklist=blacklist, is_simulation=True)
     return jsonify({
         'status': 'success',
-        'template': render_template('partials/results.html', **recalculated_results, form_data=session['form_data'], blacklist=blacklist, is_simulation=True)
+        'template': template
     })
 
 @app.route('/restore', methods=['POST'])
 def restore():
-    if not session.get('analysis_done'):
+    original_results = load_analysis_results()
+    if original_results is None:
         return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'})
 
-    original_results = session['analysis_results']
     session['is_simulation'] = False
 
+    with metrics.span('render.results'):
+        template = render_template('partials/results.html', **original_results, side_summary=side_summary(original_results), form_data=session['form_data'], blacklist=session.get('blacklist', []), is_simulation=False)
     return jsonify({
         'status': 'success',
-        'template': render_template('partials/results.html', **original_results, form_data=session['form_data'], blacklist=session.get('blacklist', []), is_simulation=False)
+        'template': template
     })
 
 @app.route('/ban/<symbol>', methods=['POST'])
@@ -209,16 +392,158 @@ def unban_all():
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Erro ao processar solicitação: {str(e)}'})
 
+# Trades por página no detalhe de um par
+TRADES_PER_PAGE = 500
+
 @app.route('/trades/<symbol>')
 def trade_details(symbol):
-    if not session.get('analysis_done'):
+    if load_analysis_results() is None:
         return redirect(url_for('index'))
-    analysis_data = session.get('analysis_results')
-    trades = [trade for trade in analysis_data['all_trades'] if trade['symbol'] == symbol]
-    return render_template('trades_detail.html', trades=trades, symbol=symbol)
+
+    # Apenas a estrutura da página; as linhas são carregadas aos poucos de /api/trades/<symbol>
+    per_page = min(max(request.args.get('per_page', TRADES_PER_PAGE, type=int), 1), 5000)
+    page = max(request.args.get('page', 1, type=int), 1)
+    with metrics.span('render.trades'):
+        return render_template('trades_detail.html', symbol=symbol, page=page, per_page=per_page)
+
+@app.route('/api/results/<table>')
+def results_table_api(table):
+    """
+    Página de uma tabela de resultados (winners, losers, exit_types ou transactions), com
+    paginação, ordenação e busca no servidor (ver data_api.py). Em modo de simulação, os
+    rankings refletem a blacklist do último recálculo.
+    """
+    if table not in RESULT_TABLES:
+        return jsonify({'status': 'error', 'message': f'Tabela desconhecida: {table}'}), 404
+    results = load_analysis_results()
+    if results is None:
+        return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'}), 404
+
+    key, columns, default_sort, default_descending = RESULT_TABLES[table]
+    if table == 'transactions':
+        records = (results.get('transactions_summary') or {}).get('transactions_detail') or []
+    else:
+        if session.get('is_simulation'):
+            with metrics.span('analysis.recalculate'):
+                results = summarize_symbol_aggregates(results['symbol_aggregates'], session.get('simulation_blacklist', []))
+        records = results[key]
+
+    query = parse_table_query(request.args, columns, default_sort=default_sort, default_descending=default_descending)
+    with metrics.span('api.results_table'):
+        payload = table_payload(query, *query_records(records, columns, query, SEARCH_COLUMNS[table]))
+    return jsonify(payload)
+
+@app.route('/api/trades/<symbol>')
+def trades_api(symbol):
+    """
+    Página dos trades de um par, lida da partição do símbolo no ResultStore.
+    """
+    if load_analysis_results() is None:
+        return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'}), 404
+
+    with metrics.span('store.get_partition'):
+        symbol_trades = result_store.get_partition(session.get('result_id'), 'all_trades', symbol)
+    if symbol_trades is None:
+        symbol_trades = TradeTable.empty()
+
+    query = parse_table_query(request.args, TRADE_COLUMNS, default_length=TRADES_PER_PAGE)
+    with metrics.span('api.trades'):
+        payload = table_payload(query, *query_trades(symbol_trades, query))
+    return jsonify(payload)
+
+@app.route('/api/cube')
+def cube_api():
+    """
+    Recorte do cubo de agregados da análise atual, sem voltar aos trades. Parâmetros:
+    by=symbol,position_side (dimensões: symbol, position_side, exit_type, period),
+    period=daily|weekly|monthly e filtros por dimensão (ex: symbol=BTCUSDT,ETHUSDT; exit_type=StopLoss).
+    Em modo de simulação, os símbolos da blacklist do último recálculo ficam de fora.
+    """
+    results = load_analysis_results()
+    if results is None:
+        return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'}), 404
+    if results.get('cube') is None:
+        return jsonify({'status': 'error', 'message': 'O resultado não tem o cubo de agregados. Analise novamente.'}), 404
+
+    by = [dimension for dimension in request.args.get('by', '').split(',') if dimension]
+    period = request.args.get('period', 'daily')
+    filters = {dimension: request.args[dimension].split(',')
+               for dimension in CUBE_DIMENSIONS if dimension != 'day' and request.args.get(dimension)}
+    blacklist = session.get('simulation_blacklist', []) if session.get('is_simulation') else []
+    try:
+        with metrics.span('analysis.cube'):
+            rolled = roll_up(results['cube'], by, period, filters, blacklist)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'by': by, 'period': period, 'data': rolled.to_dict('records')})
+
+@app.route('/api/leverage_sweep', methods=['POST'])
+def leverage_sweep_api():
+    """
+    KPIs e ROI por símbolo para várias alavancagens, a partir dos agregados da análise atual
+    (sem nova busca). Corpo JSON: {"leverages": [1, 5, 10], "overrides": {"BTCUSDT": 20}}.
+    Em modo de simulação, os símbolos da blacklist do último recálculo ficam de fora.
+    """
+    results = load_analysis_results()
+    if results is None:
+        return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        leverages = [float(leverage) for leverage in data.get('leverages') or []]
+        overrides = {str(symbol): float(leverage) for symbol, leverage in (data.get('overrides') or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'status': 'error', 'message': 'Alavancagens devem ser números.'}), 400
+    if not leverages or len(leverages) > MAX_LEVERAGES:
+        return jsonify({'status': 'error', 'message': f'Informe de 1 a {MAX_LEVERAGES} alavancagens.'}), 400
+    # float() aceita 'nan' e 'inf', que passariam pela comparação e gerariam JSON inválido
+    if not all(math.isfinite(leverage) and leverage > 0 for leverage in leverages + list(overrides.values())):
+        return jsonify({'status': 'error', 'message': 'As alavancagens devem ser números finitos maiores que zero.'}), 400
+
+    blacklist = session.get('simulation_blacklist', []) if session.get('is_simulation') else []
+    with metrics.span('analysis.leverage_sweep'):
+        sweep = sweep_leverage(results['symbol_aggregates'], leverages, overrides, blacklist)
+    return jsonify({'status': 'success', **sweep})
+
+@app.route('/api/optimize_blacklist', methods=['POST'])
+def optimize_blacklist_api():
+    """
+    Sugere os símbolos cuja remoção maximiza o PnL total ou o ROI agregado, a partir dos
+    agregados da análise atual. Corpo JSON: {"objective": "roi", "min_trades": 500,
+    "max_symbols": 10, "method": "auto"}. Em modo de simulação, a busca parte da blacklist
+    do último recálculo e sugere símbolos adicionais.
+    """
+    results = load_analysis_results()
+    if results is None:
+        return jsonify({'status': 'error', 'message': 'Nenhuma análise encontrada na sessão.'}), 404
+
+    data = request.get_json(silent=True) or {}
+    objective = data.get('objective', 'pnl')
+    method = data.get('method', 'auto')
+    if objective not in OBJECTIVES or method not in METHODS:
+        return jsonify({'status': 'error', 'message': f'Objetivo deve ser {OBJECTIVES} e método {METHODS}.'}), 400
+    try:
+        min_trades = int(data.get('min_trades') or 0)
+        max_symbols = None if data.get('max_symbols') is None else int(data['max_symbols'])
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'min_trades e max_symbols devem ser inteiros.'}), 400
+    if min_trades < 0 or (max_symbols is not None and max_symbols < 0):
+        return jsonify({'status': 'error', 'message': 'min_trades e max_symbols não podem ser negativos.'}), 400
+
+    banned = session.get('simulation_blacklist', []) if session.get('is_simulation') else []
+    with metrics.span('analysis.optimize_blacklist'):
+        optimized = optimize_blacklist(results['symbol_aggregates'], objective, banned, min_trades, max_symbols, method)
+    return jsonify({'status': 'success', **optimized})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Contadores e histogramas do processo no formato texto do Prometheus
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/logout')
 def logout():
+    release_result(session.get('result_id'))
+    job_manager.delete(session.get('job_id'))
     session.clear()
     return redirect(url_for('index'))
 
@@ -0,0 +1,198 @@
+# batch.py
+"""
+Análise em lote de várias contas (ex: subcontas da mesa) no mesmo período.
+
+Uso:
+    python batch.py --accounts contas.json --start 2024-01-01 --end 2024-03-31 [--leverage 10] [--output lote.json]
+
+O arquivo de contas é uma lista JSON de objetos {"name", "api_key", "api_secret"}.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from analysis import (build_symbol_aggregates, process_closed_positions_data,
+                      summarize_symbol_aggregates)
+from fetch_orchestrator import fetch_analysis_inputs
+from trade_table import TradeTable
+
+# Contas buscadas ao mesmo tempo. Os limites da Bybit são por UID (cada subconta tem os seus),
+# mas há também um limite por IP de 600 requisições a cada 5s, que todas as contas dividem
+# (bybit_client.BYBIT_IP_RATE_LIMIT); mais contas em paralelo não aumentariam a vazão.
+MAX_CONCURRENT_ACCOUNTS = 4
+
+# Processos de análise; padrão: um por núcleo
+MAX_ANALYSIS_PROCESSES = int(os.environ.get('BYBIT_BATCH_PROCESSES', os.cpu_count() or 1))
+
+
+def _analyze_account(closed_positions, leverage, account_balance, transactions_df):
+    """
+    Executada nos processos do pool: roda a análise de uma conta.
+    As posições brutas não voltam ao processo principal.
+    """
+    result = process_closed_positions_data(closed_positions, leverage, account_balance, transactions_df)
+    result.pop('raw_df', None)
+    return result
+
+
+def _fetch_account(account, start_date_str, end_date_str, progress):
+    return fetch_analysis_inputs(account['api_key'], account['api_secret'], start_date_str, end_date_str,
+                                 progress=progress)
+
+
+def consolidate_results(results):
+    """
+    Consolida os resultados de várias contas somando os índices de agregados por
+    (symbol, exit_type); KPIs e rankings são recalculados sobre a soma.
+    """
+    aggregates = [result['symbol_aggregates'] for result in results if result is not None]
+    if aggregates:
+        total = pd.concat(aggregates).groupby(level=['symbol', 'exit_type'], sort=True).sum()
+    else:
+        total = build_symbol_aggregates(TradeTable.empty())
+
+    consolidated = summarize_symbol_aggregates(total)
+    consolidated['total_balance_usdt'] = sum(
+        result['account_info'].get('total_balance_usdt', 0) for result in results
+        if result is not None and result.get('account_info'))
+    consolidated['net_flow'] = sum(
+        result['transactions_summary'].get('net_flow', 0) for result in results
+        if result is not None and result.get('transactions_summary'))
+    return consolidated
+
+
+def analyze_accounts(accounts, start_date_str, end_date_str, leverage=10, max_processes=None,
+                     max_concurrent_accounts=MAX_CONCURRENT_ACCOUNTS, progress=None):
+    """
+    Busca as contas em paralelo (threads, I/O) e analisa cada uma em um pool de processos
+    (CPU) assim que a sua busca termina.
+    :param accounts: Lista de dicionários com name, api_key e api_secret.
+    :param max_processes: Tamanho do pool de análise. 0 analisa no próprio processo.
+    :param progress: Acompanhamento opcional da busca (ver jobs.JobProgress), somado entre as contas.
+    :return: {'accounts': [{name, kpis, result, timings, error}], 'consolidated': {...}}
+             Em cada conta, 'result' é o resultado completo de process_closed_positions_data
+             (sem raw_df), ou None se a conta falhou.
+    """
+    if max_processes is None:
+        max_processes = MAX_ANALYSIS_PROCESSES
+    max_processes = min(max_processes, len(accounts))
+
+    entries = [{'name': account.get('name') or f"conta {position + 1}", 'kpis': None, 'result': None,
+                'timings': {}, 'error': None} for position, account in enumerate(accounts)]
+
+    # spawn: os processos não herdam threads nem locks das threads de busca (nem do gunicorn)
+    pool = (ProcessPoolExecutor(max_workers=max_processes, mp_context=multiprocessing.get_context('spawn'))
+            if max_processes > 0 else None)
+    try:
+        analyses = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_accounts)) as fetchers:
+            fetches = {fetchers.submit(_fetch_account, account, start_date_str, end_date_str, progress): position
+                       for position, account in enumerate(accounts)}
+            for future in as_completed(fetches):
+                position = fetches[future]
+                try:
+                    inputs = future.result()
+                except Exception as e:
+                    entries[position]['error'] = f"Erro ao buscar dados: {e}"
+                    continue
+                entries[position]['timings'] = inputs['timings']
+                if inputs['closed_positions'].empty:
+                    entries[position]['error'] = 'Nenhuma posição fechada encontrada no período especificado.'
+                    continue
+                args = (inputs['closed_positions'], leverage, inputs['account_balance'], inputs['transactions_df'])
+                if pool is None:
+                    analyses[position] = _analyze_account(*args)
+                else:
+                    analyses[position] = pool.submit(_analyze_account, *args)
+
+        if progress is not None:
+            progress.set_stage('analyzing')
+        for position, analysis in analyses.items():
+            try:
+                result = analysis if pool is None else analysis.result()
+            except Exception as e:
+                entries[position]['error'] = f"Erro ao analisar: {e}"
+                continue
+            entries[position]['result'] = result
+            entries[position]['kpis'] = result['kpis']
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return {
+        'accounts': entries,
+        'consolidated': consolidate_results([entry['result'] for entry in entries]),
+    }
+
+
+def _print_report(batch):
+    header = f"{'conta':<20} {'trades':>8} {'PnL (USDT)':>14} {'acerto (%)':>11} {'ROI (%)':>9}"
+    print(header)
+    print('-' * len(header))
+    for entry in batch['accounts']:
+        if entry['error']:
+            print(f"{entry['name']:<20} {entry['error']}")
+            continue
+        kpis = entry['kpis']
+        print(f"{entry['name']:<20} {kpis['total_trades']:>8} {kpis['total_pnl']:>14.4f} "
+              f"{kpis['win_rate']:>11.2f} {kpis['avg_roi']:>9.2f}")
+    kpis = batch['consolidated']['kpis']
+    print('-' * len(header))
+    print(f"{'consolidado':<20} {kpis['total_trades']:>8} {kpis['total_pnl']:>14.4f} "
+          f"{kpis['win_rate']:>11.2f} {kpis['avg_roi']:>9.2f}")
+
+
+def batch_summary(batch):
+    """
+    Versão serializável em JSON do resultado de analyze_accounts (sem as tabelas de trades).
+    """
+    def plain(value):
+        return value.item() if hasattr(value, 'item') else value
+
+    return {
+        'accounts': [{
+            'name': entry['name'],
+            'kpis': {key: plain(value) for key, value in entry['kpis'].items()} if entry['kpis'] else None,
+            'timings': entry['timings'],
+            'error': entry['error'],
+        } for entry in batch['accounts']],
+        'consolidated': {key: ({k: plain(v) for k, v in value.items()} if isinstance(value, dict) else plain(value))
+                         for key, value in batch['consolidated'].items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Análise em lote de várias contas Bybit.')
+    parser.add_argument('--accounts', required=True, help='Arquivo JSON com a lista de contas.')
+    parser.add_argument('--start', required=True, help='Data inicial (AAAA-MM-DD).')
+    parser.add_argument('--end', required=True, help='Data final (AAAA-MM-DD).')
+    parser.add_argument('--leverage', type=float, default=10)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Processos de análise (padrão: um por núcleo; 0 = sem pool).')
+    parser.add_argument('--output', help='Grava o resumo (KPIs por conta e consolidado) em JSON.')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    with open(args.accounts, encoding='utf-8') as f:
+        accounts = json.load(f)
+
+    started = time.perf_counter()
+    batch = analyze_accounts(accounts, args.start, args.end, args.leverage, max_processes=args.processes)
+    _print_report(batch)
+    print(f"\n{len(accounts)} contas em {time.perf_counter() - started:.1f}s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(batch_summary(batch), f, ensure_ascii=False, indent=2)
+    return 0 if any(entry['result'] is not None for entry in batch['accounts']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
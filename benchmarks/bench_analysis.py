@@ -0,0 +1,122 @@
+"""
+Benchmark do process_closed_positions_data: motor colunar vs. loop iterrows antigo.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_analysis
+    python -m benchmarks.bench_analysis --sizes 10000 100000 --legacy-max 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis import process_closed_positions_data, _build_closed_positions_trades
+
+
+def make_closed_positions(n_rows, n_symbols=200, seed=42):
+    """
+    Gera um DataFrame sintético no formato bruto da API get_closed_pnl
+    (valores como strings, timestamps em ms).
+    """
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i}USDT" for i in range(n_symbols)])
+    created = 1_700_000_000_000 + rng.integers(0, 365 * 86_400_000, n_rows)
+    updated = created + rng.integers(0, 3 * 86_400_000, n_rows)
+    entry = rng.uniform(0.01, 50_000, n_rows)
+    return pd.DataFrame({
+        'symbol': symbols[rng.integers(0, n_symbols, n_rows)],
+        'side': np.where(rng.random(n_rows) < 0.5, 'Buy', 'Sell'),
+        'qty': rng.uniform(0.001, 100, n_rows).round(3).astype(str),
+        'avgEntryPrice': entry.round(4).astype(str),
+        'avgExitPrice': (entry * rng.uniform(0.95, 1.05, n_rows)).round(4).astype(str),
+        'closedPnl': rng.normal(0, 25, n_rows).round(6).astype(str),
+        'fillFee': rng.uniform(0, 1, n_rows).round(6).astype(str),
+        'createdTime': created.astype(str),
+        'updatedTime': updated.astype(str),
+    })
+
+
+def legacy_trades_loop(df, leverage):
+    """
+    Cópia do loop iterrows original, mantida apenas como referência de
+    desempenho e de equivalência de resultados.
+    """
+    trades = []
+    for index, row in df.iterrows():
+        qty = abs(float(row.get('qty', 0)))
+        avg_entry_price = float(row.get('avgEntryPrice', 0))
+        avg_exit_price = float(row.get('avgExitPrice', 0))
+        closed_pnl = float(row.get('closedPnl', 0))
+        fill_fee = float(row.get('fillFee', 0))
+        created_time = row.get('createdTime')
+        updated_time = row.get('updatedTime')
+        valor_nocional = qty * avg_entry_price
+        margem = valor_nocional / leverage if leverage > 0 else valor_nocional
+        roi = (closed_pnl / margem) * 100 if margem > 0 else 0
+        duration = updated_time - created_time if created_time and updated_time else pd.Timedelta(0)
+        trades.append({
+            'symbol': row.get('symbol', ''),
+            'position_side': 'Long' if row.get('side', '') == 'Buy' else 'Short',
+            'entry_time': created_time,
+            'exit_time': updated_time,
+            'duration': str(duration).replace('0 days ', '') if duration else '0:00:00',
+            'quantity': qty,
+            'avg_entry_price': avg_entry_price,
+            'exit_price': avg_exit_price,
+            'valor_nocional': valor_nocional,
+            'margem': margem,
+            'pnl_net': closed_pnl,
+            'roi': roi,
+            'result': 'Lucro' if closed_pnl > 0 else 'Perda',
+            'exit_type': 'Manual',
+            'fill_fee': fill_fee
+        })
+    return pd.DataFrame(trades)
+
+
+def _prepared(raw_df):
+    # Mesma conversão de tipos feita por process_closed_positions_data
+    df = raw_df.copy()
+    for col in ['createdTime', 'updatedTime']:
+        df[col] = pd.to_datetime(pd.to_numeric(df[col], errors='coerce'), unit='ms')
+    for col in ['closedPnl', 'fillFee', 'qty', 'avgEntryPrice', 'avgExitPrice']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.dropna(subset=['closedPnl', 'qty', 'avgEntryPrice'])
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--leverage', type=float, default=10)
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='Maior tamanho em que o loop antigo é executado (é lento).')
+    args = parser.parse_args(argv)
+
+    print(f"{'linhas':>10} {'pipeline (s)':>13} {'colunar (s)':>12} {'iterrows (s)':>13} {'speedup':>8}")
+    for n_rows in args.sizes:
+        raw_df = make_closed_positions(n_rows)
+        _, pipeline_time = _timed(process_closed_positions_data, raw_df, args.leverage)
+
+        df = _prepared(raw_df)
+        vectorized, vectorized_time = _timed(_build_closed_positions_trades, df, args.leverage)
+
+        if n_rows <= args.legacy_max:
+            legacy, legacy_time = _timed(legacy_trades_loop, df, args.leverage)
+            assert vectorized.to_frame().to_dict('records') == legacy.to_dict('records'), 'Resultados divergentes'
+            legacy_col = f"{legacy_time:13.3f}"
+            speedup = f"{legacy_time / vectorized_time:7.1f}x"
+        else:
+            legacy_col, speedup = f"{'-':>13}", f"{'-':>8}"
+
+        print(f"{n_rows:>10} {pipeline_time:13.3f} {vectorized_time:12.3f} {legacy_col} {speedup}")
+
+
+if __name__ == '__main__':
+    main()
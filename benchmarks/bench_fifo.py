@@ -0,0 +1,172 @@
+"""
+Benchmark da reconstrução de trades a partir de execuções (process_trades_data):
+motor vetorizado vs. loop iterrows antigo.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_fifo
+    python -m benchmarks.bench_fifo --sizes 10000 100000 --legacy-max 100000
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis import _reconstruct_round_trips, get_exit_type
+
+
+def make_fills(n_fills, n_symbols=100, seed=42, simple=False):
+    """
+    Gera um DataFrame sintético no formato bruto da API get_executions
+    (valores como strings, execTime em ms).
+    Com simple=True cada trade tem exatamente uma execução de entrada e uma de saída
+    com a mesma quantidade (o único caso que o loop antigo reconstrói corretamente);
+    caso contrário há aumentos de posição, fechamentos parciais e inversões de lado.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for symbol_id in range(n_symbols):
+        symbol = f"SYM{symbol_id}USDT"
+        clock = 1_700_000_000_000 + int(rng.integers(0, 86_400_000))
+        price = float(rng.uniform(0.1, 50_000))
+        position = 0
+        target = n_fills // n_symbols + (symbol_id < n_fills % n_symbols)
+        for _ in range(target):
+            clock += int(rng.integers(1_000, 3_600_000))
+            price = round(price * float(rng.uniform(0.99, 1.01)), 4)
+            if simple:
+                lots = int(rng.integers(1, 1000)) if position == 0 else -position
+                if position == 0 and rng.random() < 0.5:
+                    lots = -lots
+            elif position == 0 or rng.random() < 0.3:
+                lots = int(rng.integers(1, 1000)) * (1 if rng.random() < 0.5 else -1)
+            else:
+                # Reduz parcialmente, zera ou inverte a posição atual
+                lots = -int(np.sign(position)) * int(rng.integers(1, 2 * abs(position) + 1))
+            position += lots
+            rows.append((symbol, 'Buy' if lots > 0 else 'Sell', str(abs(lots) / 1000), str(price),
+                         str(round(abs(lots) / 1000 * price * 0.00055, 8)), str(clock),
+                         'StopLoss' if rng.random() < 0.1 else ''))
+    df = pd.DataFrame(rows, columns=['symbol', 'side', 'execQty', 'execPrice', 'execFee', 'execTime',
+                                     'stopOrderType'])
+    df['orderQty'] = df['execQty']
+    df['orderPrice'] = df['execPrice']
+    df['orderLinkId'] = ''
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def _prepared(raw_df):
+    # Mesma conversão de tipos feita por process_trades_data
+    df = raw_df.copy()
+    df['execTime'] = pd.to_datetime(pd.to_numeric(df['execTime'], errors='coerce'), unit='ms')
+    for col in ['execFee', 'execQty', 'execPrice', 'orderQty', 'orderPrice']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.dropna(subset=['execFee', 'execQty', 'execPrice', 'orderQty', 'orderPrice', 'execTime'])
+
+
+def legacy_trades_loop(df, leverage):
+    """
+    Cópia do loop iterrows original de process_trades_data, mantida apenas como
+    referência de desempenho e de equivalência de resultados.
+    """
+    df = df.sort_values(by='execTime', kind='stable').reset_index(drop=True)
+    trades = []
+    open_positions = {}
+    for index, row in df.iterrows():
+        symbol = row['symbol']
+        side = row['side']
+        qty = row['execQty']
+        price = row['execPrice']
+        fee = row['execFee']
+        exec_time = row['execTime']
+
+        if symbol not in open_positions:
+            open_positions[symbol] = {'qty': 0, 'cost': 0, 'entry_time': None, 'entry_price': 0, 'entry_fee': 0}
+
+        if open_positions[symbol]['qty'] == 0:
+            open_positions[symbol] = {
+                'qty': qty if side == 'Buy' else -qty,
+                'cost': qty * price,
+                'entry_time': exec_time,
+                'entry_price': price,
+                'entry_fee': fee
+            }
+        else:
+            current_qty = open_positions[symbol]['qty']
+            is_closing_long = side == 'Sell' and current_qty > 0
+            is_closing_short = side == 'Buy' and current_qty < 0
+            if is_closing_long or is_closing_short:
+                entry_qty = open_positions[symbol]['qty']
+                avg_entry_price = open_positions[symbol]['entry_price']
+                pnl = (price - avg_entry_price) * entry_qty if is_closing_long else (avg_entry_price - price) * abs(entry_qty)
+                pnl_net = pnl - open_positions[symbol]['entry_fee'] - fee
+                valor_nocional = abs(entry_qty * avg_entry_price)
+                margem = valor_nocional / leverage if leverage > 0 else valor_nocional
+                roi = (pnl_net / margem) * 100 if margem > 0 else 0
+                trades.append({
+                    'symbol': symbol, 'position_side': 'Long' if entry_qty > 0 else 'Short',
+                    'entry_time': open_positions[symbol]['entry_time'], 'exit_time': exec_time,
+                    'quantity': abs(entry_qty), 'avg_entry_price': avg_entry_price,
+                    'exit_price': price, 'valor_nocional': valor_nocional,
+                    'margem': margem, 'pnl_net': pnl_net, 'roi': roi,
+                    'exit_type': get_exit_type(row)
+                })
+                open_positions.pop(symbol, None)
+    return pd.DataFrame(trades)
+
+
+def _same_trades(vectorized, legacy):
+    columns = ['symbol', 'position_side', 'entry_time', 'exit_time', 'quantity', 'avg_entry_price',
+               'exit_price', 'valor_nocional', 'margem', 'pnl_net', 'roi', 'exit_type']
+    left = vectorized.to_frame()[columns].astype({'symbol': object, 'position_side': object, 'exit_type': object})
+    left = left.sort_values(['symbol', 'entry_time'], kind='stable').to_dict('records')
+    right = legacy[columns].sort_values(['symbol', 'entry_time'], kind='stable').to_dict('records')
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        for column in columns:
+            if isinstance(a[column], float):
+                if not math.isclose(a[column], b[column], rel_tol=1e-9, abs_tol=1e-9):
+                    return False
+            elif a[column] != b[column]:
+                return False
+    return True
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--leverage', type=float, default=10)
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='Maior tamanho em que o loop antigo é executado (é lento).')
+    args = parser.parse_args(argv)
+
+    print(f"{'execuções':>10} {'fluxo':>8} {'trades':>8} {'vetorizado (s)':>15} {'iterrows (s)':>13} {'speedup':>8}")
+    for n_fills in args.sizes:
+        for simple in (True, False):
+            df = _prepared(make_fills(n_fills, simple=simple))
+            vectorized, vectorized_time = _timed(_reconstruct_round_trips, df, args.leverage)
+
+            if n_fills <= args.legacy_max:
+                legacy, legacy_time = _timed(legacy_trades_loop, df, args.leverage)
+                if simple:
+                    # Sem aumentos, parciais ou inversões os dois motores devem concordar
+                    assert _same_trades(vectorized, legacy), 'Resultados divergentes'
+                legacy_col = f"{legacy_time:13.3f}"
+                speedup = f"{legacy_time / vectorized_time:7.1f}x"
+            else:
+                legacy_col, speedup = f"{'-':>13}", f"{'-':>8}"
+
+            flow = 'simples' if simple else 'misto'
+            print(f"{n_fills:>10} {flow:>8} {len(vectorized):>8} {vectorized_time:15.3f} {legacy_col} {speedup}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark de ponta a ponta do pipeline de análise: /analyze, /recalculate e /trades/<symbol>
+(com a primeira página de cada tabela, lida de /api/results e /api/trades) executados no app Flask contra a API simulada (bybit_replay.py) com contas sintéticas.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes 1000 10000 --symbols 50
+    python -m benchmarks.bench_pipeline --save-baseline     # grava os números atuais como referência
+    python -m benchmarks.bench_pipeline --check             # compara com a referência (sai com 1 se regrediu)
+
+Cada tamanho roda em um processo próprio, para que o pico de memória (RSS) seja o daquele
+tamanho. Por etapa são medidos o tempo total, o tempo de renderização dos templates e o
+pico de RSS; ao fim, o tamanho em disco da sessão (sessão do Flask + resultado no ResultStore).
+A referência versionada (pipeline_baseline.json) foi gravada com os parâmetros padrão; como
+ela depende da máquina, grave-a de novo (--save-baseline) na máquina em que roda o --check.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'pipeline_baseline.json')
+
+STAGES = ('analyze', 'analyze_cached', 'tables', 'recalculate', 'trades')
+
+# Métricas comparadas com a referência: (tolerância relativa, diferença absoluta mínima)
+# A diferença mínima evita alarmes por ruído em etapas de poucos milissegundos.
+REGRESSION_THRESHOLDS = {
+    'wall_s': (0.25, 0.05),
+    'render_s': (0.25, 0.02),
+    'peak_rss_mb': (0.15, 20),
+    'session_kb': (0.10, 16),
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _dir_size_kb(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path)) / 1024
+
+
+def run_size(n_positions, n_symbols, start_date, end_date, leverage):
+    """
+    Executa as etapas para um tamanho (no processo atual, que deve ser descartável:
+    muda o diretório de trabalho e as variáveis de ambiente antes de importar o app).
+    :return: {'positions', 'trades', 'session_kb', 'stages': {etapa: {wall_s, render_s, peak_rss_mb}}}
+    """
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    os.environ['BYBIT_CACHE_DIR'] = os.path.join(workdir, 'cache')
+    os.chdir(workdir)
+
+    from bybit_replay import ReplayServer, SyntheticAccount, _date_ms
+    import bybit_client
+
+    # O limitador do cliente segue os limites da Bybit (10 req/s); aqui interessa o custo do
+    # pipeline, não a cota da API, então o servidor local é consultado sem limite.
+    for method in bybit_client.BYBIT_RATE_LIMITS:
+        bybit_client.BYBIT_RATE_LIMITS[method] = 10_000
+
+    account = SyntheticAccount(n_positions, _date_ms(start_date), _date_ms(end_date, end_of_day=True),
+                               n_symbols=n_symbols)
+    server = ReplayServer(account).start()
+    os.environ['BYBIT_API_ENDPOINT'] = server.url
+
+    from flask import before_render_template, template_rendered
+    import app as app_module
+    from position_cache import account_id
+
+    renders = []
+
+    def render_started(sender, template, context, **extra):
+        renders.append(-time.perf_counter())
+
+    def render_finished(sender, template, context, **extra):
+        renders[-1] += time.perf_counter()
+
+    before_render_template.connect(render_started, app_module.app)
+    template_rendered.connect(render_finished, app_module.app)
+
+    client = app_module.app.test_client()
+    form = {'api_key': 'bench', 'api_secret': 'bench', 'start_date': start_date, 'end_date': end_date,
+            'leverage': str(leverage)}
+    stages = {}
+
+    def measure(name, func):
+        del renders[:]
+        started = time.perf_counter()
+        result = func()
+        stages[name] = {'wall_s': time.perf_counter() - started, 'render_s': sum(renders),
+                        'peak_rss_mb': _peak_rss_mb()}
+        return result
+
+    def analyze():
+        job_id = client.post('/analyze', data=form).get_json()['job_id']
+        while True:
+            status = client.get(f"/analyze/status/{job_id}").get_json()
+            if status['status'] not in ('queued', 'running'):
+                break
+            time.sleep(0.05)
+        if status['status'] != 'success':
+            raise RuntimeError(f"Análise falhou: {status.get('message')}")
+        return status
+
+    try:
+        measure('analyze', analyze)
+        # Segunda análise: posições vêm do cache local, então mede-se só a análise e a renderização.
+        # O índice de resultados compartilhados é limpo antes, senão a análise seria reaproveitada.
+        app_module.result_cache.invalidate(account_id(form['api_key']))
+        measure('analyze_cached', analyze)
+        # Primeira página de cada ranking, como o dashboard carrega após a análise
+        measure('tables', lambda: [client.get(f"/api/results/{table}?length=50").get_json()
+                                   for table in ('winners', 'losers', 'exit_types')])
+
+        with client.session_transaction() as flask_session:
+            result_id = flask_session['result_id']
+        results = app_module.result_store.get(result_id)
+        symbols_by_trades = [item['symbol'] for item in results['winners_summary'] + results['losers_summary']]
+
+        client.post('/ban_multiple', json={'symbols': symbols_by_trades[:10]})
+        measure('recalculate', lambda: client.post('/recalculate').get_json())
+
+        largest = max(results['symbol_index'].items(), key=lambda item: item[1][1] - item[1][0])[0]
+        measure('trades', lambda: (client.get(f"/trades/{largest}"),
+                                   client.get(f"/api/trades/{largest}?length=500").get_json()))
+
+        session_files = glob.glob(os.path.join(workdir, 'flask_session', '*'))
+        result_files = glob.glob(os.path.join(app_module.result_store.directory, f"{result_id}*"))
+        return {
+            'positions': n_positions,
+            'trades': results['kpis']['total_trades'],
+            'session_kb': _dir_size_kb(session_files + result_files),
+            'stages': stages,
+        }
+    finally:
+        server.stop()
+
+
+def _run_worker(n_positions, args):
+    """
+    Roda um tamanho em um subprocesso e devolve as medições.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as output:
+        output_path = output.name
+    command = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--worker', str(n_positions),
+               '--worker-output', output_path, '--symbols', str(args.symbols), '--start', args.start,
+               '--end', args.end, '--leverage', str(args.leverage)]
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [project_root, os.environ.get('PYTHONPATH')]))}
+    try:
+        # A saída do app (logs do analisador e da pybit) não interessa aqui
+        subprocess.run(command, check=True, cwd=project_root, env=env,
+                       stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+        with open(output_path, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(output_path)
+
+
+def find_regressions(current, baseline):
+    """
+    :return: Lista de textos descrevendo as métricas acima da tolerância em relação à referência.
+    """
+    regressions = []
+    for size, measured in current.items():
+        reference = baseline.get(size)
+        if reference is None:
+            continue
+        pairs = [('session_kb', measured['session_kb'], reference.get('session_kb'))]
+        for stage, metrics in measured['stages'].items():
+            for metric, value in metrics.items():
+                pairs.append((f"{stage}.{metric}", value, reference['stages'].get(stage, {}).get(metric)))
+        for name, value, base in pairs:
+            if base is None:
+                continue
+            relative, absolute = REGRESSION_THRESHOLDS[name.rsplit('.', 1)[-1]]
+            if value > base * (1 + relative) and value - base > absolute:
+                regressions.append(f"{size} posições, {name}: {base:.3f} -> {value:.3f} (+{(value / base - 1) * 100:.0f}%)"
+                                   if base else f"{size} posições, {name}: {base} -> {value:.3f}")
+    return regressions
+
+
+def _print_table(results):
+    print(f"{'posições':>9} {'trades':>8} {'etapa':<15} {'tempo (s)':>10} {'render (s)':>11} {'RSS máx. (MB)':>14}")
+    for size, measured in results.items():
+        for stage in STAGES:
+            metrics = measured['stages'][stage]
+            print(f"{size:>9} {measured['trades']:>8} {stage:<15} {metrics['wall_s']:>10.3f} "
+                  f"{metrics['render_s']:>11.3f} {metrics['peak_rss_mb']:>14.1f}")
+        print(f"{'':>9} {'':>8} {'sessão em disco':<15} {measured['session_kb']:>10.0f} KB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--end', default='2024-12-31')
+    parser.add_argument('--leverage', type=float, default=10)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Arquivo JSON da referência.')
+    parser.add_argument('--save-baseline', action='store_true', help='Grava os resultados como referência.')
+    parser.add_argument('--check', action='store_true', help='Falha se alguma métrica regrediu em relação à referência.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Mostra os logs dos processos de medição.')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        measured = run_size(args.worker, args.symbols, args.start, args.end, args.leverage)
+        with open(args.worker_output, 'w', encoding='utf-8') as f:
+            json.dump(measured, f)
+        return 0
+
+    results = {}
+    for n_positions in args.sizes:
+        results[str(n_positions)] = _run_worker(n_positions, args)
+    _print_table(results)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nReferência gravada em {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"\nSem referência em {args.baseline}; rode antes com --save-baseline.")
+            return 1
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f))
+        if regressions:
+            print('\nRegressões:')
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print('\nSem regressões em relação à referência.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,86 +1,386 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from pybit.unified_trading import HTTP
-import time
 import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import metrics
+from rate_limiter import AdaptiveRateLimiter, TokenBucket
+
+# Limites por endpoint (requisições/segundo) usados enquanto a Bybit ainda não informou
+# a cota nos cabeçalhos das respostas (ver AdaptiveRateLimiter).
+# Valores conservadores, abaixo dos limites por UID documentados na API V5 da Bybit.
+BYBIT_RATE_LIMITS = {
+    'get_closed_pnl': 10,
+    'get_wallet_balance': 10,
+    'get_deposit_records': 5,
+    'get_withdrawal_records': 5,
+    'get_order_history': 10,
+}
+
+# Limite por IP da Bybit (600 requisições a cada 5s), somando todas as contas e endpoints do processo
+BYBIT_IP_RATE_LIMIT = 120
+
+# Caminho da API V5 -> método da pybit, para associar cada resposta ao seu limitador
+API_PATHS = {
+    '/v5/position/closed-pnl': 'get_closed_pnl',
+    '/v5/account/wallet-balance': 'get_wallet_balance',
+    '/v5/asset/deposit/query-record': 'get_deposit_records',
+    '/v5/asset/withdraw/query-record': 'get_withdrawal_records',
+    '/v5/order/history': 'get_order_history',
+}
+
+# Número máximo de janelas de 7 dias buscadas em paralelo
+MAX_CONCURRENT_WINDOWS = 4
+
+# Novas tentativas de uma página após falhas temporárias (limite de taxa, erro do servidor, rede),
+# além das que a própria pybit já faz; o intervalo dobra a cada tentativa, até o máximo
+API_MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 0.5
+RETRY_BACKOFF_MAX_SECONDS = 10
+
+# retCodes temporários: limite de taxa por UID (10006) e por IP (10018), erro interno (10016)
+RETRYABLE_RET_CODES = {10006, 10016, 10018}
+
+
+class RetryableApiError(Exception):
+    """
+    Resposta com um retCode temporário (RETRYABLE_RET_CODES).
+    """
+
+    def __init__(self, method_name, ret_code, message):
+        super().__init__(f"{method_name}: {message} (ErrCode: {ret_code})")
+        self.ret_code = ret_code
+
+
+# Sessões HTTP compartilhadas por credencial (uma por par api_key/api_secret no processo)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Conexões mantidas abertas por sessão; cobre as janelas paralelas de todas as fontes
+HTTP_POOL_SIZE = 16
+
+
+def get_session(api_key, api_secret):
+    """
+    Retorna a sessão HTTP da pybit associada à credencial, criando-a na primeira chamada.
+    A sessão reaproveita conexões (keep-alive) entre fontes e janelas buscadas em paralelo.
+    Com BYBIT_API_ENDPOINT definida (ex: http://127.0.0.1:8765, ver bybit_replay.py),
+    as requisições vão para esse endereço em vez da API da Bybit.
+    """
+    endpoint = os.environ.get('BYBIT_API_ENDPOINT')
+    key = (api_key, api_secret, endpoint)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            # Importados sob demanda: quem só usa o cache local (ex: cli.py --from-cache) não paga pela pybit
+            from pybit.unified_trading import HTTP
+            from requests.adapters import HTTPAdapter
+
+            session = HTTP(
+                testnet=False,
+                api_key=api_key,
+                api_secret=api_secret,
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.client.mount('https://', adapter)
+            metrics.install_pybit_retry_counter()
+            if endpoint:
+                session.endpoint = endpoint.rstrip('/')
+                session.client.mount('http://', adapter)
+            # Cada resposta atualiza a cota do limitador do seu endpoint
+            session.client.hooks['response'].append(
+                lambda response, *args, **kwargs: _update_limiter_from_response(session, response))
+            _sessions[key] = session
+        return session
+
+
+# Limitadores compartilhados por (API Key, endereço da API, método), entre todas as buscas do processo
+_limiters = {}
+_limiters_lock = threading.Lock()
+_ip_limiter = TokenBucket(BYBIT_IP_RATE_LIMIT)
+
+
+def get_limiter(session, method_name):
+    """
+    Retorna o limitador adaptativo do endpoint para a conta da sessão, criando-o na primeira chamada.
+    Buscas simultâneas da mesma conta (ex: duas análises abertas) dividem a mesma cota.
+    """
+    key = (getattr(session, 'api_key', None), getattr(session, 'endpoint', None), method_name)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(BYBIT_RATE_LIMITS[method_name])
+            _limiters[key] = limiter
+        return limiter
+
+
+def _update_limiter_from_response(session, response):
+    """
+    Hook de resposta do requests: repassa os cabeçalhos X-Bapi-Limit-* ao limitador do endpoint.
+    """
+    method_name = API_PATHS.get(urlsplit(response.url).path)
+    headers = response.headers
+    if method_name is None or 'X-Bapi-Limit-Status' not in headers:
+        return
+    try:
+        limit = int(headers['X-Bapi-Limit'])
+        remaining = int(headers['X-Bapi-Limit-Status'])
+        reset_timestamp_ms = int(headers['X-Bapi-Limit-Reset-Timestamp'])
+    except (KeyError, ValueError):
+        return
+    get_limiter(session, method_name).update(limit, remaining, reset_timestamp_ms)
+
+
+def _is_retryable(error):
+    """
+    Falhas temporárias que valem uma nova tentativa da mesma página.
+    """
+    if isinstance(error, RetryableApiError):
+        return True
+    from pybit.exceptions import FailedRequestError, InvalidRequestError
+    from requests.exceptions import ConnectionError, Timeout
+
+    if isinstance(error, InvalidRequestError):
+        return error.status_code in RETRYABLE_RET_CODES
+    if isinstance(error, FailedRequestError):
+        # Inclui HTTP 403/5xx e o "Retries exceeded" da pybit após vários 10006; 401 é credencial inválida
+        return error.status_code != 401
+    return isinstance(error, (ConnectionError, Timeout))
+
+
+def call_api(session, method_name, limiter=None, **params):
+    """
+    Envia uma requisição à API respeitando o limitador do endpoint e o limite por IP,
+    e repete com backoff exponencial as falhas temporárias, em vez de descartar a página.
+    :param limiter: Limitador a usar. Padrão: get_limiter(session, method_name).
+    :return: Resposta da API (dicionário).
+    :raises: A última exceção, quando as tentativas se esgotam ou a falha não é temporária.
+    """
+    if limiter is None:
+        limiter = get_limiter(session, method_name)
+    for attempt in range(API_MAX_RETRIES + 1):
+        waited = limiter.acquire() + _ip_limiter.acquire()
+        if waited:
+            metrics.count('bybit_rate_limit_wait_seconds_total', waited, endpoint=method_name)
+        try:
+            try:
+                with metrics.api_call(method_name):
+                    response = getattr(session, method_name)(**params)
+            finally:
+                # Limitadores simples (TokenBucket) não acompanham as requisições em andamento
+                getattr(limiter, 'release', lambda: None)()
+            if response.get('retCode') in RETRYABLE_RET_CODES:
+                raise RetryableApiError(method_name, response['retCode'], response.get('retMsg'))
+            return response
+        except Exception as e:
+            if attempt == API_MAX_RETRIES or not _is_retryable(e):
+                raise
+            backoff = min(RETRY_BACKOFF_SECONDS * 2 ** attempt, RETRY_BACKOFF_MAX_SECONDS)
+            wait_until_reset = getattr(limiter, 'seconds_until_reset', lambda: 0.0)()
+            delay = max(backoff, wait_until_reset) * random.uniform(1.0, 1.25)
+            metrics.count('bybit_api_retries_total')
+            logging.warning(f"{method_name}: {e}. Nova tentativa em {delay:.1f}s "
+                            f"({attempt + 1}/{API_MAX_RETRIES}).")
+            time.sleep(delay)
+
+
+def _date_range_ms(start_date_str, end_date_str):
+    """
+    Converte o período 'YYYY-MM-DD' em timestamps (ms), do início do dia inicial
+    ao último segundo do dia final.
+    """
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+    start_timestamp = int(start_date.timestamp() * 1000)
+    end_timestamp = int((end_date + timedelta(days=1) - timedelta(seconds=1)).timestamp() * 1000)
+    return start_timestamp, end_timestamp
 
-def fetch_closed_positions(api_key, api_secret, start_date_str, end_date_str):
+
+def _time_windows(start_timestamp, end_timestamp, days=7):
+    """
+    Divide o intervalo (ms) em janelas de até `days` dias (limitação da API).
+    :return: Lista de (start_timestamp_ms, end_timestamp_ms, rótulo) em ordem cronológica.
+    """
+    window_ms = days * 86_400_000
+    windows = []
+    current_start = start_timestamp
+    while current_start <= end_timestamp:
+        current_end = min(current_start + window_ms - 1000, end_timestamp)
+        label = (f"{datetime.fromtimestamp(current_start / 1000).strftime('%Y-%m-%d')} a "
+                 f"{datetime.fromtimestamp(current_end / 1000).strftime('%Y-%m-%d')}")
+        windows.append((current_start, current_end, label))
+        current_start = current_start + window_ms
+    return windows
+
+
+def _date_windows(start_date_str, end_date_str, days=7):
+    """
+    Divide o período 'YYYY-MM-DD' em janelas de até `days` dias.
+    """
+    return _time_windows(*_date_range_ms(start_date_str, end_date_str), days=days)
+
+
+def _fetch_closed_pnl_window(session, limiter, start_timestamp, end_timestamp, label, on_page=None,
+                             progress=None):
+    """
+    Busca todas as páginas de posições fechadas de uma única janela.
+    Cada requisição aguarda o limitador antes de ser enviada, e falhas temporárias são
+    repetidas (call_api); se a página ainda assim falhar, o erro é propagado, para que a
+    janela não seja dada como buscada com dados faltando.
+    Com `on_page`, cada página é entregue ao callback assim que chega e não é acumulada.
+    """
+    logging.info(f"Buscando posições fechadas de {label}...")
+
+    window_positions = []
+    cursor = ""
+    while True:
+        try:
+            response = call_api(
+                session, 'get_closed_pnl', limiter,
+                category="linear",
+                startTime=start_timestamp,
+                endTime=end_timestamp,
+                limit=100,
+                cursor=cursor
+            )
+            if response['retCode'] != 0:
+                raise Exception(f"Erro da API Bybit (Posições): {response['retMsg']}")
+        except Exception as e:
+            logging.error(f"Erro ao buscar posições fechadas de {label}: {e}")
+            raise
+
+        positions = response['result']['list']
+        metrics.record_page('get_closed_pnl', len(positions))
+        logging.debug(f"Encontradas {len(positions)} posições nesta página ({label})")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for position in positions:
+                logging.debug(f"Posição {position['symbol']} - PnL: {position.get('closedPnl', 0)}")
+
+        if on_page is not None:
+            on_page(positions)
+        else:
+            window_positions.extend(positions)
+        if progress is not None:
+            progress.add_rows(len(positions))
+
+        cursor = response['result'].get('nextPageCursor')
+        if not cursor:
+            break
+
+    return window_positions
+
+
+def fetch_closed_positions_between(session, start_timestamp, end_timestamp,
+                                   max_workers=MAX_CONCURRENT_WINDOWS, limiter=None, on_page=None,
+                                   progress=None):
+    """
+    Busca as posições fechadas entre dois timestamps (ms) usando uma sessão existente.
+    As janelas de 7 dias são buscadas em paralelo (no máximo `max_workers` por vez),
+    sob o limitador do endpoint, e o resultado mantém a ordem cronológica.
+    Uma janela que falha (após as novas tentativas) interrompe a busca com o erro.
+    :param limiter: Limitador compartilhado. Padrão: get_limiter(session, 'get_closed_pnl').
+    :param on_page: Callback chamado com cada página (lista de posições) assim que ela chega,
+                    possivelmente de várias threads. Nesse modo nada é acumulado.
+    :param progress: Objeto opcional (ex: jobs.JobProgress) avisado das janelas previstas
+                     (add_windows), das linhas recebidas (add_rows) e de cada janela concluída
+                     (window_done).
+    :return: Lista de posições (dicionários da API); vazia quando `on_page` é informado.
+    """
+    if limiter is None:
+        limiter = get_limiter(session, 'get_closed_pnl')
+
+    windows = _time_windows(start_timestamp, end_timestamp)
+    if progress is not None:
+        progress.add_windows(len(windows))
+
+    def fetch_window(window):
+        window_positions = _fetch_closed_pnl_window(session, limiter, *window, on_page=on_page, progress=progress)
+        if progress is not None:
+            progress.window_done()
+        return window_positions
+
+    # executor.map preserva a ordem das janelas, independentemente da ordem de conclusão
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = executor.map(metrics.in_context(fetch_window), windows)
+        return [position for window_positions in results for position in window_positions]
+
+
+def _fetch_order_history_window(session, limiter, start_timestamp, end_timestamp, label, category='linear'):
+    """
+    Busca todas as páginas do histórico de ordens de uma janela (até 7 dias, 50 ordens por página).
+    """
+    logging.info(f"Buscando histórico de ordens de {label}...")
+    window_orders = []
+    cursor = ""
+    while True:
+        response = call_api(session, 'get_order_history', limiter, category=category,
+                            startTime=start_timestamp, endTime=end_timestamp, limit=50, cursor=cursor)
+        if response['retCode'] != 0:
+            raise Exception(f"Erro da API Bybit (Ordens): {response['retMsg']}")
+        orders = response['result']['list']
+        metrics.record_page('get_order_history', len(orders))
+        window_orders.extend(orders)
+        cursor = response['result'].get('nextPageCursor')
+        if not cursor:
+            break
+    return window_orders
+
+
+def fetch_order_history_windows(session, windows, category='linear', max_workers=MAX_CONCURRENT_WINDOWS,
+                                limiter=None):
+    """
+    Busca o histórico de ordens das janelas informadas, em paralelo e sob o limitador do endpoint.
+    :param windows: Lista de (start_timestamp_ms, end_timestamp_ms), cada uma com até 7 dias.
+    :return: Lista de ordens (dicionários da API).
+    """
+    if limiter is None:
+        limiter = get_limiter(session, 'get_order_history')
+
+    def fetch_window(window):
+        start, end = window
+        label = (f"{datetime.fromtimestamp(start / 1000).strftime('%Y-%m-%d')} a "
+                 f"{datetime.fromtimestamp(end / 1000).strftime('%Y-%m-%d')}")
+        return _fetch_order_history_window(session, limiter, start, end, label, category)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = executor.map(metrics.in_context(fetch_window), windows)
+        return [order for window_orders in results for order in window_orders]
+
+
+def fetch_closed_positions(api_key, api_secret, start_date_str, end_date_str, session=None,
+                           max_workers=MAX_CONCURRENT_WINDOWS, limiter=None):
     """
     Busca posições fechadas (trades completos) usando a API específica da Bybit.
     Esta API retorna trades já processados e agrupados pela própria Bybit.
+    :param session: Sessão HTTP da pybit (ou substituto compatível). Padrão: get_session().
     """
-    session = HTTP(
-        testnet=False,
-        api_key=api_key,
-        api_secret=api_secret,
+    if session is None:
+        session = get_session(api_key, api_secret)
+
+    all_positions = fetch_closed_positions_between(
+        session,
+        *_date_range_ms(start_date_str, end_date_str),
+        max_workers=max_workers,
+        limiter=limiter
     )
     
-    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-    
-    all_positions = []
-    current_start = start_date
-    
-    # Processar em chunks de 7 dias (limitação da API)
-    while current_start <= end_date:
-        current_end = min(current_start + timedelta(days=6), end_date)
-        start_timestamp = int(current_start.timestamp() * 1000)
-        end_timestamp = int((current_end + timedelta(days=1) - timedelta(seconds=1)).timestamp() * 1000)
-
-        logging.info(f"Buscando posições fechadas de {current_start.strftime('%Y-%m-%d')} a {current_end.strftime('%Y-%m-%d')}...")
-        print(f"DEBUG: Buscando posições fechadas - {current_start.strftime('%Y-%m-%d')} a {current_end.strftime('%Y-%m-%d')}")
-        
-        cursor = ""
-        while True:
-            try:
-                response = session.get_closed_pnl(
-                    category="linear",
-                    startTime=start_timestamp,
-                    endTime=end_timestamp,
-                    limit=100,
-                    cursor=cursor
-                )
-                
-                if response['retCode'] != 0:
-                    raise Exception(f"Erro da API Bybit (Posições): {response['retMsg']}")
-                
-                positions = response['result']['list']
-                print(f"DEBUG: Encontradas {len(positions)} posições neste chunk")
-                
-                for position in positions:
-                    print(f"DEBUG: Posição {position['symbol']} - PnL: {position.get('closedPnl', 0)}")
-                
-                all_positions.extend(positions)
-                
-                cursor = response['result'].get('nextPageCursor')
-                if not cursor:
-                    break
-                    
-                time.sleep(0.2)  # Rate limiting
-                
-            except Exception as e:
-                logging.error(f"Erro ao buscar posições fechadas: {e}")
-                print(f"DEBUG: Erro no chunk: {e}")
-                break
-        
-        current_start = current_end + timedelta(days=1)
-        time.sleep(0.5)
-    
-    print(f"DEBUG: Total de posições fechadas coletadas: {len(all_positions)}")
+    logging.debug(f"Total de posições fechadas coletadas: {len(all_positions)}")
     return pd.DataFrame(all_positions) if all_positions else pd.DataFrame()
 
-def fetch_account_balance(api_key, api_secret):
+def fetch_account_balance(api_key, api_secret, session=None):
     """
     Busca o saldo atual da conta UTA.
     """
     try:
-        session = HTTP(
-            testnet=False,
-            api_key=api_key,
-            api_secret=api_secret,
-        )
+        if session is None:
+            session = get_session(api_key, api_secret)
         
-        response = session.get_wallet_balance(accountType="UNIFIED")
+        response = call_api(session, 'get_wallet_balance', accountType="UNIFIED")
         
         if response['retCode'] != 0:
             raise Exception(f"Erro da API: {response['retMsg']}")
@@ -101,114 +401,102 @@ def fetch_account_balance(api_key, api_secret):
         logging.error(f"Erro ao buscar saldo da conta: {e}")
         return {}
 
-def fetch_account_transactions(api_key, api_secret, start_date_str, end_date_str):
+def _deposit_to_transaction(deposit):
+    return {
+        'type': 'Depósito',
+        'coin': deposit.get('coin', ''),
+        'amount': float(deposit.get('amount', 0)) if deposit.get('amount') else 0,
+        'status': deposit.get('status', ''),
+        'timestamp': deposit.get('successAt', deposit.get('createdTime', '')),
+        'tx_id': deposit.get('txID', ''),
+        'address': deposit.get('toAddress', '')
+    }
+
+
+def _withdrawal_to_transaction(withdrawal):
+    return {
+        'type': 'Retirada',
+        'coin': withdrawal.get('coin', ''),
+        'amount': float(withdrawal.get('amount', 0)) if withdrawal.get('amount') else 0,
+        'status': withdrawal.get('status', ''),
+        'timestamp': withdrawal.get('updateTime', withdrawal.get('createTime', '')),
+        'tx_id': withdrawal.get('txID', ''),
+        'address': withdrawal.get('toAddress', '')
+    }
+
+
+# Fluxos de movimentações: (método da pybit, rótulo para logs, conversor para o esquema do DataFrame)
+TRANSACTION_STREAMS = [
+    ('get_deposit_records', 'depósitos', _deposit_to_transaction),
+    ('get_withdrawal_records', 'retiradas', _withdrawal_to_transaction),
+]
+
+
+def _fetch_transactions_window(session, method_name, stream_label, convert, limiter,
+                               start_timestamp, end_timestamp):
+    """
+    Busca todas as páginas de um fluxo (depósitos ou retiradas) em uma janela.
+    Uma página que falha (após as novas tentativas de call_api) propaga o erro.
+    """
+    transactions = []
+    cursor = ""
+    while True:
+        response = call_api(
+            session, method_name, limiter,
+            startTime=start_timestamp,
+            endTime=end_timestamp,
+            limit=50,
+            cursor=cursor
+        )
+        if response['retCode'] != 0:
+            raise Exception(f"Erro ao buscar {stream_label}: {response['retMsg']}")
+
+        rows = response['result']['rows']
+        metrics.record_page(method_name, len(rows))
+        transactions.extend(convert(row) for row in rows)
+
+        cursor = response['result'].get('nextPageCursor')
+        if not cursor:
+            break
+
+    return transactions
+
+
+def fetch_account_transactions(api_key, api_secret, start_date_str, end_date_str, session=None,
+                               max_workers=MAX_CONCURRENT_WINDOWS):
     """
     Busca movimentações da conta (depósitos, retiradas).
     Nota: Transferências internas não estão disponíveis na API pública.
+    Depósitos e retiradas têm limites de taxa independentes, então os dois fluxos e
+    as janelas de 7 dias são buscados em paralelo, cada fluxo sob o seu limitador.
+    O resultado mantém a ordem: por janela, depósitos e depois retiradas.
+    Se alguma janela falhar, nenhuma movimentação é devolvida (DataFrame vazio), em vez
+    de um histórico incompleto.
     """
     try:
-        session = HTTP(
-            testnet=False,
-            api_key=api_key,
-            api_secret=api_secret,
-        )
-        
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        
-        all_transactions = []
-        current_start = start_date
-        
-        # Processar em chunks de 7 dias
-        while current_start <= end_date:
-            current_end = min(current_start + timedelta(days=6), end_date)
-            start_timestamp = int(current_start.timestamp() * 1000)
-            end_timestamp = int((current_end + timedelta(days=1) - timedelta(seconds=1)).timestamp() * 1000)
-            
-            print(f"DEBUG: Buscando transações de {current_start.strftime('%Y-%m-%d')} a {current_end.strftime('%Y-%m-%d')}")
-            
-            # Buscar depósitos
-            try:
-                cursor = ""
-                while True:
-                    response = session.get_deposit_records(
-                        startTime=start_timestamp,
-                        endTime=end_timestamp,
-                        limit=50,
-                        cursor=cursor
-                    )
-                    
-                    if response['retCode'] == 0:
-                        deposits = response['result']['rows']
-                        for deposit in deposits:
-                            all_transactions.append({
-                                'type': 'Depósito',
-                                'coin': deposit.get('coin', ''),
-                                'amount': float(deposit.get('amount', 0)) if deposit.get('amount') else 0,
-                                'status': deposit.get('status', ''),
-                                'timestamp': deposit.get('successAt', deposit.get('createdTime', '')),
-                                'tx_id': deposit.get('txID', ''),
-                                'address': deposit.get('toAddress', '')
-                            })
-                        
-                        cursor = response['result'].get('nextPageCursor')
-                        if not cursor:
-                            break
-                        time.sleep(0.2)
-                    else:
-                        print(f"DEBUG: Erro ao buscar depósitos: {response['retMsg']}")
-                        break
-                        
-            except Exception as e:
-                print(f"DEBUG: Erro no chunk de depósitos: {e}")
-            
-            # Buscar retiradas
-            try:
-                cursor = ""
-                while True:
-                    response = session.get_withdrawal_records(
-                        startTime=start_timestamp,
-                        endTime=end_timestamp,
-                        limit=50,
-                        cursor=cursor
-                    )
-                    
-                    if response['retCode'] == 0:
-                        withdrawals = response['result']['rows']
-                        for withdrawal in withdrawals:
-                            all_transactions.append({
-                                'type': 'Retirada',
-                                'coin': withdrawal.get('coin', ''),
-                                'amount': float(withdrawal.get('amount', 0)) if withdrawal.get('amount') else 0,
-                                'status': withdrawal.get('status', ''),
-                                'timestamp': withdrawal.get('updateTime', withdrawal.get('createTime', '')),
-                                'tx_id': withdrawal.get('txID', ''),
-                                'address': withdrawal.get('toAddress', '')
-                            })
-                        
-                        cursor = response['result'].get('nextPageCursor')
-                        if not cursor:
-                            break
-                        time.sleep(0.2)
-                    else:
-                        print(f"DEBUG: Erro ao buscar retiradas: {response['retMsg']}")
-                        break
-                        
-            except Exception as e:
-                print(f"DEBUG: Erro no chunk de retiradas: {e}")
-            
-            current_start = current_end + timedelta(days=1)
-            time.sleep(0.5)
-
-        print(f"DEBUG: Total de transações encontradas: {len(all_transactions)}")
-        for transaction in all_transactions:
-            print(f"DEBUG: {transaction}")
+        if session is None:
+            session = get_session(api_key, api_secret)
+
+        windows = _date_windows(start_date_str, end_date_str)
+        limiters = {method_name: get_limiter(session, method_name) for method_name, _, _ in TRANSACTION_STREAMS}
+
+        # Um trabalho por (janela, fluxo); cada fluxo pode ter até max_workers janelas em andamento
+        fetch_window = metrics.in_context(_fetch_transactions_window)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers) * len(TRANSACTION_STREAMS)) as executor:
+            futures = [
+                executor.submit(fetch_window, session, method_name, stream_label, convert,
+                                limiters[method_name], start_timestamp, end_timestamp)
+                for start_timestamp, end_timestamp, _ in windows
+                for method_name, stream_label, convert in TRANSACTION_STREAMS
+            ]
+            all_transactions = [transaction for future in futures for transaction in future.result()]
+
+        logging.debug(f"Total de transações encontradas: {len(all_transactions)}")
         
         return pd.DataFrame(all_transactions) if all_transactions else pd.DataFrame()
         
     except Exception as e:
         logging.error(f"Erro ao buscar movimentações da conta: {e}")
-        print(f"DEBUG: Erro geral: {e}")
         return pd.DataFrame()
 
 # Manter função antiga para compatibilidade (caso seja necessária)
@@ -217,7 +505,7 @@ def fetch_all_trades(api_key, api_secret, start_date_str, end_date_str):
     DEPRECATED: Usar fetch_closed_positions() em vez desta função.
     Mantida apenas para compatibilidade.
     """
-    print("AVISO: Usando fetch_closed_positions() em vez de fetch_all_trades()")
+    logging.warning("Usando fetch_closed_positions() em vez de fetch_all_trades()")
     return fetch_closed_positions(api_key, api_secret, start_date_str, end_date_str)
 
 # Aliases para compatibilidade
@@ -0,0 +1,434 @@
+# bybit_replay.py
+"""
+Servidor local que imita os endpoints da API V5 da Bybit usados pelo projeto
+(posições fechadas, histórico de ordens, saldo, depósitos e retiradas), para medir e testar o pipeline
+sem chamar a Bybit. As respostas vêm de uma gravação de uma conta real ou de uma
+conta sintética de qualquer tamanho, com latência e erros de limite (10006) configuráveis.
+
+Uso:
+    # Grava uma vez as respostas reais (credenciais em BYBIT_API_KEY/BYBIT_API_SECRET)
+    python bybit_replay.py record --start 2024-01-01 --end 2024-03-31 --output gravacao.jsonl
+
+    # Serve a gravação, ou uma conta sintética
+    python bybit_replay.py serve --fixture gravacao.jsonl --latency 0.05 --rate-limit 10
+    python bybit_replay.py serve --synthetic 100000 --symbols 200 --start 2024-01-01 --end 2024-12-31
+
+    # Aponta a aplicação (ou o cli.py) para o servidor local
+    BYBIT_API_ENDPOINT=http://127.0.0.1:8765 python cli.py analyze --api-key x --api-secret y ...
+
+Atenção: as gravações contêm os dados da conta (inclusive endereços e txIDs de movimentações),
+mas nunca as credenciais.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from bybit_client import API_PATHS
+
+# Caminho da API V5 -> método correspondente da pybit
+ENDPOINTS = API_PATHS
+
+# Intervalo máximo entre startTime e endTime aceito por endpoint (como na API real)
+MAX_WINDOW_MS = {
+    'get_closed_pnl': 7 * 86_400_000,
+    'get_order_history': 7 * 86_400_000,
+    'get_deposit_records': 30 * 86_400_000,
+    'get_withdrawal_records': 30 * 86_400_000,
+}
+
+DEFAULT_PORT = 8765
+
+
+def _request_key(method_name, params):
+    """
+    Chave de uma requisição gravada: método + parâmetros (como texto, sem os vazios).
+    """
+    normalized = sorted((key, str(value)) for key, value in params.items() if value not in (None, ''))
+    return json.dumps([method_name, normalized])
+
+
+def _error(ret_code, message):
+    return {'retCode': ret_code, 'retMsg': message, 'result': {}, 'retExtInfo': {}, 'time': int(time.time() * 1000)}
+
+
+def _ok(result):
+    return {'retCode': 0, 'retMsg': 'OK', 'result': result, 'retExtInfo': {}, 'time': int(time.time() * 1000)}
+
+
+class RecordingSession:
+    """
+    Envolve uma sessão da pybit e grava em JSON lines cada resposta dos métodos usados
+    pelo projeto, para depois servi-las com FixtureAccount.
+    """
+
+    def __init__(self, session, path):
+        self._session = session
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        self.recorded = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self._session, name)
+        if name not in ENDPOINTS.values():
+            return attribute
+
+        def recorded_call(**params):
+            response = attribute(**params)
+            line = json.dumps({'key': _request_key(name, params), 'response': response}, ensure_ascii=False)
+            with self._lock:
+                self._file.write(line + '\n')
+                self.recorded += 1
+            return response
+        return recorded_call
+
+    def close(self):
+        self._file.close()
+
+
+class FixtureAccount:
+    """
+    Conta servida a partir de uma gravação de RecordingSession.
+    Requisições que não estão na gravação recebem o erro 10001.
+    """
+
+    def __init__(self, path):
+        self._responses = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._responses[entry['key']] = entry['response']
+
+    def respond(self, method_name, params):
+        response = self._responses.get(_request_key(method_name, params))
+        if response is None:
+            return _error(10001, f"Requisição não gravada: {method_name} {params}")
+        return response
+
+
+class SyntheticAccount:
+    """
+    Conta sintética determinística: `n_positions` posições fechadas distribuídas entre
+    start_ms e end_ms, além de depósitos e retiradas semanais. Os dados ficam em arrays
+    e só as linhas da página pedida viram dicionários, então o tamanho não tem limite prático.
+    """
+
+    def __init__(self, n_positions, start_ms, end_ms, n_symbols=50, seed=42):
+        rng = np.random.default_rng(seed)
+        self.symbols = np.array([f"SYM{i}USDT" for i in range(n_symbols)], dtype=object)
+        self.updated = np.sort(rng.integers(start_ms, end_ms, n_positions))
+        self.created = self.updated - rng.integers(60_000, 2 * 86_400_000, n_positions)
+        self.symbol = rng.integers(0, n_symbols, n_positions)
+        self.side = np.where(rng.random(n_positions) < 0.5, 'Buy', 'Sell')
+        self.qty = rng.uniform(0.001, 100, n_positions).round(3)
+        self.entry = rng.uniform(0.01, 50_000, n_positions).round(4)
+        self.exit = (self.entry * rng.uniform(0.95, 1.05, n_positions)).round(4)
+        self.pnl = rng.normal(0, 25, n_positions).round(6)
+        self.fee = rng.uniform(0, 1, n_positions).round(6)
+        # Como cada posição foi fechada: ordem comum, Stop Loss, Take Profit, Trailing Stop ou liquidação
+        self.exit_kind = rng.choice(5, n_positions, p=[0.55, 0.2, 0.2, 0.04, 0.01])
+
+        week = 7 * 86_400_000
+        self.deposit_times = np.arange(start_ms + week // 2, end_ms, week)
+        self.withdrawal_times = self.deposit_times + week // 4
+
+    @staticmethod
+    def _page(times, params, limit_max):
+        """
+        Índices (do mais recente para o mais antigo, como na API) da página pedida.
+        :return: (índices, próximo cursor)
+        """
+        start, end = int(params['startTime']), int(params['endTime'])
+        low = np.searchsorted(times, start, side='left')
+        high = np.searchsorted(times, end, side='right')
+        offset = int(params.get('cursor') or 0)
+        limit = min(int(params.get('limit') or limit_max), limit_max)
+        indices = np.arange(high - 1 - offset, max(high - 1 - offset - limit, low - 1), -1)
+        next_cursor = str(offset + limit) if offset + limit < high - low else ''
+        return indices, next_cursor
+
+    def respond(self, method_name, params):
+        if method_name == 'get_wallet_balance':
+            return _ok({'list': [{'accountType': 'UNIFIED', 'coin': [
+                {'coin': 'USDT', 'walletBalance': '10000', 'availableToWithdraw': '9000', 'unrealisedPnl': '12.5'}]}]})
+
+        if method_name == 'get_closed_pnl':
+            indices, next_cursor = self._page(self.updated, params, 100)
+            rows = [{
+                'symbol': self.symbols[self.symbol[i]],
+                'orderId': f"synthetic-{i}",
+                'side': self.side[i],
+                'qty': str(self.qty[i]),
+                'orderPrice': str(self.exit[i]),
+                'orderType': 'Market',
+                'execType': 'Trade',
+                'closedSize': str(self.qty[i]),
+                'cumEntryValue': str(round(self.qty[i] * self.entry[i], 6)),
+                'avgEntryPrice': str(self.entry[i]),
+                'cumExitValue': str(round(self.qty[i] * self.exit[i], 6)),
+                'avgExitPrice': str(self.exit[i]),
+                'closedPnl': str(self.pnl[i]),
+                'fillCount': '1',
+                'leverage': '10',
+                'fillFee': str(self.fee[i]),
+                'createdTime': str(self.created[i]),
+                'updatedTime': str(self.updated[i]),
+            } for i in indices.tolist()]
+            return _ok({'category': 'linear', 'list': rows, 'nextPageCursor': next_cursor})
+
+        if method_name == 'get_order_history':
+            # Só as ordens de fechamento, uma por posição, com o updatedTime da posição
+            indices, next_cursor = self._page(self.updated, params, 50)
+            stop_order_types = ('', 'StopLoss', 'TakeProfit', 'TrailingStop', '')
+            create_types = ('CreateByUser', 'CreateByStopLoss', 'CreateByTakeProfit', 'CreateByTrailingStop',
+                            'CreateByLiq')
+            rows = [{
+                'orderId': f"synthetic-{i}",
+                'symbol': self.symbols[self.symbol[i]],
+                'side': 'Sell' if self.side[i] == 'Buy' else 'Buy',
+                'orderType': 'Market',
+                'orderStatus': 'Filled',
+                'stopOrderType': stop_order_types[self.exit_kind[i]],
+                'orderLinkId': '',
+                'createType': create_types[self.exit_kind[i]],
+                'qty': str(self.qty[i]),
+                'reduceOnly': True,
+                'createdTime': str(self.created[i]),
+                'updatedTime': str(self.updated[i]),
+            } for i in indices.tolist()]
+            return _ok({'category': 'linear', 'list': rows, 'nextPageCursor': next_cursor})
+
+        if method_name == 'get_deposit_records':
+            indices, next_cursor = self._page(self.deposit_times, params, 50)
+            rows = [{'coin': 'USDT', 'chain': 'TRX', 'amount': '500', 'txID': f"deposit-{i}", 'status': 3,
+                     'toAddress': '', 'successAt': str(self.deposit_times[i])} for i in indices.tolist()]
+            return _ok({'rows': rows, 'nextPageCursor': next_cursor})
+
+        if method_name == 'get_withdrawal_records':
+            indices, next_cursor = self._page(self.withdrawal_times, params, 50)
+            rows = [{'coin': 'USDT', 'chain': 'TRX', 'amount': '200', 'txID': f"withdrawal-{i}",
+                     'status': 'success', 'toAddress': '', 'updateTime': str(self.withdrawal_times[i])}
+                    for i in indices.tolist()]
+            return _ok({'rows': rows, 'nextPageCursor': next_cursor})
+
+        return _error(10001, f"Método não suportado: {method_name}")
+
+
+class ReplayServer:
+    """
+    Servidor HTTP local com os endpoints de ENDPOINTS, servindo as respostas de uma conta
+    (FixtureAccount ou SyntheticAccount).
+    :param latency: Atraso fixo por requisição, em segundos.
+    :param rate_limit: Requisições por segundo por endpoint e API Key; acima disso a resposta
+                       é o erro 10006, como na Bybit. None desativa o limite.
+    :param error_rate: Probabilidade de responder 10006 mesmo dentro do limite.
+    """
+
+    def __init__(self, account, host='127.0.0.1', port=0, latency=0.0, rate_limit=None, error_rate=0.0, seed=0):
+        self.account = account
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.stats = {'requests': 0, 'rate_limited': 0}
+        self._random = random.Random(seed)
+        self._windows = {}  # (api key, caminho) -> (segundo atual, requisições nele)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, body, headers = replay.handle(self.path, self.headers.get('X-BAPI-API-KEY', ''))
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logging.debug(f"bybit_replay: {format % args}")
+
+        return Handler
+
+    def _check_rate_limit(self, api_key, path):
+        """
+        :return: (dentro do limite?, cabeçalhos X-Bapi-Limit-*)
+        """
+        now_ms = int(time.time() * 1000)
+        second = now_ms // 1000
+        with self._lock:
+            self.stats['requests'] += 1
+            window_second, count = self._windows.get((api_key, path), (second, 0))
+            if window_second != second:
+                window_second, count = second, 0
+            count += 1
+            self._windows[(api_key, path)] = (window_second, count)
+            injected = self.error_rate and self._random.random() < self.error_rate
+        if self.rate_limit is None:
+            return not injected, {}
+        headers = {
+            'X-Bapi-Limit': str(self.rate_limit),
+            'X-Bapi-Limit-Status': str(max(self.rate_limit - count, 0)),
+            'X-Bapi-Limit-Reset-Timestamp': str((second + 1) * 1000),
+        }
+        return count <= self.rate_limit and not injected, headers
+
+    def handle(self, raw_path, api_key=''):
+        """
+        Responde uma requisição GET.
+        :return: (status HTTP, corpo JSON, cabeçalhos extras)
+        """
+        parts = urlsplit(raw_path)
+        method_name = ENDPOINTS.get(parts.path)
+        if method_name is None:
+            return 404, _error(10001, f"Endpoint não suportado: {parts.path}"), {}
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        allowed, headers = self._check_rate_limit(api_key, parts.path)
+        if not allowed:
+            with self._lock:
+                self.stats['rate_limited'] += 1
+            headers.setdefault('X-Bapi-Limit-Reset-Timestamp', str(int(time.time() * 1000) + 200))
+            return 200, _error(10006, 'Too many visits!'), headers
+
+        max_window = MAX_WINDOW_MS.get(method_name)
+        if max_window and 'startTime' in params and 'endTime' in params \
+                and int(params['endTime']) - int(params['startTime']) > max_window:
+            return 200, _error(10001, 'The time range between startTime and endTime cannot exceed the limit.'), headers
+
+        return 200, self.account.respond(method_name, params), headers
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bybit-replay', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Atende no thread atual até Ctrl+C (usado pelo comando serve).
+        """
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _date_ms(date_str, end_of_day=False):
+    date = datetime.strptime(date_str, '%Y-%m-%d')
+    return int(date.timestamp() * 1000) + (86_400_000 - 1 if end_of_day else 0)
+
+
+def cmd_record(args):
+    from bybit_client import get_session
+    from fetch_orchestrator import fetch_analysis_inputs
+    from order_history import OrderCache
+    from position_cache import ClosedPositionCache
+
+    api_key, api_secret = os.environ.get('BYBIT_API_KEY'), os.environ.get('BYBIT_API_SECRET')
+    if not (api_key and api_secret):
+        raise SystemExit('Erro: defina BYBIT_API_KEY e BYBIT_API_SECRET para gravar.')
+
+    session = RecordingSession(get_session(api_key, api_secret), args.output)
+    try:
+        # Caches de posições e de ordens vazios e descartáveis: todas as páginas são buscadas e
+        # gravadas, com as mesmas janelas de uma análise (sem streaming) em um cache limpo,
+        # independentemente do que já estiver no cache desta máquina
+        with tempfile.TemporaryDirectory(prefix='bybit_record_') as directory:
+            fetch_analysis_inputs(api_key, api_secret, args.start, args.end, session=session,
+                                  closed_position_cache=ClosedPositionCache(os.path.join(directory, 'positions.sqlite3')),
+                                  order_cache=OrderCache(os.path.join(directory, 'orders.sqlite3')))
+    finally:
+        session.close()
+    print(f"{session.recorded} respostas gravadas em {args.output}")
+    return 0
+
+
+def cmd_serve(args):
+    if args.fixture:
+        account = FixtureAccount(args.fixture)
+    else:
+        if not (args.start and args.end):
+            raise SystemExit('Erro: --synthetic requer --start e --end.')
+        account = SyntheticAccount(args.synthetic, _date_ms(args.start), _date_ms(args.end, end_of_day=True),
+                                   n_symbols=args.symbols, seed=args.seed)
+
+    server = ReplayServer(account, host=args.host, port=args.port, latency=args.latency,
+                          rate_limit=args.rate_limit, error_rate=args.error_rate, seed=args.seed)
+    print(f"Servindo em {server.url} (use BYBIT_API_ENDPOINT={server.url}). Ctrl+C para encerrar.")
+    server.serve_forever()
+    print(f"\n{server.stats['requests']} requisições, {server.stats['rate_limited']} limitadas.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gravação e reprodução local da API da Bybit.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help='Grava as respostas reais de uma conta.')
+    record.add_argument('--start', required=True)
+    record.add_argument('--end', required=True)
+    record.add_argument('--output', required=True)
+
+    serve = subparsers.add_parser('serve', help='Serve uma gravação ou uma conta sintética.')
+    source = serve.add_mutually_exclusive_group(required=True)
+    source.add_argument('--fixture', help='Arquivo gravado com o comando record.')
+    source.add_argument('--synthetic', type=int, metavar='N', help='Conta sintética com N posições fechadas.')
+    serve.add_argument('--symbols', type=int, default=50)
+    serve.add_argument('--start')
+    serve.add_argument('--end')
+    serve.add_argument('--seed', type=int, default=42)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--latency', type=float, default=0.0, help='Atraso por requisição, em segundos.')
+    serve.add_argument('--rate-limit', type=int, default=None, help='Requisições/s por endpoint (erro 10006 acima).')
+    serve.add_argument('--error-rate', type=float, default=0.0, help='Probabilidade de 10006 aleatório.')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    return cmd_record(args) if args.command == 'record' else cmd_serve(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
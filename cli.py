@@ -0,0 +1,224 @@
+# cli.py
+"""
+Execução sem interface web: busca, analisa e exporta os resultados para arquivos.
+
+Uso:
+    python cli.py analyze --start 2024-01-01 --end 2024-03-31 [--leverage 10] [--format csv|json|parquet]
+                          [--output-dir relatorio] [--from-cache] [--streaming] [--blacklist BTCUSDT,ETHUSDT]
+    python cli.py batch --accounts contas.json --start 2024-01-01 --end 2024-03-31
+
+As credenciais vêm de --api-key/--api-secret ou das variáveis BYBIT_API_KEY/BYBIT_API_SECRET.
+Com --from-cache nada é buscado na API: as posições e as ordens de fechamento vêm do cache
+local (position_cache.py e order_history.py) e basta a API Key (ou --account) para
+identificar a conta.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+
+# pandas, pybit e os módulos de análise são importados apenas dentro dos comandos,
+# para que o início (e o --help) não pague por eles; o Flask nunca é importado.
+
+EXPORT_FORMATS = ('csv', 'json', 'parquet')
+
+
+def _check_format(export_format):
+    if export_format == 'parquet' and not (importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet')):
+        raise SystemExit("Erro: o formato parquet requer o pacote 'pyarrow' (pip install pyarrow).")
+
+
+def _write_table(df, path_without_extension, export_format):
+    path = f"{path_without_extension}.{export_format}"
+    if export_format == 'csv':
+        df.to_csv(path, index=False)
+    elif export_format == 'json':
+        df.to_json(path, orient='records', date_format='iso', force_ascii=False, indent=2)
+    else:
+        df.to_parquet(path, index=False)
+    return path
+
+
+def export_results(results, output_dir, export_format):
+    """
+    Grava KPIs, rankings, resumo por tipo de saída, séries temporais (curva de capital e
+    PnL por dia/semana/mês) e a tabela de trades em `output_dir`.
+    :return: Lista dos arquivos gravados.
+    """
+    import pandas as pd
+
+    os.makedirs(output_dir, exist_ok=True)
+    tables = {
+        'kpis': pd.DataFrame([results['kpis']]),
+        'winners': pd.DataFrame(results['winners_summary']),
+        'losers': pd.DataFrame(results['losers_summary']),
+        'exit_types': pd.DataFrame(results['exit_type_summary']),
+    }
+    time_series = results.get('time_series')
+    if time_series and time_series['equity_curve']:
+        tables['equity_curve'] = pd.DataFrame(time_series['equity_curve'])
+        for period in ('daily', 'weekly', 'monthly'):
+            tables[f"pnl_{period}"] = pd.DataFrame(time_series[period])
+    if len(results['all_trades']):
+        trades = results['all_trades'].to_frame()
+        # Categorias viram texto para que CSV/JSON/Parquet fiquem legíveis em qualquer ferramenta
+        tables['trades'] = trades.astype({column: str for column in ('symbol', 'position_side', 'exit_type')})
+
+    written = []
+    for name, df in tables.items():
+        if name == 'kpis' and export_format == 'json':
+            # Em JSON os KPIs são um objeto, não uma lista de uma linha
+            path = os.path.join(output_dir, 'kpis.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({key: value.item() if hasattr(value, 'item') else value
+                           for key, value in results['kpis'].items()}, f, indent=2)
+            written.append(path)
+            continue
+        written.append(_write_table(df, os.path.join(output_dir, name), export_format))
+    return written
+
+
+def _apply_blacklist(results, blacklist):
+    """
+    Tira os símbolos da blacklist de todo o resultado exportado: KPIs e rankings (a partir
+    do índice de agregados), tabela de trades, cubo e séries temporais. Sem os trades (modo
+    streaming), as séries são refeitas a partir do cubo, com resolução diária.
+    """
+    import numpy as np
+    from analysis import summarize_symbol_aggregates
+    from cube import cube_daily
+    from timeseries import time_series_from_daily, trades_time_series
+
+    blacklist = set(blacklist)
+    results.update(summarize_symbol_aggregates(results['symbol_aggregates'], blacklist))
+    trades = results['all_trades']
+    if len(trades):
+        blocked = [code for code, symbol in enumerate(trades.categories('symbol')) if symbol in blacklist]
+        results['all_trades'] = trades.take(np.flatnonzero(~np.isin(trades.codes('symbol'), blocked)))
+        results['time_series'] = trades_time_series(results['all_trades'])
+    cube = results.get('cube')
+    if cube is not None:
+        results['cube'] = cube[~cube.index.get_level_values('symbol').isin(list(blacklist))]
+        if not len(trades):
+            results['time_series'] = time_series_from_daily(cube_daily(results['cube']))
+    return results
+
+
+def _credentials(args):
+    api_key = args.api_key or os.environ.get('BYBIT_API_KEY')
+    api_secret = args.api_secret or os.environ.get('BYBIT_API_SECRET')
+    return api_key, api_secret
+
+
+def _load_from_cache(args, api_key):
+    from bybit_client import _date_range_ms
+    from order_history import join_cached_exit_orders
+    from position_cache import ClosedPositionCache, account_id
+
+    account = args.account or account_id(api_key)
+    cache = ClosedPositionCache()
+    if cache.get_sync_state(account) is None:
+        raise SystemExit(f"Erro: a conta {account} não tem posições no cache local.")
+    # Ordens de fechamento já no cache dão o tipo de saída (StopLoss, TakeProfit...)
+    return join_cached_exit_orders(cache.query(account, 'linear', *_date_range_ms(args.start, args.end)), account)
+
+
+def cmd_analyze(args):
+    _check_format(args.format)
+    api_key, api_secret = _credentials(args)
+    if args.from_cache:
+        if not (api_key or args.account):
+            raise SystemExit('Erro: informe --api-key (ou BYBIT_API_KEY) ou --account para ler do cache.')
+    elif not (api_key and api_secret):
+        raise SystemExit('Erro: informe --api-key/--api-secret ou BYBIT_API_KEY/BYBIT_API_SECRET.')
+
+    from analysis import StreamingClosedPositionsAnalyzer, process_closed_positions_data
+
+    started = time.perf_counter()
+    if args.from_cache:
+        closed_positions = _load_from_cache(args, api_key)
+        if closed_positions.empty:
+            print('Nenhuma posição fechada encontrada no período especificado.', file=sys.stderr)
+            return 1
+        results = process_closed_positions_data(closed_positions, args.leverage)
+    else:
+        from fetch_orchestrator import fetch_analysis_inputs
+
+        if args.streaming:
+            analyzer = StreamingClosedPositionsAnalyzer(args.leverage)
+            inputs = fetch_analysis_inputs(api_key, api_secret, args.start, args.end, on_page=analyzer.add_page)
+            if analyzer.rows_processed == 0:
+                print('Nenhuma posição fechada encontrada no período especificado.', file=sys.stderr)
+                return 1
+            results = analyzer.result(inputs['account_balance'], inputs['transactions_df'])
+        else:
+            inputs = fetch_analysis_inputs(api_key, api_secret, args.start, args.end)
+            if inputs['closed_positions'].empty:
+                print('Nenhuma posição fechada encontrada no período especificado.', file=sys.stderr)
+                return 1
+            results = process_closed_positions_data(inputs['closed_positions'], args.leverage,
+                                                    inputs['account_balance'], inputs['transactions_df'])
+
+    if args.blacklist:
+        blacklist = [symbol.strip() for symbol in args.blacklist.split(',') if symbol.strip()]
+        _apply_blacklist(results, blacklist)
+
+    written = export_results(results, args.output_dir, args.format)
+
+    kpis = results['kpis']
+    print(f"Trades: {kpis['total_trades']}  PnL: {kpis['total_pnl']:.4f} USDT  "
+          f"Acerto: {kpis['win_rate']:.2f}%  ROI: {kpis['avg_roi']:.2f}%")
+    if results.get('time_series'):
+        print(f"Drawdown máximo: {results['time_series']['max_drawdown']['value']:.4f} USDT")
+    for path in written:
+        print(f"  {path}")
+    print(f"Concluído em {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+def cmd_batch(argv):
+    import batch
+    return batch.main(argv)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Bybit Trade Analyzer sem interface web.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze = subparsers.add_parser('analyze', help='Busca, analisa e exporta uma conta.')
+    analyze.add_argument('--start', required=True, help='Data inicial (AAAA-MM-DD).')
+    analyze.add_argument('--end', required=True, help='Data final (AAAA-MM-DD).')
+    analyze.add_argument('--leverage', type=float, default=10)
+    analyze.add_argument('--api-key')
+    analyze.add_argument('--api-secret')
+    analyze.add_argument('--account', help='Identificador da conta no cache (alternativa à API Key com --from-cache).')
+    analyze.add_argument('--from-cache', action='store_true', help='Lê as posições do cache local, sem chamar a API.')
+    analyze.add_argument('--streaming', action='store_true',
+                         help='Agrega página a página (menos memória; não exporta a tabela de trades).')
+    analyze.add_argument('--blacklist', help='Símbolos excluídos dos KPIs e rankings, separados por vírgula.')
+    analyze.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    analyze.add_argument('--output-dir', default='relatorio')
+    analyze.add_argument('-v', '--verbose', action='store_true')
+
+    subparsers.add_parser('batch', help='Análise em lote de várias contas (argumentos de batch.py).',
+                          add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    if argv[:1] == ['batch']:
+        return cmd_batch(argv[1:])
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    return cmd_analyze(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# cube.py
+"""
+Cubo de agregados por (symbol, position_side, exit_type, day): somas de PnL, margem e
+nocional, vitórias e número de trades de cada combinação.
+
+O cubo é montado uma vez, em uma passada vetorizada sobre as colunas (códigos das categorias
+combinados em uma chave int64 e somados com np.bincount), e qualquer recorte usado no painel
+(Long x Short por símbolo, semanas por tipo de saída, o índice por (symbol, exit_type) da
+blacklist) é uma soma sobre as linhas do cubo, sem voltar aos trades. Todas as medidas são
+aditivas: cubos de páginas ou contas diferentes são somados com DataFrame.add.
+
+Trades sem instante de saída ficam no dia NAT_MS: entram nos totais, mas não nos períodos.
+"""
+import numpy as np
+import pandas as pd
+
+from timeseries import DAY_MS, PERIODS, _period_starts
+from trade_table import NAT_MS
+
+DIMENSIONS = ('symbol', 'position_side', 'exit_type', 'day')
+MEASURES = ('total_pnl_net', 'total_margin', 'total_notional', 'win_count', 'trade_count')
+COUNT_MEASURES = ('win_count', 'trade_count')
+
+# Dimensões aceitas em roll_up: as do cubo, com o dia trocado pelo período ('period')
+ROLL_UP_DIMENSIONS = ('symbol', 'position_side', 'exit_type', 'period')
+
+
+def _factorized(trades, name):
+    """
+    :return: (códigos int64, categorias em ordem alfabética) da coluna.
+    """
+    if hasattr(trades, 'codes'):
+        # TradeTable: categorias já fatoradas com sort=True
+        return trades.codes(name).astype('int64'), np.asarray(trades.categories(name), dtype=object)
+    codes, categories = pd.factorize(np.asarray(trades[name], dtype=object), sort=True)
+    return codes.astype('int64'), np.asarray(categories, dtype=object)
+
+
+def _exit_days(trades):
+    exit_ms = np.asarray(trades['exit_time'])
+    if exit_ms.dtype.kind == 'M':
+        exit_ms = exit_ms.astype('datetime64[ms]').astype('int64')
+    exit_ms = exit_ms.astype('int64')
+    return np.where(exit_ms == NAT_MS, NAT_MS, exit_ms // DAY_MS)
+
+
+def empty_cube():
+    index = pd.MultiIndex.from_arrays([np.array([], dtype=object)] * 3 + [np.array([], dtype='int64')],
+                                      names=DIMENSIONS)
+    return pd.DataFrame({measure: np.array([], dtype='int64' if measure in COUNT_MEASURES else 'float64')
+                         for measure in MEASURES}, index=index)
+
+
+def build_cube(trades):
+    """
+    Monta o cubo a partir dos trades.
+    :param trades: TradeTable ou DataFrame com as colunas symbol, position_side, exit_type,
+                   exit_time (ms int64 ou datetime64), pnl_net, margem e valor_nocional.
+    :return: DataFrame indexado por DIMENSIONS (ordenado), com as colunas MEASURES.
+    """
+    if len(trades) == 0:
+        return empty_cube()
+
+    codes, categories = zip(*(_factorized(trades, name) for name in DIMENSIONS[:3]))
+    day_codes, days = pd.factorize(_exit_days(trades), sort=True)
+    codes += (day_codes.astype('int64'),)
+    categories += (np.asarray(days, dtype='int64'),)
+
+    # Chave única da combinação: dígitos em base mista, na ordem das dimensões
+    sizes = [len(values) for values in categories]
+    key = codes[0]
+    for code, size in zip(codes[1:], sizes[1:]):
+        key = key * size + code
+    cells, inverse = np.unique(key, return_inverse=True)
+
+    pnl_net = np.asarray(trades['pnl_net'], dtype='float64')
+    weights = {
+        # Como no groupby().sum() do pandas, valores ausentes contam como zero
+        'total_pnl_net': np.nan_to_num(pnl_net),
+        'total_margin': np.nan_to_num(np.asarray(trades['margem'], dtype='float64')),
+        'total_notional': np.nan_to_num(np.asarray(trades['valor_nocional'], dtype='float64')),
+        'win_count': pnl_net > 0,
+        'trade_count': None,
+    }
+    data = {}
+    for measure, weight in weights.items():
+        sums = np.bincount(inverse, weights=weight, minlength=len(cells))
+        data[measure] = sums.astype('int64') if measure in COUNT_MEASURES else sums
+
+    levels = []
+    for size, values in zip(reversed(sizes), reversed(categories)):
+        cells, code = np.divmod(cells, size)
+        levels.append(values[code])
+    index = pd.MultiIndex.from_arrays(levels[::-1], names=DIMENSIONS)
+    return pd.DataFrame(data, index=index)
+
+
+def add_cubes(cube, other):
+    """
+    Soma dois cubos (ex: páginas do modo streaming), mantendo as contagens inteiras.
+    """
+    total = cube.add(other, fill_value=0)
+    return total.astype({measure: 'int64' for measure in COUNT_MEASURES})
+
+
+def aggregate(cube, dimensions):
+    """
+    Somas do cubo agrupadas pelas dimensões (níveis do índice), sem métricas derivadas.
+    Ex: aggregate(cube, ['symbol', 'exit_type']) é o índice de agregados da blacklist.
+    """
+    return cube.groupby(level=list(dimensions), sort=True).sum()
+
+
+def cube_daily(cube):
+    """
+    Agregados por dia no formato de time_series_from_daily (colunas pnl_net, trade_count e
+    win_count, índice 'day'), sem os trades sem instante de saída.
+    """
+    daily = aggregate(cube, ['day'])
+    daily = daily[daily.index != NAT_MS]
+    return daily[['total_pnl_net', 'trade_count', 'win_count']].rename(columns={'total_pnl_net': 'pnl_net'})
+
+
+def roll_up(cube, by, period='daily', filters=None, blacklist=None):
+    """
+    Recorte do cubo com métricas derivadas.
+    :param by: Dimensões do agrupamento (de ROLL_UP_DIMENSIONS); vazio = uma linha com o total.
+    :param period: Granularidade da dimensão 'period' ('daily', 'weekly' ou 'monthly').
+    :param filters: {dimensão: [valores aceitos]} aplicados antes do agrupamento.
+    :param blacklist: Símbolos excluídos.
+    :return: DataFrame com uma linha por combinação de `by` (colunas `by` + MEASURES +
+             win_rate e roi_agregado). 'period' é o primeiro dia do período (AAAA-MM-DD).
+    """
+    by = list(by)
+    if any(dimension not in ROLL_UP_DIMENSIONS for dimension in by):
+        raise ValueError(f"Dimensões aceitas: {ROLL_UP_DIMENSIONS}")
+    if period not in PERIODS:
+        raise ValueError(f"Períodos aceitos: {PERIODS}")
+
+    keep = np.ones(len(cube), dtype=bool)
+    for dimension, values in (filters or {}).items():
+        keep &= cube.index.get_level_values(dimension).isin(list(values))
+    if blacklist:
+        keep &= ~cube.index.get_level_values('symbol').isin(list(blacklist))
+    days = cube.index.get_level_values('day').to_numpy(dtype='int64')
+    if 'period' in by:
+        keep &= days != NAT_MS
+    cube, days = cube[keep], days[keep]
+
+    keys = [cube.index.get_level_values(dimension).to_numpy(dtype=object) if dimension != 'period'
+            else _period_starts(days, period).astype('datetime64[D]').astype(str).astype(object)
+            for dimension in by]
+    if keys:
+        rolled = cube.groupby(keys, sort=True).sum()
+        rolled.index.names = by
+        rolled = rolled.reset_index()
+    else:
+        rolled = cube.sum().to_frame().T.astype({measure: 'int64' for measure in COUNT_MEASURES})
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rolled['win_rate'] = np.where(rolled['trade_count'] > 0,
+                                      rolled['win_count'] / rolled['trade_count'] * 100, 0.0)
+        rolled['roi_agregado'] = np.where(rolled['total_margin'] > 0,
+                                          rolled['total_pnl_net'] / rolled['total_margin'] * 100, 0.0)
+    return rolled
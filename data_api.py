@@ -0,0 +1,178 @@
+# data_api.py
+"""
+Consultas paginadas das tabelas de resultado para a API JSON (/api/results/<tabela> e
+/api/trades/<symbol>). Paginação, ordenação e busca são feitas no servidor, no protocolo
+server-side do DataTables, para que o navegador receba apenas a página exibida.
+
+Parâmetros aceitos (os do DataTables ou os equivalentes simples):
+    start, length                       -> intervalo de linhas (length=-1: todas, até MAX_PAGE_LENGTH)
+    search[value] ou search             -> texto buscado nas colunas de texto
+    order[0][column] + columns[i][data] -> coluna de ordenação (ou sort=<coluna>)
+    order[0][dir] ou dir                -> 'asc' ou 'desc'
+    draw                                -> devolvido como veio (controle do DataTables)
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from trade_table import NAT_MS
+
+# Maior página aceita em uma requisição
+MAX_PAGE_LENGTH = 5000
+
+# Colunas expostas por tabela (a ordenação só é aceita nelas)
+SYMBOL_SUMMARY_COLUMNS = ('symbol', 'total_pnl_net', 'roi_agregado', 'win_rate', 'trade_count')
+EXIT_TYPE_SUMMARY_COLUMNS = ('exit_type', 'total_pnl_net', 'roi_agregado', 'win_rate', 'exit_count')
+TRANSACTION_COLUMNS = ('timestamp', 'type', 'coin', 'amount', 'status', 'tx_id', 'from_account', 'to_account')
+TRADE_COLUMNS = ('entry_time', 'exit_time', 'duration', 'position_side', 'quantity', 'avg_entry_price',
+                 'exit_price', 'valor_nocional', 'margem', 'pnl_net', 'roi', 'exit_type')
+
+# Colunas de texto consideradas na busca
+SEARCH_COLUMNS = {
+    'winners': ('symbol',),
+    'losers': ('symbol',),
+    'exit_types': ('exit_type',),
+    'transactions': ('type', 'coin', 'status', 'tx_id'),
+    'trades': ('position_side', 'exit_type'),
+}
+
+# Tabelas de /api/results: nome -> (chave no resultado, colunas, ordenação padrão, decrescente)
+# As movimentações mantêm a ordem da API (mais recentes primeiro).
+RESULT_TABLES = {
+    'winners': ('winners_summary', SYMBOL_SUMMARY_COLUMNS, 'total_pnl_net', True),
+    'losers': ('losers_summary', SYMBOL_SUMMARY_COLUMNS, 'total_pnl_net', False),
+    'exit_types': ('exit_type_summary', EXIT_TYPE_SUMMARY_COLUMNS, 'total_pnl_net', True),
+    'transactions': (None, TRANSACTION_COLUMNS, None, False),
+}
+
+TableQuery = namedtuple('TableQuery', 'draw start length search sort descending')
+
+
+def parse_table_query(args, columns, default_length=100, default_sort=None, default_descending=False):
+    """
+    Lê os parâmetros de paginação, ordenação e busca da requisição.
+    :param args: request.args (ou qualquer mapeamento com .get).
+    :param columns: Colunas em que a ordenação é permitida; outras são ignoradas.
+    :return: TableQuery (sort é None quando a ordem original deve ser mantida).
+    """
+    def get_int(name, default):
+        try:
+            return int(args.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    length = get_int('length', default_length)
+    if length < 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+    search = (args.get('search[value]') or args.get('search') or '').strip()
+
+    sort = args.get('sort')
+    if sort is None and args.get('order[0][column]') is not None:
+        sort = args.get(f"columns[{get_int('order[0][column]', -1)}][data]")
+    direction = args.get('order[0][dir]') or args.get('dir')
+    if sort not in columns:
+        sort, descending = default_sort, default_descending
+    else:
+        descending = direction == 'desc'
+
+    return TableQuery(draw=get_int('draw', 0), start=max(get_int('start', 0), 0), length=length,
+                      search=search, sort=sort, descending=descending)
+
+
+def _plain(value):
+    """
+    Converte escalares NumPy para tipos do Python e valores não finitos para None (JSON válido).
+    """
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def query_records(records, columns, query, search_columns=()):
+    """
+    Aplica busca, ordenação e paginação a uma lista de dicionários (resumos, movimentações).
+    :return: (total de linhas, total após a busca, linhas da página com apenas `columns`)
+    """
+    total = len(records)
+    if query.search:
+        needle = query.search.lower()
+        records = [record for record in records
+                   if any(needle in str(record.get(column) or '').lower() for column in search_columns)]
+    filtered = len(records)
+
+    if query.sort is not None:
+        # Valores ausentes sempre por último, nos dois sentidos
+        present = [record for record in records if _plain(record.get(query.sort)) is not None]
+        missing = [record for record in records if _plain(record.get(query.sort)) is None]
+        present.sort(key=lambda record: record[query.sort], reverse=query.descending)
+        records = present + missing
+
+    page = records[query.start:query.start + query.length]
+    return total, filtered, [{column: _plain(record.get(column)) for column in columns} for record in page]
+
+
+def _trade_sort_key(table, column):
+    """
+    :return: (chave de ordenação, máscara dos valores ausentes)
+    """
+    if column == 'duration':
+        entry, exit_ = table.column('entry_time'), table.column('exit_time')
+        missing = (entry == NAT_MS) | (exit_ == NAT_MS)
+        return np.where(missing, 0, exit_ - entry), missing
+    if column in ('position_side', 'exit_type'):
+        # Códigos seguem a ordem alfabética das categorias (factorize com sort=True)
+        codes = table.codes(column)
+        return codes, codes < 0
+    values = table.column(column)
+    if values.dtype.kind == 'f':
+        return values, np.isnan(values)
+    return values, values == NAT_MS
+
+
+def query_trades(table, query):
+    """
+    Aplica busca, ordenação e paginação a uma TradeTable (ex: a partição de um símbolo)
+    sem montar linhas além das da página.
+    :return: (total de linhas, total após a busca, linhas da página como dicionários JSON)
+    """
+    total = len(table)
+    if query.search and total:
+        needle = query.search.lower()
+        mask = np.zeros(total, dtype=bool)
+        for column in SEARCH_COLUMNS['trades']:
+            matching = [code for code, value in enumerate(table.categories(column)) if needle in str(value).lower()]
+            if matching:
+                mask |= np.isin(table.codes(column), matching)
+        table = table.take(np.flatnonzero(mask))
+    filtered = len(table)
+
+    if query.sort is not None and filtered:
+        # Valores ausentes sempre por último, nos dois sentidos, como em query_records
+        key, missing = _trade_sort_key(table, query.sort)
+        present = np.flatnonzero(~missing)
+        present = present[np.argsort(-key[present] if query.descending else key[present], kind='stable')]
+        order = np.concatenate([present, np.flatnonzero(missing)])
+        table = table.take(order[query.start:query.start + query.length])
+    else:
+        table = table[query.start:query.start + query.length]
+
+    rows = []
+    for row in table.rows():
+        record = {}
+        for column in TRADE_COLUMNS:
+            value = row[column]
+            if column in ('entry_time', 'exit_time'):
+                value = None if value is None or value != value else value.strftime('%Y-%m-%d %H:%M:%S')
+            record[column] = _plain(value)
+        rows.append(record)
+    return total, filtered, rows
+
+
+def table_payload(query, total, filtered, data):
+    """
+    Resposta no formato esperado pelo DataTables.
+    """
+    return {'draw': query.draw, 'recordsTotal': total, 'recordsFiltered': filtered, 'data': data}
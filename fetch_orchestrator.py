@@ -0,0 +1,124 @@
+# fetch_orchestrator.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import metrics
+from bybit_client import (_date_range_ms, fetch_account_balance, fetch_account_transactions,
+                          fetch_closed_positions_between, get_session)
+from order_history import FetchedWindows, enrich_exit_orders
+from position_cache import fetch_closed_positions_cached
+
+
+def _timed_call(source, func, *args, **kwargs):
+    """
+    Executa a função medindo o tempo gasto (também registrado como a etapa 'fetch.<source>').
+    :return: (resultado, exceção ou None, segundos)
+    """
+    start = time.perf_counter()
+    with metrics.span(f"fetch.{source}"):
+        try:
+            return func(*args, **kwargs), None, time.perf_counter() - start
+        except Exception as e:
+            return None, e, time.perf_counter() - start
+
+
+def _stream_closed_positions(session, start_date_str, end_date_str, on_page, progress=None):
+    fetch_closed_positions_between(session, *_date_range_ms(start_date_str, end_date_str),
+                                   on_page=on_page, progress=progress)
+
+
+def _enriching_pages(on_page, api_key, api_secret, session, order_cache=None):
+    """
+    Envolve o callback do modo streaming: cada página recebe os campos da ordem de
+    fechamento antes de ser entregue. As páginas compartilham os trechos do histórico já
+    buscados, e o cache já tem as ordens deles. Se a busca das ordens falhar, a página
+    segue sem eles.
+    """
+    fetched = FetchedWindows()
+
+    def enriched_page(positions):
+        try:
+            with metrics.span('fetch.order_history'):
+                positions = enrich_exit_orders(positions, api_key, api_secret, cache=order_cache, session=session,
+                                               fetched=fetched).to_dict('records')
+        except Exception as e:
+            logging.warning(f"Não foi possível buscar o histórico de ordens da página: {e}")
+        on_page(positions)
+    return enriched_page
+
+
+def fetch_analysis_inputs(api_key, api_secret, start_date_str, end_date_str, session=None, on_page=None,
+                          progress=None, closed_synced=False, closed_position_cache=None, order_cache=None):
+    """
+    Busca em paralelo as três fontes da análise: posições fechadas (obrigatória),
+    saldo da conta e movimentações (opcionais), compartilhando uma única sessão HTTP.
+    Em seguida, as posições fechadas recebem os campos da ordem de fechamento (histórico de
+    ordens, ver order_history.py), usados na classificação do tipo de saída.
+    Uma falha nas fontes opcionais (inclusive no histórico de ordens) não interrompe a
+    análise: o valor vira None (ou as posições ficam sem os campos) e o erro é registrado em 'errors'.
+    :param on_page: Modo streaming. As posições fechadas são buscadas direto da API e cada
+                    página é entregue ao callback (ex: StreamingClosedPositionsAnalyzer.add_page);
+                    'closed_positions' volta como None.
+    :param progress: Acompanhamento da busca das posições fechadas (ver jobs.JobProgress).
+    :param closed_synced: O cache de posições já foi sincronizado para o período
+                          (position_cache.sync_closed_positions); as posições vêm só do SQLite.
+    :param closed_position_cache: ClosedPositionCache das posições fechadas. Padrão: o do
+                                  diretório do cache.
+    :param order_cache: OrderCache das ordens de fechamento. Padrão: o do diretório do cache.
+    :return: Dicionário com closed_positions, account_balance, transactions_df,
+             timings ({fonte: segundos}) e errors ({fonte: mensagem}).
+    """
+    if session is None:
+        session = get_session(api_key, api_secret)
+
+    if on_page is not None:
+        fetch_closed = partial(_stream_closed_positions, session, start_date_str, end_date_str,
+                               _enriching_pages(on_page, api_key, api_secret, session, order_cache),
+                               progress=progress)
+    else:
+        fetch_closed = partial(fetch_closed_positions_cached, api_key, api_secret,
+                               start_date_str, end_date_str, cache=closed_position_cache, session=session,
+                               progress=progress, sync=not closed_synced)
+
+    # in_context: as fontes registram spans e contadores no AnalysisMetrics de quem chamou
+    timed_call = metrics.in_context(_timed_call)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {
+            'closed_positions': executor.submit(timed_call, 'closed_positions', fetch_closed),
+            'account_balance': executor.submit(
+                timed_call, 'account_balance', fetch_account_balance, api_key, api_secret, session=session),
+            'transactions': executor.submit(
+                timed_call, 'transactions', fetch_account_transactions,
+                api_key, api_secret, start_date_str, end_date_str, session=session),
+        }
+        results = {source: future.result() for source, future in futures.items()}
+
+    closed_positions, closed_error, _ = results['closed_positions']
+    if closed_error is not None:
+        raise closed_error
+
+    # Tipo de saída: junta as posições às suas ordens de fechamento (só as que não estão no cache são buscadas)
+    if closed_positions is not None and not closed_positions.empty:
+        enriched, order_error, elapsed = timed_call('order_history', enrich_exit_orders, closed_positions,
+                                                    api_key, api_secret, cache=order_cache, session=session)
+        results['order_history'] = (None, order_error, elapsed)
+        if order_error is None:
+            closed_positions = enriched
+
+    timings = {source: round(elapsed, 3) for source, (_, _, elapsed) in results.items()}
+    errors = {source: str(error) for source, (_, error, _) in results.items() if error is not None}
+    logging.info(f"Tempo por fonte (s): {timings}")
+
+    for source in ('account_balance', 'transactions', 'order_history'):
+        if source in errors:
+            logging.warning(f"Não foi possível buscar {source}: {errors[source]}")
+
+    return {
+        'closed_positions': closed_positions,
+        'account_balance': results['account_balance'][0],
+        'transactions_df': results['transactions'][0],
+        'timings': timings,
+        'errors': errors,
+    }
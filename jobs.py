@@ -0,0 +1,207 @@
+# jobs.py
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from result_store import RESULT_TTL_SECONDS
+
+JOBS_DIR = os.environ.get(
+    'BYBIT_JOBS_DIR', os.path.join(os.environ.get('BYBIT_CACHE_DIR', './cache'), 'jobs'))
+
+# Análises executadas ao mesmo tempo por processo; as demais aguardam na fila
+MAX_CONCURRENT_JOBS = int(os.environ.get('BYBIT_MAX_JOBS', 2))
+
+# Um job "running" sem atualização por mais que isso é considerado perdido
+# (ex: o worker do gunicorn que o executava foi reiniciado)
+JOB_STALE_SECONDS = 10 * 60
+
+# Intervalo mínimo entre gravações do progresso em disco
+_PROGRESS_WRITE_INTERVAL = 0.5
+
+
+class JobError(Exception):
+    """
+    Erro esperado de um job; a mensagem é exibida ao usuário como está.
+    """
+
+
+class JobProgress:
+    """
+    Progresso de um job, atualizado pelas threads de busca e gravado periodicamente
+    no arquivo de status do job.
+    """
+
+    def __init__(self, manager, job_id):
+        self._manager = manager
+        self._job_id = job_id
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self.stage = 'queued'
+        self.windows_total = 0
+        self.windows_done = 0
+        self.rows = 0
+        self._stage_started_at = time.time()
+
+    def _changed(self, force=False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_write < _PROGRESS_WRITE_INTERVAL:
+                return
+            self._last_write = now
+            snapshot = self.snapshot(now)
+        self._manager._update(self._job_id, progress=snapshot)
+
+    def set_stage(self, stage):
+        with self._lock:
+            self.stage = stage
+            self._stage_started_at = time.time()
+        self._changed(force=True)
+
+    def add_windows(self, count):
+        with self._lock:
+            self.windows_total += count
+        self._changed()
+
+    def window_done(self):
+        with self._lock:
+            self.windows_done += 1
+        self._changed()
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows += count
+        self._changed()
+
+    def snapshot(self, now=None):
+        """
+        :return: Dicionário com stage, windows_total, windows_done, rows e eta_seconds
+                 (estimado pelo ritmo das janelas já concluídas; None enquanto não há base).
+        """
+        now = now or time.time()
+        eta = None
+        if self.stage == 'fetching' and 0 < self.windows_done <= self.windows_total:
+            elapsed = now - self._stage_started_at
+            eta = round(elapsed / self.windows_done * (self.windows_total - self.windows_done), 1)
+        return {
+            'stage': self.stage,
+            'windows_total': self.windows_total,
+            'windows_done': self.windows_done,
+            'rows': self.rows,
+            'eta_seconds': eta,
+        }
+
+
+class JobManager:
+    """
+    Executa funções demoradas (ex: a análise) em um pool de threads e publica o estado
+    de cada job em um arquivo JSON, de modo que qualquer worker do gunicorn consegue
+    responder à consulta de progresso.
+    """
+
+    def __init__(self, directory=None, max_workers=MAX_CONCURRENT_JOBS, ttl=RESULT_TTL_SECONDS):
+        self.directory = directory or JOBS_DIR
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='job')
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job_id, state):
+        path = self._path(job_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            state = self._read(job_id) or {'job_id': job_id}
+            state.update(changes)
+            state['updated_at'] = time.time()
+            self._write(job_id, state)
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Agenda func(*args, progress=JobProgress, **kwargs). O valor retornado por func
+        fica em 'result' no status do job e deve ser serializável em JSON.
+        :return: Identificador do job.
+        """
+        self.evict_expired()
+        job_id = uuid.uuid4().hex
+        progress = JobProgress(self, job_id)
+        now = time.time()
+        self._write(job_id, {
+            'job_id': job_id,
+            'status': 'queued',
+            'created_at': now,
+            'updated_at': now,
+            'progress': progress.snapshot(now),
+        })
+        self._executor.submit(self._run, job_id, progress, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, progress, func, args, kwargs):
+        started = time.time()
+        self._update(job_id, status='running')
+        try:
+            result = func(*args, progress=progress, **kwargs)
+        except Exception as e:
+            if not isinstance(e, JobError):
+                logging.exception(f"Job {job_id} falhou")
+            self._update(job_id, status='error', message=str(e), progress=progress.snapshot(),
+                         elapsed_seconds=round(time.time() - started, 3))
+            return
+        progress.stage = 'done'
+        self._update(job_id, status='done', result=result, progress=progress.snapshot(),
+                     elapsed_seconds=round(time.time() - started, 3))
+
+    def status(self, job_id):
+        """
+        :return: Estado do job (status, progress, message, result, ...) ou None se não existir.
+        """
+        if not job_id:
+            return None
+        state = self._read(job_id)
+        if state is None:
+            return None
+        # Só jobs em execução atualizam o progresso; um job na fila pode esperar o pool por mais tempo
+        if state['status'] == 'running' and time.time() - state['updated_at'] > JOB_STALE_SECONDS:
+            state['status'] = 'error'
+            state['message'] = 'A análise foi interrompida. Tente novamente.'
+        return state
+
+    def delete(self, job_id):
+        if not job_id:
+            return
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def evict_expired(self, now=None):
+        """
+        Remove os arquivos de status sem atualização há mais de `ttl` segundos.
+        """
+        now = now or time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
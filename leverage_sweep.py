@@ -0,0 +1,79 @@
+# leverage_sweep.py
+"""
+Simulação de alavancagem ("e se"): KPIs e ROI por símbolo para várias alavancagens de uma
+vez, a partir do índice de agregados já armazenado, sem buscar nem reprocessar os trades.
+
+O PnL, a taxa de acerto e o número de trades não dependem da alavancagem; só a margem
+muda, e ela é o valor nocional dividido pela alavancagem. Com o nocional somado por símbolo
+(coluna total_notional dos agregados), a grade inteira é uma única operação em matriz
+(alavancagens x símbolos).
+"""
+import numpy as np
+
+from analysis import _win_rate
+
+# Maior número de alavancagens avaliadas em uma chamada
+MAX_LEVERAGES = 500
+
+
+def _margin(notional, leverage):
+    # Mesma regra de _closed_positions_margin: alavancagem <= 0 equivale a 1x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(leverage > 0, notional / leverage, notional)
+
+
+def sweep_leverage(symbol_aggregates, leverages, overrides=None, blacklist=None):
+    """
+    Avalia a análise com cada alavancagem de `leverages`.
+    :param symbol_aggregates: Índice de agregados por (symbol, exit_type) do resultado.
+    :param leverages: Alavancagens padrão a avaliar (lista de números).
+    :param overrides: {symbol: alavancagem} fixa para alguns símbolos, em todos os pontos da grade.
+    :param blacklist: Símbolos excluídos (como na simulação com blacklist).
+    :return: {'leverages': [...], 'kpis': [KPIs por alavancagem],
+              'symbols': [{'symbol', 'total_pnl_net', 'trade_count', 'win_rate', 'leverage': [...], 'roi_agregado': [...]}]}
+              com as listas por símbolo na ordem de `leverages`.
+    """
+    leverages = np.asarray(leverages, dtype='float64')
+    if blacklist:
+        symbols = symbol_aggregates.index.get_level_values('symbol')
+        symbol_aggregates = symbol_aggregates[~symbols.isin(list(blacklist))]
+
+    by_symbol = symbol_aggregates.groupby(level='symbol').sum()
+    symbols = by_symbol.index.to_numpy(dtype=object)
+    pnl = by_symbol['total_pnl_net'].to_numpy(dtype='float64')
+    notional = by_symbol['total_notional'].to_numpy(dtype='float64')
+    trade_count = by_symbol['trade_count'].to_numpy(dtype='int64')
+    win_count = by_symbol['win_count'].to_numpy(dtype='int64')
+
+    # Alavancagem de cada (ponto da grade, símbolo): a da grade, ou a fixada para o símbolo
+    leverage_grid = np.repeat(leverages[:, None], len(symbols), axis=1)
+    if overrides:
+        fixed = np.array([overrides.get(symbol, np.nan) for symbol in symbols], dtype='float64')
+        leverage_grid = np.where(np.isnan(fixed)[None, :], leverage_grid, fixed[None, :])
+
+    margin = _margin(notional[None, :], leverage_grid)
+    total_margin = margin.sum(axis=1)
+    total_pnl = float(pnl.sum())
+    total_trades = int(trade_count.sum())
+    win_rate = float(win_count.sum() / total_trades * 100) if total_trades else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_roi = np.where(total_margin > 0, total_pnl / total_margin * 100, 0.0)
+        symbol_roi = np.where(margin > 0, pnl[None, :] / margin * 100, 0.0)
+
+    kpis = [
+        {'leverage': float(leverage), 'total_pnl': total_pnl, 'win_rate': win_rate,
+         'total_margin_cost': float(cost), 'total_trades': total_trades, 'avg_roi': float(roi)}
+        for leverage, cost, roi in zip(leverages, total_margin, avg_roi)
+    ]
+    symbol_win_rate = _win_rate(win_count, np.maximum(trade_count, 1))
+    order = np.argsort(-pnl, kind='stable')
+    return {
+        'leverages': leverages.tolist(),
+        'kpis': kpis,
+        'symbols': [
+            {'symbol': symbols[i], 'total_pnl_net': float(pnl[i]), 'trade_count': int(trade_count[i]),
+             'win_rate': float(symbol_win_rate[i]), 'leverage': leverage_grid[:, i].tolist(),
+             'roi_agregado': symbol_roi[:, i].tolist()}
+            for i in order
+        ],
+    }
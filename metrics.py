@@ -0,0 +1,278 @@
+# metrics.py
+"""
+Instrumentação do pipeline: spans de tempo por etapa, contadores (requisições à API,
+novas tentativas, linhas por página) e histogramas, expostos no formato texto do
+Prometheus em /metrics.
+
+Além do registro global do processo, cada análise pode ter um AnalysisMetrics próprio
+(ativado com `recording`), que soma os spans e contadores daquela análise para que
+sejam anexados ao resultado. O AnalysisMetrics ativo viaja em uma ContextVar; funções
+executadas em pools de threads precisam ser envolvidas com `in_context` para herdá-lo.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites dos histogramas de duração, em segundos
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Limites do histograma de linhas por página (a API devolve até 100 posições por página)
+PAGE_ROWS_BUCKETS = (0, 1, 10, 25, 50, 75, 100)
+
+# Métricas conhecidas: nome -> (tipo, descrição, limites dos buckets para histogramas)
+METRIC_DEFINITIONS = {
+    'bybit_api_calls_total': ('counter', 'Requisições enviadas à API da Bybit, por endpoint.', None),
+    'bybit_api_errors_total': ('counter', 'Requisições à API da Bybit que falharam, por endpoint.', None),
+    'bybit_api_retries_total': ('counter', 'Novas tentativas feitas pela pybit (ex: erro 10006).', None),
+    'bybit_api_rows_total': ('counter', 'Linhas recebidas da API da Bybit, por endpoint.', None),
+    'bybit_rate_limit_wait_seconds_total': ('counter', 'Tempo de espera no limitador de taxa, por endpoint.', None),
+    'bybit_api_request_duration_seconds': ('histogram', 'Duração das requisições à API, por endpoint.',
+                                           DURATION_BUCKETS),
+    'bybit_api_page_rows': ('histogram', 'Linhas por página recebida da API, por endpoint.', PAGE_ROWS_BUCKETS),
+    'bybit_stage_duration_seconds': ('histogram', 'Duração de cada etapa do pipeline de análise.',
+                                     DURATION_BUCKETS),
+    'bybit_analyses_total': ('counter', 'Análises executadas, por resultado.', None),
+    'bybit_result_cache_total': ('counter', 'Consultas ao cache compartilhado de resultados, por desfecho.', None),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas do processo, seguros para uso entre threads.
+    Com o gunicorn, cada worker tem o seu registro (o Dockerfile usa um único worker).
+    """
+
+    def __init__(self, definitions=METRIC_DEFINITIONS):
+        self.definitions = definitions
+        self._counters = {}    # (nome, rótulos) -> valor
+        self._histograms = {}  # (nome, rótulos) -> [contagens por bucket..., soma, total]
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self.definitions[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [0] * (len(buckets) + 2)
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    state[position] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def render(self):
+        """
+        :return: Texto no formato de exposição do Prometheus (text/plain; version=0.0.4).
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(state) for key, state in self._histograms.items()}
+
+        lines = []
+        for name, (kind, description, buckets) in self.definitions.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, label_key), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(label_key)} {_format_value(value)}")
+                continue
+            for (metric, label_key), state in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for position, bound in enumerate(buckets):
+                    lines.append(f"{name}_bucket{_format_labels(label_key, [('le', bound)])} {state[position]}")
+                lines.append(f"{name}_bucket{_format_labels(label_key, [('le', '+Inf')])} {state[-1]}")
+                lines.append(f"{name}_sum{_format_labels(label_key)} {_format_value(state[-2])}")
+                lines.append(f"{name}_count{_format_labels(label_key)} {state[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class AnalysisMetrics:
+    """
+    Spans e contadores de uma única análise, no formato anexado ao resultado:
+    {'stages': {etapa: segundos}, 'counters': {nome: valor}}.
+    Spans com o mesmo nome são somados (ex: todas as requisições de um endpoint, que
+    podem ter rodado em paralelo e por isso somar mais que o tempo total).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                'counters': {name: round(value, 4) if isinstance(value, float) else value
+                             for name, value in self.counters.items()},
+            }
+
+
+_current = contextvars.ContextVar('analysis_metrics', default=None)
+
+
+@contextmanager
+def recording(analysis_metrics):
+    """
+    Ativa `analysis_metrics` no contexto atual: spans e contadores registrados dentro
+    do bloco também são somados nele.
+    """
+    token = _current.set(analysis_metrics)
+    try:
+        yield analysis_metrics
+    finally:
+        _current.reset(token)
+
+
+def in_context(func):
+    """
+    Envolve `func` para executá-la no contexto de quem a envolveu (inclusive o
+    AnalysisMetrics ativo), mesmo quando chamada por threads de um pool.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # Cada chamada usa uma cópia: um mesmo Context não pode estar ativo em duas threads
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+def _short_name(name, labels):
+    """
+    Nome do contador no AnalysisMetrics: sem o prefixo 'bybit_' e o sufixo '_total',
+    seguido dos valores dos rótulos (ex: api_calls.get_closed_pnl).
+    """
+    name = name[len('bybit_'):] if name.startswith('bybit_') else name
+    name = name[:-len('_total')] if name.endswith('_total') else name
+    return '.'.join([name, *(str(value) for _, value in sorted(labels.items()))])
+
+
+def count(name, value=1, **labels):
+    """
+    Incrementa o contador no registro global e no AnalysisMetrics ativo.
+    """
+    REGISTRY.inc(name, value, **labels)
+    analysis_metrics = _current.get()
+    if analysis_metrics is not None:
+        analysis_metrics.count(_short_name(name, labels), value)
+
+
+def observe(name, value, **labels):
+    """
+    Registra uma observação em um histograma do registro global.
+    """
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def span(stage):
+    """
+    Mede a duração do bloco como a etapa `stage` (ex: 'analysis.prepare'), no histograma
+    bybit_stage_duration_seconds e no AnalysisMetrics ativo.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe('bybit_stage_duration_seconds', elapsed, stage=stage)
+        analysis_metrics = _current.get()
+        if analysis_metrics is not None:
+            analysis_metrics.add_stage(stage, elapsed)
+
+
+@contextmanager
+def api_call(endpoint):
+    """
+    Mede uma requisição à API: conta a chamada (e a falha, se houver exceção) e
+    registra a duração no histograma e como etapa 'api.<endpoint>'.
+    """
+    count('bybit_api_calls_total', endpoint=endpoint)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count('bybit_api_errors_total', endpoint=endpoint)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe('bybit_api_request_duration_seconds', elapsed, endpoint=endpoint)
+        analysis_metrics = _current.get()
+        if analysis_metrics is not None:
+            analysis_metrics.add_stage(f"api.{endpoint}", elapsed)
+
+
+def record_page(endpoint, rows):
+    """
+    Registra as linhas recebidas em uma página da API.
+    """
+    count('bybit_api_rows_total', rows, endpoint=endpoint)
+    observe('bybit_api_page_rows', rows, endpoint=endpoint)
+
+
+class _PybitRetryCounter(logging.Filter):
+    """
+    A pybit repete internamente as requisições com erros temporários (10006, 10002,
+    falhas de rede) e só registra cada nova tentativa no seu log, com '. Retrying'.
+    O filtro conta essas mensagens sem alterar o log.
+    """
+
+    def filter(self, record):
+        if '. Retrying' in record.getMessage():
+            count('bybit_api_retries_total')
+        return True
+
+
+_retry_counter_installed = False
+
+
+def install_pybit_retry_counter():
+    global _retry_counter_installed
+    if not _retry_counter_installed:
+        logging.getLogger('pybit._http_manager').addFilter(_PybitRetryCounter())
+        _retry_counter_installed = True
+
+
+def render_prometheus():
+    return REGISTRY.render()
@@ -0,0 +1,322 @@
+# optimizer.py
+"""
+Otimização da blacklist: busca o conjunto de símbolos cuja remoção maximiza o PnL total ou
+o ROI agregado, respeitando restrições (mínimo de trades restantes, máximo de símbolos banidos).
+
+Tudo é calculado sobre os totais por símbolo do índice de agregados (PnL, margem, trades),
+que são aditivos: avaliar uma blacklist é subtrair somas, sem chamar
+process_closed_positions_data. Métodos:
+    greedy             -> a cada passo bane o símbolo que mais melhora o objetivo e depois
+                          tenta trocas (todos os candidatos de um passo avaliados de uma vez
+                          com NumPy);
+    branch_and_bound   -> busca exata sobre os candidatos, podando por um limite otimista,
+                          partindo da solução gulosa;
+    auto               -> branch_and_bound; se MAX_NODES ou MAX_SECONDS for atingido, devolve
+                          a melhor solução encontrada com 'exact': False.
+"""
+import time
+
+import numpy as np
+
+OBJECTIVES = ('pnl', 'roi')
+METHODS = ('auto', 'greedy', 'branch_and_bound')
+
+# Limites da busca exata; ao atingir um deles fica a melhor solução encontrada até ali
+MAX_NODES = 1_000_000
+MAX_SECONDS = 2.0
+
+
+class SymbolTotals:
+    """
+    Totais por símbolo (arrays alinhados) a partir do índice de agregados por (symbol, exit_type).
+    """
+
+    def __init__(self, symbol_aggregates):
+        by_symbol = symbol_aggregates.groupby(level='symbol').sum()
+        self.symbols = by_symbol.index.to_numpy(dtype=object)
+        self.pnl = by_symbol['total_pnl_net'].to_numpy(dtype='float64')
+        self.margin = by_symbol['total_margin'].to_numpy(dtype='float64')
+        self.trades = by_symbol['trade_count'].to_numpy(dtype='int64')
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def positions(self, symbols):
+        wanted = set(symbols)
+        return np.flatnonzero(np.fromiter((symbol in wanted for symbol in self.symbols), dtype=bool,
+                                          count=len(self.symbols)))
+
+
+def _objective(objective, pnl, margin, trades):
+    # Sem trades restantes o objetivo não existe: a margem que sobra de somas em ponto
+    # flutuante não é exatamente zero e daria um ROI arbitrário
+    if objective == 'pnl':
+        return np.where(trades > 0, pnl, -np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((trades > 0) & (margin > 0), pnl / margin * 100, -np.inf)
+
+
+def evaluate_blacklists(totals, masks, objective='pnl'):
+    """
+    Avalia várias blacklists de uma vez.
+    :param masks: Matriz booleana (blacklists x símbolos); True = símbolo removido.
+    :return: {'pnl', 'margin', 'trades', 'objective'} com um valor por blacklist.
+    """
+    masks = np.asarray(masks, dtype='float64')
+    pnl = totals.pnl.sum() - masks @ totals.pnl
+    margin = totals.margin.sum() - masks @ totals.margin
+    trades = totals.trades.sum() - (masks @ totals.trades).astype('int64')
+    return {'pnl': pnl, 'margin': margin, 'trades': trades, 'objective': _objective(objective, pnl, margin, trades)}
+
+
+def marginal_contributions(totals, banned=()):
+    """
+    Efeito de remover cada símbolo isoladamente (a partir da blacklist `banned`).
+    :return: Lista de {'symbol', 'total_pnl_net', 'trade_count', 'roi_agregado', 'pnl_if_removed',
+             'roi_if_removed', 'roi_delta'}, do símbolo cuja remoção mais aumenta o ROI ao que mais o reduz.
+    """
+    kept = np.ones(len(totals), dtype=bool)
+    kept[totals.positions(banned)] = False
+    pnl, margin, trades = totals.pnl[kept].sum(), totals.margin[kept].sum(), totals.trades[kept].sum()
+    current_roi = _objective('roi', np.array([pnl]), np.array([margin]), np.array([trades]))[0]
+    roi_if_removed = _objective('roi', pnl - totals.pnl, margin - totals.margin, trades - totals.trades)
+    own_roi = _objective('roi', totals.pnl, totals.margin, totals.trades)
+    order = np.flatnonzero(kept)[np.argsort(-(roi_if_removed[kept] - current_roi), kind='stable')]
+    return [
+        {'symbol': totals.symbols[i], 'total_pnl_net': float(totals.pnl[i]), 'trade_count': int(totals.trades[i]),
+         'roi_agregado': float(own_roi[i]), 'pnl_if_removed': float(pnl - totals.pnl[i]),
+         'roi_if_removed': float(roi_if_removed[i]), 'roi_delta': float(roi_if_removed[i] - current_roi)}
+        for i in order
+    ]
+
+
+class _Search:
+    """
+    Estado comum das buscas: totais dos símbolos mantidos, restrições e contagem de avaliações.
+    """
+
+    def __init__(self, totals, objective, banned, min_trades, max_symbols):
+        self.totals = totals
+        self.objective = objective
+        # Pelo menos um trade sempre resta: banir tudo não é uma solução
+        self.min_trades = max(min_trades, 1)
+        self.max_symbols = max_symbols
+        self.base = np.zeros(len(totals), dtype=bool)
+        self.base[totals.positions(banned)] = True
+        kept = ~self.base
+        self.pnl, self.margin = totals.pnl[kept].sum(), totals.margin[kept].sum()
+        self.trades = int(totals.trades[kept].sum())
+        self.evaluated = 0
+
+    def score(self, pnl, margin, trades):
+        return float(_objective(self.objective, np.array([pnl]), np.array([margin]), np.array([trades]))[0])
+
+    def _value(self, chosen):
+        chosen = list(chosen)
+        return self.score(self.pnl - self.totals.pnl[chosen].sum(), self.margin - self.totals.margin[chosen].sum(),
+                          self.trades - int(self.totals.trades[chosen].sum()))
+
+    def greedy(self):
+        """
+        Bane, a cada passo, o símbolo que mais melhora o objetivo; depois tenta trocas
+        (desbanir um símbolo, ou trocá-lo por outro) enquanto alguma melhorar o resultado.
+        :return: Posições dos símbolos banidos.
+        """
+        totals = self.totals
+        chosen = []
+        available = ~self.base
+        pnl, margin, trades = self.pnl, self.margin, self.trades
+        current = self.score(pnl, margin, trades)
+        while self.max_symbols is None or len(chosen) < self.max_symbols:
+            # Todos os candidatos do passo avaliados de uma vez
+            candidates = np.flatnonzero(available & (trades - totals.trades >= self.min_trades))
+            if len(candidates) == 0:
+                break
+            scores = _objective(self.objective, pnl - totals.pnl[candidates], margin - totals.margin[candidates],
+                                trades - totals.trades[candidates])
+            self.evaluated += len(candidates)
+            best = int(np.argmax(scores))
+            if not scores[best] > current:
+                break
+            position = candidates[best]
+            chosen.append(position)
+            available[position] = False
+            pnl, margin, trades = pnl - totals.pnl[position], margin - totals.margin[position], trades - totals.trades[position]
+            current = float(scores[best])
+        return self._improve(chosen, pnl, margin, trades, current)
+
+    def _improve(self, chosen, pnl, margin, trades, current, max_rounds=100):
+        """
+        Busca local sobre a solução gulosa: em cada rodada avalia de uma vez todas as trocas
+        (banido i -> j) e desbanimentos (banido i -> nenhum) e aplica a melhor, se melhorar.
+        """
+        totals = self.totals
+        chosen = list(chosen)
+        for _ in range(max_rounds):
+            if not chosen:
+                break
+            outside = np.flatnonzero(~self.base & ~np.isin(np.arange(len(totals)), chosen))
+            banned = np.array(chosen)
+            # Linhas: símbolo desbanido; colunas: símbolo banido no lugar (última coluna: nenhum)
+            swap_pnl = pnl + totals.pnl[banned][:, None] - np.r_[totals.pnl[outside], 0.0][None, :]
+            swap_margin = margin + totals.margin[banned][:, None] - np.r_[totals.margin[outside], 0.0][None, :]
+            swap_trades = trades + totals.trades[banned][:, None] - np.r_[totals.trades[outside], 0][None, :]
+            scores = np.where(swap_trades >= self.min_trades,
+                              _objective(self.objective, swap_pnl, swap_margin, swap_trades), -np.inf)
+            self.evaluated += scores.size
+            row, column = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            if not scores[row, column] > current:
+                break
+            pnl, margin, trades = swap_pnl[row, column], swap_margin[row, column], int(swap_trades[row, column])
+            current = float(scores[row, column])
+            if column < len(outside):
+                chosen[row] = outside[column]
+            else:
+                del chosen[row]
+        return chosen
+
+    def _candidates(self):
+        """
+        Símbolos que podem fazer parte da blacklist ótima, na ordem de decisão da busca exata.
+        PnL: só os de PnL negativo (banir os demais nunca melhora); com mínimo de trades, em
+        ordem de perda por trade, senão de perda total. ROI: só os de ROI abaixo do maior ROI
+        alcançável, em ordem crescente de ROI.
+        """
+        totals = self.totals
+        open_ = np.flatnonzero(~self.base)
+        if self.objective == 'pnl':
+            candidates = open_[totals.pnl[open_] < 0]
+            key = totals.pnl[candidates] / totals.trades[candidates] if self.min_trades else totals.pnl[candidates]
+            return candidates[np.argsort(key, kind='stable')]
+        roi = _objective('roi', totals.pnl, totals.margin, totals.trades)
+        order = open_[np.argsort(-roi[open_], kind='stable')]
+        ceiling = self._roi_prefix_bound(self.pnl - totals.pnl[order].sum(), self.margin - totals.margin[order].sum(),
+                                         self.trades - int(totals.trades[order].sum()),
+                                         np.r_[0.0, np.cumsum(totals.pnl[order])],
+                                         np.r_[0.0, np.cumsum(totals.margin[order])],
+                                         np.r_[0, np.cumsum(totals.trades[order])])
+        candidates = open_[roi[open_] < ceiling]
+        return candidates[np.argsort(roi[candidates], kind='stable')]
+
+    @staticmethod
+    def _roi_prefix_bound(fixed_pnl, fixed_margin, fixed_trades, prefix_pnl, prefix_margin, prefix_trades):
+        """
+        Maior ROI entre manter os símbolos fixos mais cada prefixo dos indecididos em ordem
+        decrescente de ROI: é o ótimo sem restrições (logo um limite otimista válido).
+        """
+        return float(_objective('roi', fixed_pnl + prefix_pnl, fixed_margin + prefix_margin,
+                                fixed_trades + prefix_trades).max())
+
+    def branch_and_bound(self, incumbent, max_nodes, max_seconds):
+        """
+        Busca exata sobre os candidatos, partindo da solução `incumbent`. Cada nó decide se o
+        próximo candidato fica ou sai; o nó é podado quando o limite otimista dos candidatos
+        restantes não supera a melhor solução.
+        :return: (posições banidas, terminou sem atingir max_nodes nem max_seconds)
+        """
+        totals = self.totals
+        deadline = time.perf_counter() + max_seconds
+        best_set, best_value = list(incumbent), self._value(incumbent)
+        candidates = self._candidates()
+        n = len(candidates)
+        # Somas acumuladas na ordem de decisão: os limites de cada nó saem de fatias delas
+        gain = -totals.pnl[candidates]
+        cumulative_gain = np.r_[0.0, np.cumsum(gain)]
+        cumulative_trades = np.r_[0, np.cumsum(totals.trades[candidates])]
+        # ROI: indecididos (candidates[depth:]) em ordem decrescente de ROI = sufixo invertido
+        reversed_pnl = np.r_[0.0, np.cumsum(totals.pnl[candidates][::-1])]
+        reversed_margin = np.r_[0.0, np.cumsum(totals.margin[candidates][::-1])]
+        reversed_trades = np.r_[0, np.cumsum(totals.trades[candidates][::-1])]
+
+        def upper_bound(depth, pnl, margin, trades, banned_count):
+            if self.objective == 'roi':
+                undecided = n - depth
+                return self._roi_prefix_bound(pnl - reversed_pnl[undecided], margin - reversed_margin[undecided],
+                                              trades - reversed_trades[undecided], reversed_pnl[:undecided + 1],
+                                              reversed_margin[:undecided + 1], reversed_trades[:undecided + 1])
+            bound = pnl + cumulative_gain[n] - cumulative_gain[depth]
+            if self.min_trades:
+                # Mochila fracionária: banir os de maior perda por trade até esgotar os trades disponíveis
+                budget = cumulative_trades[depth] + trades - self.min_trades
+                last = int(np.searchsorted(cumulative_trades, budget, side='right')) - 1
+                knapsack = cumulative_gain[last] - cumulative_gain[depth]
+                if last < n:
+                    knapsack += gain[last] * (budget - cumulative_trades[last]) / totals.trades[candidates[last]]
+                bound = min(bound, pnl + knapsack)
+            elif self.max_symbols is not None:
+                # Candidatos em ordem de perda: os próximos max_symbols são os de maior ganho
+                bound = min(bound, pnl + cumulative_gain[min(n, depth + self.max_symbols - banned_count)]
+                            - cumulative_gain[depth])
+            return bound
+
+        nodes = 0
+        stack = [(0, self.pnl, self.margin, self.trades, ())]
+        while stack:
+            depth, pnl, margin, trades, banned = stack.pop()
+            nodes += 1
+            if nodes > max_nodes or (nodes % 1024 == 0 and time.perf_counter() > deadline):
+                return best_set, False
+            value = self.score(pnl, margin, trades)
+            self.evaluated += 1
+            if value > best_value:
+                best_value, best_set = value, list(banned)
+            if depth == n or upper_bound(depth, pnl, margin, trades, len(banned)) <= best_value:
+                continue
+            # Manter o candidato
+            stack.append((depth + 1, pnl, margin, trades, banned))
+            position = candidates[depth]
+            if ((self.max_symbols is None or len(banned) < self.max_symbols)
+                    and trades - totals.trades[position] >= self.min_trades):
+                # Banir (empilhado por último, explorado primeiro)
+                stack.append((depth + 1, pnl - totals.pnl[position], margin - totals.margin[position],
+                              trades - int(totals.trades[position]), banned + (position,)))
+        return best_set, True
+
+
+def optimize_blacklist(symbol_aggregates, objective='pnl', banned=(), min_trades=0, max_symbols=None,
+                       method='auto', max_nodes=MAX_NODES, max_seconds=MAX_SECONDS):
+    """
+    Busca a blacklist que maximiza o objetivo.
+    :param objective: 'pnl' (PnL total) ou 'roi' (ROI agregado).
+    :param banned: Símbolos já na blacklist (mantidos; a busca sugere símbolos adicionais).
+    :param min_trades: Mínimo de trades que devem restar após a remoção (pelo menos 1).
+    :param max_symbols: Máximo de símbolos adicionais banidos (None = sem limite).
+    :return: {'objective', 'method', 'exact', 'blacklist' (novos símbolos), 'before' e 'after'
+              ({'total_pnl', 'total_margin_cost', 'avg_roi', 'total_trades'}), 'contributions'
+              (marginal_contributions a partir de `banned`), 'evaluated', 'elapsed_s'}
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Objetivo desconhecido: {objective}")
+    if method not in METHODS:
+        raise ValueError(f"Método desconhecido: {method}")
+
+    started = time.perf_counter()
+    totals = SymbolTotals(symbol_aggregates)
+    search = _Search(totals, objective, banned, min_trades, max_symbols)
+    chosen = search.greedy()
+    exact = False
+    if method != 'greedy':
+        chosen, exact = search.branch_and_bound(chosen, max_nodes, max_seconds)
+
+    chosen = sorted(chosen, key=lambda position: totals.pnl[position])
+    mask = search.base.copy()
+    before = evaluate_blacklists(totals, mask[None, :], 'roi')
+    mask[chosen] = True
+    after = evaluate_blacklists(totals, mask[None, :], 'roi')
+
+    def kpis(evaluation):
+        return {'total_pnl': float(evaluation['pnl'][0]), 'total_margin_cost': float(evaluation['margin'][0]),
+                'avg_roi': float(evaluation['objective'][0]) if evaluation['trades'][0] > 0 else 0.0,
+                'total_trades': int(evaluation['trades'][0])}
+
+    return {
+        'objective': objective,
+        'method': 'greedy' if method == 'greedy' else 'branch_and_bound',
+        'exact': exact,
+        'blacklist': [totals.symbols[position] for position in chosen],
+        'before': kpis(before),
+        'after': kpis(after),
+        'contributions': marginal_contributions(totals, banned),
+        'evaluated': search.evaluated,
+        'elapsed_s': round(time.perf_counter() - started, 4),
+    }
@@ -0,0 +1,257 @@
+# order_history.py
+"""
+Tipo de saída das posições fechadas a partir do histórico de ordens.
+
+get_closed_pnl não informa como a posição foi fechada, mas traz o orderId da ordem de
+fechamento; stopOrderType, orderLinkId e createType dessa ordem (get_order_history)
+indicam StopLoss, TakeProfit, TrailingStop ou liquidação. A Bybit só filtra o histórico de
+ordens por um orderId por requisição, então as ordens que faltam são buscadas por janela
+de tempo (50 ordens por página), cobrindo apenas os trechos em que há posições sem ordem
+conhecida. Todas as ordens recebidas ficam gravadas em SQLite, por conta, e as procuradas
+e não encontradas também: nenhuma ordem é procurada duas vezes. No modo streaming, as
+janelas já buscadas durante a análise (FetchedWindows) são descontadas das páginas
+seguintes, cujas ordens já estão no cache.
+
+A classificação é feita depois, de forma vetorizada, em analysis._fill_exit_types.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from analysis import EXIT_ORDER_FIELDS
+from bybit_client import fetch_order_history_windows, get_session
+from position_cache import CACHE_DIR, account_id
+
+# Campos da ordem guardados no cache
+ORDER_FIELDS = ['symbol', 'orderType', 'stopOrderType', 'orderLinkId', 'createType', 'updatedTime']
+
+# Folga em torno do intervalo de cada posição: a ordem de fechamento pode ser atualizada
+# alguns instantes depois do registro de PnL
+ORDER_LOOKUP_PADDING_MS = 60_000
+
+# Intervalo máximo entre startTime e endTime aceito por get_order_history
+ORDER_HISTORY_WINDOW_MS = 7 * 86_400_000 - 1000
+
+
+class OrderCache:
+    """
+    Ordens já recebidas ou procuradas, por conta e categoria. lookup_time é o updatedTime
+    da ordem ou, para as não encontradas (found = 0), o da posição fechada que levou à busca.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'orders.sqlite3')
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            field_columns = ', '.join(f'"{field}" TEXT' for field in ORDER_FIELDS)
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS orders (
+                    account TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    order_id TEXT NOT NULL,
+                    lookup_time INTEGER NOT NULL,
+                    found INTEGER NOT NULL,
+                    {field_columns},
+                    PRIMARY KEY (account, category, order_id)
+                )''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_orders_lookup_time
+                ON orders (account, category, lookup_time)''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def query(self, account, category, start_timestamp, end_timestamp):
+        """
+        :return: DataFrame indexado por order_id com found e ORDER_FIELDS, das ordens com
+                 lookup_time no intervalo.
+        """
+        columns = ', '.join(f'"{field}"' for field in ORDER_FIELDS)
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f'SELECT order_id, found, {columns} FROM orders '
+                'WHERE account = ? AND category = ? AND lookup_time BETWEEN ? AND ?',
+                conn, params=(account, category, int(start_timestamp), int(end_timestamp))
+            ).set_index('order_id')
+
+    def store(self, account, category, orders, not_found=None):
+        """
+        Grava o resultado de uma busca.
+        :param orders: Ordens recebidas (dicionários da API), gravadas com o próprio updatedTime.
+        :param not_found: {order_id: updatedTime da posição} das ordens procuradas que a Bybit
+                          não devolveu; ficam com found = 0.
+        """
+        rows = [(account, category, order['orderId'], int(order.get('updatedTime') or 0), 1,
+                 *(order.get(field) for field in ORDER_FIELDS))
+                for order in orders if order.get('orderId')]
+        rows += [(account, category, order_id, int(lookup_time), 0, *(None for _ in ORDER_FIELDS))
+                 for order_id, lookup_time in (not_found or {}).items()]
+        columns = ['account', 'category', 'order_id', 'lookup_time', 'found'] + ORDER_FIELDS
+        placeholders = ', '.join('?' for _ in columns)
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(f'INSERT OR REPLACE INTO orders ({column_list}) VALUES ({placeholders})', rows)
+
+
+def lookup_windows(entry_ms, exit_ms, padding=ORDER_LOOKUP_PADDING_MS, max_window=ORDER_HISTORY_WINDOW_MS):
+    """
+    Janelas de busca do histórico de ordens que cobrem o intervalo de cada posição (da
+    entrada à saída, com folga): uma ordem de Stop Loss ou Take Profit pode ter sido criada
+    na abertura. Intervalos sobrepostos são unidos e cada trecho é dividido em janelas de
+    até `max_window`.
+    :return: Lista de (start_timestamp_ms, end_timestamp_ms) em ordem cronológica.
+    """
+    exit_ms = np.asarray(exit_ms, dtype='int64')
+    entry_ms = np.minimum(np.asarray(entry_ms, dtype='int64'), exit_ms)
+    if len(exit_ms) == 0:
+        return []
+    order = np.argsort(entry_ms, kind='stable')
+    starts, ends = entry_ms[order] - padding, exit_ms[order] + padding
+    # Um novo trecho começa onde a posição inicia depois do fim de todas as anteriores
+    covered_until = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.r_[True, starts[1:] > covered_until[:-1]])
+    last = np.r_[first[1:] - 1, len(starts) - 1]
+
+    windows = []
+    for start, end in zip(starts[first], covered_until[last]):
+        while start <= end:
+            windows.append((int(start), int(min(start + max_window, end))))
+            start += max_window + 1
+    return windows
+
+
+class FetchedWindows:
+    """
+    Trechos do histórico de ordens já buscados durante uma análise, compartilhados entre as
+    páginas do modo streaming: cada página busca só o que as anteriores não cobriram. O
+    lock serializa as buscas para que duas páginas não baixem o mesmo trecho ao mesmo tempo.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.intervals = []
+
+    def subtract(self, windows):
+        """
+        :return: Partes de `windows` ainda não buscadas, em ordem cronológica.
+        """
+        remaining = []
+        for start, end in windows:
+            for covered_start, covered_end in self.intervals:
+                if covered_end < start or covered_start > end:
+                    continue
+                if covered_start > start:
+                    remaining.append((start, covered_start - 1))
+                start = max(start, covered_end + 1)
+                if start > end:
+                    break
+            if start <= end:
+                remaining.append((start, end))
+        return remaining
+
+    def add(self, windows):
+        intervals = sorted(self.intervals + list(windows))
+        merged = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self.intervals = merged
+
+
+def _position_times(closed_positions):
+    order_ids = closed_positions['orderId'].astype(str)
+    exit_ms = pd.to_numeric(closed_positions['updatedTime'], errors='coerce').fillna(0).astype('int64')
+    entry_ms = (pd.to_numeric(closed_positions['createdTime'], errors='coerce').fillna(exit_ms).astype('int64')
+                if 'createdTime' in closed_positions.columns else exit_ms)
+    return order_ids, entry_ms, exit_ms
+
+
+def _query_known(cache, account, category, exit_ms):
+    # A ordem de fechamento é gravada com o próprio updatedTime, que pode diferir um pouco
+    # do updatedTime da posição
+    known = cache.query(account, category, exit_ms.min() - ORDER_LOOKUP_PADDING_MS,
+                        exit_ms.max() + ORDER_LOOKUP_PADDING_MS)
+    return known[~known.index.duplicated(keep='last')]
+
+
+def _join_exit_orders(closed_positions, order_ids, known):
+    enriched = closed_positions.copy()
+    for field in EXIT_ORDER_FIELDS:
+        enriched[field] = order_ids.map(known[field]).to_numpy(dtype=object)
+    return enriched
+
+
+def join_cached_exit_orders(closed_positions, account, category='linear', cache=None):
+    """
+    Como enrich_exit_orders, mas só com as ordens que já estão no cache, sem acessar a
+    rede (modo --from-cache da CLI).
+    :param account: Identificador da conta (position_cache.account_id).
+    :return: Novo DataFrame com as colunas EXIT_ORDER_FIELDS acrescentadas.
+    """
+    closed_positions = pd.DataFrame(closed_positions)
+    if closed_positions.empty or 'orderId' not in closed_positions.columns:
+        return closed_positions
+    order_ids, _, exit_ms = _position_times(closed_positions)
+    known = _query_known(cache or OrderCache(), account, category, exit_ms)
+    return _join_exit_orders(closed_positions, order_ids, known)
+
+
+def enrich_exit_orders(closed_positions, api_key, api_secret, category='linear', cache=None, session=None,
+                       fetched=None):
+    """
+    Acrescenta às posições fechadas os campos EXIT_ORDER_FIELDS da ordem de fechamento
+    (junção pelo orderId), buscando na Bybit apenas as ordens que ainda não estão no cache.
+    Posições cuja ordem não foi encontrada ficam com os campos nulos.
+    :param closed_positions: DataFrame no formato de get_closed_pnl (ou lista de dicionários).
+    :param fetched: FetchedWindows compartilhado entre chamadas da mesma análise (modo
+                    streaming); os trechos já buscados não são baixados de novo.
+    :return: Novo DataFrame com as colunas acrescentadas.
+    """
+    closed_positions = pd.DataFrame(closed_positions)
+    if closed_positions.empty or 'orderId' not in closed_positions.columns:
+        return closed_positions
+
+    cache = cache or OrderCache()
+    account = account_id(api_key)
+    order_ids, entry_ms, exit_ms = _position_times(closed_positions)
+
+    with metrics.span('orders.cache_query'):
+        known = _query_known(cache, account, category, exit_ms)
+    cached = order_ids.isin(known.index)
+    missing = ~cached & (order_ids != '')
+    metrics.count('bybit_order_lookups_total', int(cached.sum()), outcome='cached')
+
+    if missing.any():
+        fetched = fetched or FetchedWindows()
+        with fetched.lock:
+            windows = fetched.subtract(lookup_windows(entry_ms[missing], exit_ms[missing]))
+            if windows:
+                if session is None:
+                    session = get_session(api_key, api_secret)
+                orders = fetch_order_history_windows(session, windows, category)
+                with metrics.span('orders.cache_store'):
+                    cache.store(account, category, orders)
+                fetched.add(windows)
+            # Procuradas que não vieram nesta busca nem em trechos já cobertos antes
+            known = _query_known(cache, account, category, exit_ms)
+            lookup_times = dict(zip(order_ids[missing], exit_ms[missing]))
+            not_found = {order_id: lookup_time for order_id, lookup_time in lookup_times.items()
+                         if order_id not in known.index}
+            with metrics.span('orders.cache_store'):
+                cache.store(account, category, [], not_found)
+        metrics.count('bybit_order_lookups_total', len(lookup_times) - len(not_found), outcome='found')
+        metrics.count('bybit_order_lookups_total', len(not_found), outcome='not_found')
+        logging.info(f"Histórico de ordens: {len(lookup_times)} ordens procuradas em {len(windows)} janelas novas, "
+                     f"{len(lookup_times) - len(not_found)} encontradas (conta {account}).")
+        known = _query_known(cache, account, category, exit_ms)
+
+    return _join_exit_orders(closed_positions, order_ids, known)
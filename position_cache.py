@@ -0,0 +1,206 @@
+# position_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+import metrics
+from bybit_client import _date_range_ms, fetch_closed_positions_between, get_session
+
+CACHE_DIR = os.environ.get('BYBIT_CACHE_DIR', './cache')
+
+# Campos retornados por get_closed_pnl que são armazenados localmente
+CLOSED_PNL_FIELDS = [
+    'symbol', 'orderId', 'side', 'qty', 'orderPrice', 'orderType', 'execType',
+    'closedSize', 'cumEntryValue', 'avgEntryPrice', 'cumExitValue', 'avgExitPrice',
+    'closedPnl', 'fillCount', 'leverage', 'openFee', 'closeFee', 'fillFee',
+    'createdTime', 'updatedTime',
+]
+
+# Sobreposição ao buscar a cauda, para pegar posições publicadas com atraso pela API
+SYNC_OVERLAP_MS = 5 * 60 * 1000
+
+
+def account_id(api_key):
+    """
+    Identificador estável da conta derivado da API Key (a chave nunca é gravada em disco).
+    """
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class ClosedPositionCache:
+    """
+    Armazena o histórico de posições fechadas em SQLite, por conta e categoria,
+    junto com o intervalo de tempo (updatedTime) já sincronizado com a Bybit e a versão
+    dos dados (data_version), incrementada a cada sincronização que grava posições novas.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'closed_positions.sqlite3')
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            field_columns = ', '.join(f'"{field}" TEXT' for field in CLOSED_PNL_FIELDS
+                                      if field not in ('createdTime', 'updatedTime'))
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS closed_positions (
+                    account TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    record_id TEXT NOT NULL,
+                    "createdTime" INTEGER,
+                    "updatedTime" INTEGER NOT NULL,
+                    {field_columns},
+                    PRIMARY KEY (account, category, record_id)
+                )''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_closed_positions_time
+                ON closed_positions (account, category, "updatedTime")''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    account TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    synced_from INTEGER NOT NULL,
+                    synced_to INTEGER NOT NULL,
+                    last_updated_time INTEGER,
+                    synced_at REAL NOT NULL,
+                    data_version INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (account, category)
+                )''')
+            # Caches criados antes da coluna data_version
+            sync_columns = [row[1] for row in conn.execute('PRAGMA table_info(sync_state)')]
+            if 'data_version' not in sync_columns:
+                conn.execute('ALTER TABLE sync_state ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_sync_state(self, account, category='linear'):
+        """
+        :return: Dicionário com synced_from, synced_to, last_updated_time, synced_at e data_version, ou None.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT synced_from, synced_to, last_updated_time, synced_at, data_version FROM sync_state '
+                'WHERE account = ? AND category = ?', (account, category)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('synced_from', 'synced_to', 'last_updated_time', 'synced_at', 'data_version'), row))
+
+    def store(self, account, category, positions, synced_from, synced_to):
+        """
+        Grava as posições ainda não armazenadas e amplia o intervalo sincronizado em uma única
+        transação. Se houver posições novas, a versão dos dados da conta é incrementada.
+        :return: Número de posições recebidas.
+        """
+        rows = []
+        for position in positions:
+            updated_time = int(position.get('updatedTime') or 0)
+            record_id = f"{position.get('orderId', '')}:{updated_time}"
+            rows.append((account, category, record_id, int(position.get('createdTime') or 0), updated_time,
+                         *(position.get(field) for field in CLOSED_PNL_FIELDS
+                           if field not in ('createdTime', 'updatedTime'))))
+
+        columns = ['account', 'category', 'record_id', 'createdTime', 'updatedTime'] + [
+            field for field in CLOSED_PNL_FIELDS if field not in ('createdTime', 'updatedTime')]
+        placeholders = ', '.join('?' for _ in columns)
+        column_list = ', '.join(f'"{column}"' for column in columns)
+
+        with closing(self._connect()) as conn, conn:
+            # record_id inclui o updatedTime: uma posição já gravada com o mesmo id não mudou
+            changes_before = conn.total_changes
+            conn.executemany(
+                f'INSERT OR IGNORE INTO closed_positions ({column_list}) VALUES ({placeholders})', rows)
+            new_data = 1 if conn.total_changes > changes_before else 0
+            last_updated_time = conn.execute(
+                'SELECT MAX("updatedTime") FROM closed_positions WHERE account = ? AND category = ?',
+                (account, category)
+            ).fetchone()[0]
+            conn.execute('''
+                INSERT INTO sync_state (account, category, synced_from, synced_to, last_updated_time, synced_at,
+                                        data_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (account, category) DO UPDATE SET
+                    synced_from = MIN(synced_from, excluded.synced_from),
+                    synced_to = MAX(synced_to, excluded.synced_to),
+                    last_updated_time = excluded.last_updated_time,
+                    synced_at = excluded.synced_at,
+                    data_version = data_version + excluded.data_version''',
+                (account, category, synced_from, synced_to, last_updated_time, time.time(), new_data))
+        return len(rows)
+
+    def query(self, account, category, start_timestamp, end_timestamp):
+        """
+        Retorna as posições com updatedTime no intervalo, no mesmo formato de fetch_closed_positions.
+        """
+        columns = ', '.join(f'"{field}"' for field in CLOSED_PNL_FIELDS)
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f'SELECT {columns} FROM closed_positions '
+                'WHERE account = ? AND category = ? AND "updatedTime" BETWEEN ? AND ? '
+                'ORDER BY "updatedTime"',
+                conn, params=(account, category, start_timestamp, end_timestamp))
+        if df.empty:
+            return pd.DataFrame()
+        # Colunas inexistentes na resposta original voltam como nulas; removê-las mantém o formato da API
+        return df.dropna(axis=1, how='all')
+
+
+def sync_closed_positions(api_key, api_secret, start_date_str, end_date_str,
+                          category='linear', cache=None, session=None, progress=None):
+    """
+    Busca na Bybit apenas os trechos do período ainda não sincronizados (início anterior e
+    cauda após a última sincronização) e os grava no cache.
+    :param progress: Repassado a fetch_closed_positions_between (ver jobs.JobProgress).
+    :return: Estado de sincronização da conta depois da busca (ver get_sync_state).
+    """
+    cache = cache or ClosedPositionCache()
+    account = account_id(api_key)
+    start_timestamp, end_timestamp = _date_range_ms(start_date_str, end_date_str)
+    # Não é possível sincronizar o futuro; a cauda após "agora" é buscada numa próxima análise
+    sync_end = min(end_timestamp, int(time.time() * 1000))
+
+    state = cache.get_sync_state(account, category)
+    if state is None:
+        missing = [(start_timestamp, sync_end)]
+    else:
+        missing = []
+        if start_timestamp < state['synced_from']:
+            missing.append((start_timestamp, state['synced_from'] - 1))
+        if sync_end > state['synced_to']:
+            missing.append((max(state['synced_from'], state['synced_to'] - SYNC_OVERLAP_MS), sync_end))
+
+    missing = [(start, end) for start, end in missing if start <= end]
+    if missing:
+        if session is None:
+            session = get_session(api_key, api_secret)
+        for start, end in missing:
+            positions = fetch_closed_positions_between(session, start, end, progress=progress)
+            with metrics.span('cache.store'):
+                stored = cache.store(account, category, positions, start, end)
+            logging.info(f"Cache de posições: {stored} posições sincronizadas para a conta {account}.")
+    else:
+        logging.info(f"Cache de posições: período já sincronizado para a conta {account}.")
+    return cache.get_sync_state(account, category)
+
+
+def fetch_closed_positions_cached(api_key, api_secret, start_date_str, end_date_str,
+                                  category='linear', cache=None, session=None, progress=None, sync=True):
+    """
+    Versão com cache local de fetch_closed_positions: sincroniza o período
+    (sync_closed_positions) e responde a partir do SQLite.
+    :param progress: Repassado a fetch_closed_positions_between (ver jobs.JobProgress).
+    :param sync: False quando quem chama acabou de sincronizar o período.
+    """
+    cache = cache or ClosedPositionCache()
+    if sync:
+        sync_closed_positions(api_key, api_secret, start_date_str, end_date_str, category, cache, session, progress)
+    account = account_id(api_key)
+    start_timestamp, end_timestamp = _date_range_ms(start_date_str, end_date_str)
+
+    with metrics.span('cache.query'):
+        return cache.query(account, category, start_timestamp, end_timestamp)
@@ -0,0 +1,130 @@
+# rate_limiter.py
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limitador de taxa do tipo token bucket, seguro para uso entre threads.
+    :param rate: Tokens repostos por segundo (requisições por segundo permitidas).
+    :param capacity: Tamanho máximo do bucket (rajada permitida). Padrão: igual a rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate deve ser maior que zero.")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def acquire(self, tokens=1):
+        """
+        Bloqueia até haver tokens disponíveis e os consome.
+        :return: Tempo total de espera, em segundos.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveRateLimiter:
+    """
+    Limitador que segue a cota informada pela Bybit nos cabeçalhos de cada resposta:
+    X-Bapi-Limit (cota da janela), X-Bapi-Limit-Status (requisições restantes) e
+    X-Bapi-Limit-Reset-Timestamp (fim da janela, em ms).
+    Com a cota conhecida, as requisições saem sem espera até ela acabar e então aguardam
+    o fim da janela; antes da primeira resposta, usa um token bucket com a taxa padrão.
+    Deve ser compartilhado por todas as buscas da mesma API Key e endpoint.
+    Cada acquire() deve ser seguido de release() quando a resposta chegar (ou a requisição
+    falhar): as requisições em andamento ainda não aparecem nos cabeçalhos e são
+    descontadas da cota restante.
+    :param rate: Taxa (requisições/s) usada enquanto a cota não é conhecida.
+    :param window_seconds: Duração presumida da janela seguinte quando a atual termina sem
+                           que uma nova resposta tenha informado o próximo reset.
+    """
+
+    def __init__(self, rate, window_seconds=1.0):
+        self._bucket = TokenBucket(rate)
+        self.window_seconds = window_seconds
+        self._limit = None
+        self._remaining = None
+        self._reset_at = None  # time.time() do fim da janela atual
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def update(self, limit, remaining, reset_timestamp_ms):
+        """
+        Atualiza a cota com os cabeçalhos de uma resposta (chamado antes do release() dela).
+        """
+        reset_at = reset_timestamp_ms / 1000
+        with self._lock:
+            self._limit = limit
+            # As demais requisições em andamento podem ainda não ter sido contadas pela Bybit
+            available = max(remaining - (self._in_flight - 1), 0)
+            if self._reset_at is None or reset_at > self._reset_at:
+                # Janela nova
+                self._reset_at = reset_at
+                self._remaining = available
+            elif reset_at == self._reset_at:
+                self._remaining = min(self._remaining, available)
+
+    def seconds_until_reset(self):
+        """
+        :return: Tempo até o fim da janela atual, ou 0 se a cota não é conhecida.
+        """
+        with self._lock:
+            if self._reset_at is None:
+                return 0.0
+            return max(self._reset_at - time.time(), 0.0)
+
+    def acquire(self):
+        """
+        Bloqueia até a requisição caber na cota e a consome.
+        :return: Tempo total de espera, em segundos.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self._reset_at is None:
+                    wait = None
+                else:
+                    now = time.time()
+                    if now >= self._reset_at:
+                        # Janela encerrada sem resposta nova: presume a cota cheia na próxima
+                        next_reset = self._reset_at + self.window_seconds
+                        self._reset_at = next_reset if next_reset > now else now + self.window_seconds
+                        self._remaining = max(self._limit - self._in_flight, 1)
+                    if self._remaining > 0:
+                        self._remaining -= 1
+                        self._in_flight += 1
+                        return waited
+                    wait = self._reset_at - now
+            if wait is None:
+                waited += self._bucket.acquire()
+                with self._lock:
+                    self._in_flight += 1
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def release(self):
+        """
+        Marca o fim de uma requisição liberada por acquire().
+        """
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
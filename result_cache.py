@@ -0,0 +1,205 @@
+# result_cache.py
+"""
+Cache de resultados de análise compartilhado entre sessões e workers do gunicorn.
+
+A chave é um hash das credenciais (API Key e Secret: só quem tem o par que gerou o
+resultado o reaproveita), do período, da alavancagem e da versão dos dados da conta no
+cache de posições (data_version, em position_cache.py), lida depois da sincronização
+incremental que antecede cada análise (app._run_analysis). Quando ela grava posições
+novas a versão muda: as chaves antigas deixam de ser geradas e as entradas da conta com
+versões anteriores são removidas do índice no próximo put().
+
+Os resultados ficam no ResultStore (em disco, legível por qualquer worker); aqui fica só
+o índice (chave -> handle, tamanho, criação, último acesso) e as sessões que exibem cada
+resultado (attach/detach), em SQLite no diretório do cache. Quando o total passa de
+`max_bytes`, as entradas menos usadas recentemente saem do índice. Um resultado que saiu do
+índice (por esse limite, por invalidação ou por expiração) é apagado do ResultStore assim
+que nenhuma sessão o referencia; o das sessões que terminam sem sair (sem /logout) expira
+pelo TTL do ResultStore.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+CACHE_DIR = os.environ.get('BYBIT_CACHE_DIR', './cache')
+
+# Tamanho máximo dos resultados referenciados pelo índice
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('BYBIT_RESULT_CACHE_MB', 1024)) * 1024 * 1024
+
+# Idade máxima de um resultado reaproveitado. As posições fechadas são sincronizadas antes
+# da consulta, mas o saldo e as movimentações da conta só são buscados de novo após esse prazo.
+RESULT_CACHE_MAX_AGE_SECONDS = int(os.environ.get('BYBIT_RESULT_CACHE_MAX_AGE', 10 * 60))
+
+# Incrementar quando o formato ou o cálculo do resultado mudar, para não reaproveitar resultados antigos
+ANALYSIS_VERSION = 4
+
+# Prefixo dos handles de resultados compartilhados: nenhuma sessão os apaga ao sair
+SHARED_RESULT_PREFIX = 'shared-'
+
+
+def result_cache_key(api_key, api_secret, start_date, end_date, leverage, data_version):
+    """
+    Chave do resultado: hash das credenciais, do período, da alavancagem e da versão dos dados.
+    """
+    material = '\x1f'.join([api_key, api_secret, start_date, end_date, repr(float(leverage)),
+                            str(data_version), str(ANALYSIS_VERSION)])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def new_shared_result_id():
+    return f"{SHARED_RESULT_PREFIX}{uuid.uuid4().hex}"
+
+
+def is_shared_result(result_id):
+    return bool(result_id) and result_id.startswith(SHARED_RESULT_PREFIX)
+
+
+class SharedResultCache:
+    """
+    Índice chave -> handle no ResultStore, compartilhado entre processos via SQLite.
+    Entradas substituídas, invalidadas ou removidas pelo limite de espaço saem do índice; o
+    resultado continua disponível para as sessões que já o exibem e é apagado quando a
+    última delas o solta (detach).
+    """
+
+    def __init__(self, store, path=None, max_bytes=RESULT_CACHE_MAX_BYTES, max_age=RESULT_CACHE_MAX_AGE_SECONDS):
+        self.store = store
+        self.path = path or os.path.join(CACHE_DIR, 'result_cache.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    account TEXT NOT NULL,
+                    data_version INTEGER NOT NULL,
+                    result_id TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_account ON result_cache (account)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_result ON result_cache (result_id)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_sessions (
+                    result_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    PRIMARY KEY (result_id, session_id)
+                )''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        """
+        :return: Handle do resultado no ResultStore, ou None se não houver entrada válida
+                 (ausente, mais velha que max_age ou com o resultado já expirado no ResultStore).
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT result_id, created_at FROM result_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        result_id, created_at = row
+        if now - created_at > self.max_age or self.store.get(result_id) is None:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('DELETE FROM result_cache WHERE key = ? AND result_id = ?', (key, result_id))
+            self._release([result_id])
+            return None
+        with closing(self._connect()) as conn, conn:
+            conn.execute('UPDATE result_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return result_id
+
+    def put(self, key, account, data_version, result_id):
+        """
+        Registra o resultado (já gravado no ResultStore) sob a chave, invalida as entradas da
+        conta com versões de dados anteriores e aplica o limite de espaço.
+        """
+        now = time.time()
+        size = self.store.size_bytes(result_id)
+        with closing(self._connect()) as conn, conn:
+            # Resultados que saem do índice: os da conta com versões anteriores e o que esta chave substitui
+            removed = [row[0] for row in conn.execute(
+                'SELECT result_id FROM result_cache WHERE (account = ? AND data_version < ?) OR key = ?',
+                (account, data_version, key))]
+            invalidated = conn.execute(
+                'DELETE FROM result_cache WHERE account = ? AND data_version < ?', (account, data_version)).rowcount
+            conn.execute(
+                'INSERT OR REPLACE INTO result_cache (key, account, data_version, result_id, size_bytes, created_at, '
+                'accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, account, data_version, result_id, size, now, now))
+        if invalidated:
+            logging.info(f"Cache de resultados: {invalidated} resultados da conta {account} invalidados (posições novas).")
+        self._release(removed)
+        self._evict(keep=key)
+
+    def invalidate(self, account):
+        """
+        Remove do índice todas as entradas da conta (ex: cache de posições apagado).
+        """
+        with closing(self._connect()) as conn, conn:
+            removed = [row[0] for row in conn.execute('SELECT result_id FROM result_cache WHERE account = ?', (account,))]
+            conn.execute('DELETE FROM result_cache WHERE account = ?', (account,))
+        self._release(removed)
+
+    def attach(self, result_id, session_id):
+        """
+        Registra que a sessão passou a exibir o resultado.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR IGNORE INTO result_sessions (result_id, session_id) VALUES (?, ?)',
+                         (result_id, session_id))
+
+    def detach(self, result_id, session_id):
+        """
+        Registra que a sessão deixou de exibir o resultado; se ele já saiu do índice e
+        nenhuma outra sessão o exibe, é apagado do ResultStore.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM result_sessions WHERE result_id = ? AND session_id = ?', (result_id, session_id))
+        self._release([result_id])
+
+    def _release(self, result_ids):
+        """
+        Apaga do ResultStore os resultados que não estão no índice nem são exibidos por
+        nenhuma sessão. Referências a resultados que já expiraram no ResultStore (sessões
+        encerradas sem /logout) são descartadas.
+        """
+        with closing(self._connect()) as conn, conn:
+            for result_id, in conn.execute('SELECT DISTINCT result_id FROM result_sessions').fetchall():
+                if self.store.size_bytes(result_id) == 0:
+                    conn.execute('DELETE FROM result_sessions WHERE result_id = ?', (result_id,))
+            unused = [result_id for result_id in set(result_ids)
+                      if conn.execute('SELECT 1 FROM result_cache WHERE result_id = ? UNION ALL '
+                                      'SELECT 1 FROM result_sessions WHERE result_id = ?',
+                                      (result_id, result_id)).fetchone() is None]
+        for result_id in unused:
+            self.store.delete(result_id)
+
+    def _evict(self, keep):
+        """
+        Remove do índice as entradas menos usadas recentemente até o total caber em max_bytes;
+        os resultados delas que nenhuma sessão exibe são apagados. A entrada `keep`,
+        recém-gravada, nunca é removida.
+        """
+        with closing(self._connect()) as conn, conn:
+            total = conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM result_cache').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for key, result_id, size in conn.execute(
+                    'SELECT key, result_id, size_bytes FROM result_cache WHERE key != ? ORDER BY accessed_at',
+                    (keep,)).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+                evicted.append(result_id)
+                total -= size
+        self._release(evicted)
+        logging.info(f"Cache de resultados: {len(evicted)} entradas removidas pelo limite de espaço.")
@@ -0,0 +1,209 @@
+# result_store.py
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from trade_table import TradeTable
+
+RESULTS_DIR = os.environ.get(
+    'BYBIT_RESULTS_DIR', os.path.join(os.environ.get('BYBIT_CACHE_DIR', './cache'), 'results'))
+
+# Tempo de vida de um resultado sem acesso, em segundos
+RESULT_TTL_SECONDS = int(os.environ.get('BYBIT_RESULT_TTL', 2 * 60 * 60))
+
+# Quantidade de resultados mantidos em memória (os demais ficam apenas em disco)
+MEMORY_MAX_ENTRIES = 16
+
+# Intervalo mínimo entre varreduras do diretório em busca de resultados expirados
+_SWEEP_INTERVAL_SECONDS = 60
+
+# Tabelas gravadas em partições (uma por chave do índice) e lidas sob demanda,
+# no formato {tabela: chave do índice {chave: (linha_inicial, linha_final)} no resultado}
+PARTITIONED_TABLES = {'all_trades': 'symbol_index'}
+
+
+class ResultStore:
+    """
+    Guarda os resultados de análise fora da sessão do Flask. A sessão leva apenas o
+    identificador (handle) devolvido por put().
+    Os resultados ficam em um LRU em memória e são sempre gravados em disco (pickle
+    protocolo 5, que serializa DataFrames e TradeTables como buffers por coluna), de modo que qualquer worker
+    do gunicorn consegue lê-los. Entradas sem acesso por mais de `ttl` segundos expiram.
+    """
+
+    def __init__(self, directory=None, ttl=RESULT_TTL_SECONDS, max_entries=MEMORY_MAX_ENTRIES):
+        self.directory = directory or RESULTS_DIR
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # result_id -> (resultado, último acesso)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, result_id, table=None):
+        if table:
+            return os.path.join(self.directory, f"{result_id}.{table}.parts")
+        return os.path.join(self.directory, f"{result_id}.pkl")
+
+    def _write_partitions(self, result_id, name, table, index):
+        """
+        Grava cada fatia da tabela como um bloco pickle independente.
+        :return: {chave: (posição em bytes, tamanho em bytes)}
+        """
+        offsets = {}
+        path = self._path(result_id, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for key, (start, stop) in index.items():
+                data = pickle.dumps(table[start:stop], protocol=5)
+                offsets[key] = (f.tell(), len(data))
+                f.write(data)
+        os.replace(tmp_path, path)
+        return offsets
+
+    def _remember(self, result_id, result, now):
+        with self._lock:
+            self._memory[result_id] = (result, now)
+            self._memory.move_to_end(result_id)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, result, result_id=None):
+        """
+        Armazena o resultado e retorna o handle a ser guardado na sessão.
+        :param result_id: Handle a usar (ex: o de um resultado compartilhado); por padrão, um novo.
+        """
+        result_id = result_id or uuid.uuid4().hex
+        result = dict(result)
+        partitions = {}
+        for table, index_key in PARTITIONED_TABLES.items():
+            if table in result and index_key in result:
+                partitions[table] = self._write_partitions(result_id, table, result.pop(table), result[index_key])
+        result['_partitions'] = partitions
+
+        # O arquivo principal é gravado por último: a partir dele o resultado passa a existir
+        path = self._path(result_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=5)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        self._remember(result_id, result, now)
+        self.evict_expired(now)
+        return result_id
+
+    def get(self, result_id):
+        """
+        :return: O resultado, ou None se o handle não existir ou tiver expirado.
+        """
+        if not result_id:
+            return None
+        now = time.time()
+        path = self._path(result_id)
+
+        with self._lock:
+            entry = self._memory.get(result_id)
+        if entry is not None and now - entry[1] <= self.ttl and os.path.exists(path):
+            self._remember(result_id, entry[0], now)
+            os.utime(path, (now, now))
+            return entry[0]
+
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                self.delete(result_id)
+                return None
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self._memory.pop(result_id, None)
+            return None
+
+        # O mtime do arquivo marca o último acesso, compartilhado entre processos
+        os.utime(path, (now, now))
+        self._remember(result_id, result, now)
+        return result
+
+    def get_partition(self, result_id, table, key):
+        """
+        Lê apenas a partição `key` da tabela (ex: os trades de um símbolo).
+        :return: TradeTable da partição, ou None se o resultado ou a chave não existirem.
+        """
+        result = self.get(result_id)
+        if result is None:
+            return None
+        position = result['_partitions'].get(table, {}).get(key)
+        if position is None:
+            return None
+        offset, size = position
+        with open(self._path(result_id, table), 'rb') as f:
+            f.seek(offset)
+            return pickle.loads(f.read(size))
+
+    def get_table(self, result_id, table):
+        """
+        Lê a tabela completa, concatenando as partições na ordem do índice.
+        :return: TradeTable, ou None se o resultado não existir.
+        """
+        result = self.get(result_id)
+        if result is None:
+            return None
+        offsets = result['_partitions'].get(table, {})
+        if not offsets:
+            return TradeTable.empty()
+        with open(self._path(result_id, table), 'rb') as f:
+            parts = [pickle.loads(f.read(size)) for _, size in sorted(offsets.values())]
+        return TradeTable.concat(parts)
+
+    def size_bytes(self, result_id):
+        """
+        :return: Espaço ocupado em disco pelo resultado (arquivo principal e partições).
+        """
+        size = 0
+        for path in [self._path(result_id)] + [self._path(result_id, table) for table in PARTITIONED_TABLES]:
+            try:
+                size += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return size
+
+    def delete(self, result_id):
+        if not result_id:
+            return
+        with self._lock:
+            self._memory.pop(result_id, None)
+        for path in [self._path(result_id)] + [self._path(result_id, table) for table in PARTITIONED_TABLES]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def evict_expired(self, now=None):
+        """
+        Remove da memória e do disco os resultados sem acesso há mais de `ttl` segundos.
+        """
+        now = now or time.time()
+        with self._lock:
+            expired = [result_id for result_id, (_, accessed) in self._memory.items()
+                       if now - accessed > self.ttl]
+            for result_id in expired:
+                self._memory.pop(result_id, None)
+            if now - self._last_sweep < _SWEEP_INTERVAL_SECONDS:
+                return
+            self._last_sweep = now
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    self.delete(name[:-len('.pkl')])
+                    logging.info(f"Resultado expirado removido: {name}")
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,100 @@
+# tests/test_closed_pnl_fetch.py
+"""
+Busca paralela das posições fechadas (fetch_closed_positions) contra uma sessão
+falsa que registra o horário de cada requisição: ordem das janelas no resultado,
+limite de janelas simultâneas e ritmo do limitador.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest -q tests
+"""
+import random
+import threading
+import time
+
+import pytest
+
+from bybit_client import _date_windows, fetch_closed_positions
+from rate_limiter import TokenBucket
+
+START_DATE, END_DATE = '2024-01-01', '2024-03-01'
+
+
+class FakeSession:
+    """
+    Sessão no lugar da pybit: responde get_closed_pnl com posições sintéticas (uma a cada
+    hora, do mais recente para o mais antigo, 100 por página, como a API) após uma latência
+    aleatória, e registra o início e o fim de cada requisição.
+    """
+
+    def __init__(self, start_ms, end_ms, latency=(0.0, 0.02), seed=0):
+        self.times = list(range(start_ms, end_ms + 1, 3_600_000))
+        self.latency = latency
+        self.calls = []  # (início, fim), em time.monotonic()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get_closed_pnl(self, category, startTime, endTime, limit, cursor):
+        with self._lock:
+            started = time.monotonic()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self._random.uniform(*self.latency)
+        time.sleep(delay)
+
+        in_window = [t for t in reversed(self.times) if startTime <= t <= endTime]
+        offset = int(cursor or 0)
+        page = in_window[offset:offset + limit]
+        next_cursor = str(offset + limit) if offset + limit < len(in_window) else ''
+        with self._lock:
+            self.in_flight -= 1
+            self.calls.append((started, time.monotonic()))
+        return {'retCode': 0, 'retMsg': 'OK', 'result': {
+            'list': [{'symbol': 'BTCUSDT', 'orderId': str(t), 'updatedTime': str(t)} for t in page],
+            'nextPageCursor': next_cursor}}
+
+
+def _fake_session(latency):
+    windows = _date_windows(START_DATE, END_DATE)
+    return FakeSession(windows[0][0], windows[-1][1], latency=latency), windows
+
+
+def _fetch(session, max_workers, limiter):
+    return fetch_closed_positions('key', 'secret', START_DATE, END_DATE, session=session,
+                                  max_workers=max_workers, limiter=limiter)
+
+
+def test_windows_merged_in_chronological_order():
+    session, windows = _fake_session(latency=(0.0, 0.03))
+
+    positions = _fetch(session, max_workers=4, limiter=TokenBucket(10_000))
+
+    # Janelas em ordem cronológica; dentro de cada uma, a ordem da API (mais recente primeiro)
+    expected = []
+    for window_start, window_end, _ in windows:
+        expected += [str(t) for t in reversed(session.times) if window_start <= t <= window_end]
+    assert positions['updatedTime'].tolist() == expected
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_concurrent_windows_limited_by_max_workers(max_workers):
+    session, _ = _fake_session(latency=(0.01, 0.02))
+
+    _fetch(session, max_workers=max_workers, limiter=TokenBucket(10_000))
+
+    assert session.max_in_flight == max_workers
+
+
+def test_requests_paced_by_token_bucket():
+    rate = 40
+    session, _ = _fake_session(latency=(0.0, 0.0))
+
+    _fetch(session, max_workers=4, limiter=TokenBucket(rate, capacity=1))
+
+    starts = sorted(started for started, _ in session.calls)
+    assert len(starts) > 10
+    # Com capacidade 1, as requisições saem no máximo a `rate` por segundo
+    elapsed = starts[-1] - starts[0]
+    assert elapsed >= (len(starts) - 1) / rate * 0.9
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 1 / rate * 0.5
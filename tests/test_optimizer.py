@@ -0,0 +1,81 @@
+# tests/test_optimizer.py
+"""
+optimize_blacklist comparado com a busca exaustiva em contas pequenas aleatórias.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest -q tests
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from optimizer import optimize_blacklist
+
+
+def _random_aggregates(rng, n_symbols):
+    """
+    Índice de agregados (symbol, exit_type) com os totais que o otimizador usa.
+    """
+    rows = []
+    for i in range(n_symbols):
+        for exit_type in ('Manual', 'StopLoss'):
+            trades = int(rng.integers(1, 20))
+            rows.append({'symbol': f"SYM{i}USDT", 'exit_type': exit_type,
+                         'total_pnl_net': float(rng.normal(0, 50)),
+                         'total_margin': float(rng.uniform(1, 1000)) * trades,
+                         'total_notional': 0.0, 'win_count': 0, 'trade_count': trades})
+    return pd.DataFrame(rows).set_index(['symbol', 'exit_type'])
+
+
+def _brute_force(symbol_aggregates, objective, min_trades, max_symbols):
+    """
+    :return: Melhor valor do objetivo entre todas as blacklists viáveis (ao menos 1 trade restante).
+    """
+    by_symbol = symbol_aggregates.groupby(level='symbol').sum()
+    pnl, margin = by_symbol['total_pnl_net'].to_numpy(), by_symbol['total_margin'].to_numpy()
+    trades = by_symbol['trade_count'].to_numpy()
+    best = -np.inf
+    for size in range(len(by_symbol) + 1 if max_symbols is None else max_symbols + 1):
+        for chosen in itertools.combinations(range(len(by_symbol)), size):
+            kept = np.ones(len(by_symbol), dtype=bool)
+            kept[list(chosen)] = False
+            remaining = trades[kept].sum()
+            if remaining < max(min_trades, 1):
+                continue
+            value = pnl[kept].sum() if objective == 'pnl' else pnl[kept].sum() / margin[kept].sum() * 100
+            best = max(best, value)
+    return best
+
+
+def _achieved(result, objective):
+    after = result['after']
+    return after['total_pnl'] if objective == 'pnl' else after['avg_roi']
+
+
+@pytest.mark.parametrize('objective', ['pnl', 'roi'])
+@pytest.mark.parametrize('min_trades,max_symbols', [(0, None), (40, None), (0, 3)])
+def test_matches_exhaustive_search(objective, min_trades, max_symbols):
+    rng = np.random.default_rng(7)
+    for _ in range(30):
+        symbol_aggregates = _random_aggregates(rng, int(rng.integers(1, 9)))
+        result = optimize_blacklist(symbol_aggregates, objective, min_trades=min_trades, max_symbols=max_symbols)
+        expected = _brute_force(symbol_aggregates, objective, min_trades, max_symbols)
+        if np.isinf(expected):
+            # Nenhuma blacklist viável: nada é sugerido
+            assert result['blacklist'] == []
+            continue
+        assert result['exact']
+        assert result['after']['total_trades'] >= max(min_trades, 1)
+        assert _achieved(result, objective) == pytest.approx(expected, rel=1e-9, abs=1e-9)
+
+
+def test_roi_never_bans_every_symbol():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        symbol_aggregates = _random_aggregates(rng, 40)
+        result = optimize_blacklist(symbol_aggregates, 'roi')
+        assert len(result['blacklist']) < 40
+        assert result['after']['total_trades'] > 0
+        assert result['after']['avg_roi'] >= result['before']['avg_roi']
@@ -0,0 +1,187 @@
+# timeseries.py
+"""
+Séries temporais da análise: curva de capital (PnL acumulado), drawdown máximo, PnL por
+dia/semana/mês e taxa de acerto móvel.
+
+Os trades são ordenados uma única vez pelo instante de saída (ms em int64) e todo o resto
+sai de somas acumuladas e reduceat do NumPy, sem iterar trade a trade. As séries guardadas
+no resultado têm um ponto por dia (ou semana/mês), não por trade, para que o tamanho do
+resultado não cresça com o número de trades; o drawdown máximo é calculado trade a trade.
+"""
+import numpy as np
+import pandas as pd
+
+from trade_table import NAT_MS
+
+DAY_MS = 86_400_000
+
+# Número de trades na janela da taxa de acerto móvel
+ROLLING_WIN_RATE_WINDOW = 50
+
+PERIODS = ('daily', 'weekly', 'monthly')
+
+
+def _format_ms(ms):
+    return pd.Timestamp(int(ms), unit='ms').strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _format_day(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+def _period_starts(days, period):
+    """
+    Primeiro dia (em dias desde 1970-01-01) do período de cada dia. Semanas começam na segunda-feira.
+    """
+    if period == 'daily':
+        return days
+    if period == 'weekly':
+        # 1970-01-01 foi uma quinta-feira: +3 alinha as semanas à segunda-feira
+        return days - (days + 3) % 7
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+
+
+def _period_records(days, pnl, trades, wins):
+    """
+    Soma os dias (ordenados) em cada período.
+    :return: {'daily': [...], 'weekly': [...], 'monthly': [...]} com uma linha por período.
+    """
+    buckets = {}
+    for period in PERIODS:
+        starts = _period_starts(days, period)
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        period_pnl = np.add.reduceat(pnl, first)
+        period_trades = np.add.reduceat(trades, first)
+        period_wins = np.add.reduceat(wins, first)
+        buckets[period] = [
+            {'period': _format_day(start), 'pnl_net': float(pnl_sum), 'trade_count': int(count),
+             'win_rate': float(win_count / count * 100) if count else 0.0}
+            for start, pnl_sum, count, win_count in zip(starts[first], period_pnl, period_trades, period_wins)
+        ]
+    return buckets
+
+
+def _max_drawdown(equity, times, format_time):
+    """
+    Maior queda do PnL acumulado em relação ao pico anterior (o capital inicial, 0, conta
+    como pico). :param times: Instante de cada ponto de `equity`, na mesma ordem.
+    """
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0))
+    drawdown = equity - peak
+    trough = int(np.argmin(drawdown))
+    if drawdown[trough] >= 0:
+        return {'value': 0.0, 'peak_time': None, 'trough_time': None, 'recovery_time': None}, drawdown
+
+    peak_value = peak[trough]
+    at_peak = np.flatnonzero(equity[:trough + 1] >= peak_value)
+    recovered = np.flatnonzero(equity[trough:] >= peak_value)
+    return {
+        'value': float(drawdown[trough]),
+        # Sem ponto no pico, a queda começou do capital inicial, antes do primeiro trade
+        'peak_time': format_time(times[at_peak[-1]]) if len(at_peak) else None,
+        'trough_time': format_time(times[trough]),
+        'recovery_time': format_time(times[trough + recovered[0]]) if len(recovered) else None,
+    }, drawdown
+
+
+def empty_time_series():
+    return {
+        'resolution': 'trade',
+        'equity_curve': [],
+        'max_drawdown': {'value': 0.0, 'peak_time': None, 'trough_time': None, 'recovery_time': None},
+        'rolling_win_rate_window': ROLLING_WIN_RATE_WINDOW,
+        **{period: [] for period in PERIODS},
+    }
+
+
+def build_time_series(exit_ms, pnl_net, window=ROLLING_WIN_RATE_WINDOW):
+    """
+    Calcula as séries temporais a partir do instante de saída e do PnL de cada trade.
+    :param exit_ms: Instantes de saída em ms (int64; NAT_MS para ausente), em qualquer ordem.
+    :param pnl_net: PnL líquido de cada trade.
+    :param window: Número de trades da taxa de acerto móvel.
+    :return: {'resolution', 'equity_curve', 'max_drawdown', 'rolling_win_rate_window',
+              'daily', 'weekly', 'monthly'}. A curva tem um ponto por dia: PnL acumulado no
+              fim do dia, menor drawdown durante o dia e taxa de acerto dos últimos `window`
+              trades até o fim do dia.
+    """
+    exit_ms = np.asarray(exit_ms, dtype='int64')
+    pnl_net = np.asarray(pnl_net, dtype='float64')
+    valid = (exit_ms != NAT_MS) & np.isfinite(pnl_net)
+    exit_ms, pnl_net = exit_ms[valid], pnl_net[valid]
+    if len(exit_ms) == 0:
+        return empty_time_series()
+
+    order = np.argsort(exit_ms, kind='stable')
+    exit_ms, pnl_net = exit_ms[order], pnl_net[order]
+    wins = (pnl_net > 0).astype('int64')
+
+    equity = np.cumsum(pnl_net)
+    max_drawdown, drawdown = _max_drawdown(equity, exit_ms, _format_ms)
+
+    # Taxa de acerto dos últimos `window` trades (todos os anteriores enquanto houver menos)
+    cumulative_wins = np.cumsum(wins)
+    window_wins = cumulative_wins.copy()
+    window_wins[window:] -= cumulative_wins[:-window]
+    rolling_win_rate = window_wins / np.minimum(np.arange(1, len(wins) + 1), window) * 100
+
+    days = exit_ms // DAY_MS
+    day_first = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    day_last = np.r_[day_first[1:] - 1, len(days) - 1]
+    day_trades = np.diff(np.r_[day_first, len(days)])
+    day_low = np.minimum.reduceat(drawdown, day_first)
+
+    equity_curve = [
+        {'date': _format_day(day), 'equity': float(close), 'drawdown': float(low), 'rolling_win_rate': float(rate)}
+        for day, close, low, rate in zip(days[day_first], equity[day_last], day_low, rolling_win_rate[day_last])
+    ]
+    return {
+        'resolution': 'trade',
+        'equity_curve': equity_curve,
+        'max_drawdown': max_drawdown,
+        'rolling_win_rate_window': window,
+        **_period_records(days[day_first], np.add.reduceat(pnl_net, day_first), day_trades,
+                          np.add.reduceat(wins, day_first)),
+    }
+
+
+def time_series_from_daily(daily_aggregates):
+    """
+    Séries temporais a partir dos agregados diários (cube.cube_daily; modo streaming, sem a
+    ordem dos trades):
+    a curva e o drawdown máximo usam o PnL acumulado no fim de cada dia, e não há taxa de
+    acerto móvel ('rolling_win_rate' é None).
+    """
+    if daily_aggregates.empty:
+        return {**empty_time_series(), 'resolution': 'daily'}
+
+    daily_aggregates = daily_aggregates.sort_index()
+    days = daily_aggregates.index.to_numpy(dtype='int64')
+    pnl = daily_aggregates['pnl_net'].to_numpy(dtype='float64')
+    trades = daily_aggregates['trade_count'].to_numpy(dtype='int64')
+    wins = daily_aggregates['win_count'].to_numpy(dtype='int64')
+
+    equity = np.cumsum(pnl)
+    max_drawdown, drawdown = _max_drawdown(equity, days, _format_day)
+    return {
+        'resolution': 'daily',
+        'equity_curve': [{'date': _format_day(day), 'equity': float(close), 'drawdown': float(low),
+                          'rolling_win_rate': None}
+                         for day, close, low in zip(days, equity, drawdown)],
+        'max_drawdown': max_drawdown,
+        'rolling_win_rate_window': None,
+        **_period_records(days, pnl, trades, wins),
+    }
+
+
+def trades_time_series(trades, blacklist=None):
+    """
+    Séries temporais de uma TradeTable, opcionalmente sem os símbolos da blacklist.
+    """
+    exit_ms, pnl_net = trades.column('exit_time'), trades.column('pnl_net')
+    if blacklist:
+        blacklist = set(blacklist)
+        blocked = [code for code, symbol in enumerate(trades.categories('symbol')) if symbol in blacklist]
+        keep = ~np.isin(trades.codes('symbol'), blocked)
+        exit_ms, pnl_net = exit_ms[keep], pnl_net[keep]
+    return build_time_series(exit_ms, pnl_net)
@@ -0,0 +1,307 @@
+# trade_table.py
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Colunas numéricas armazenadas como float64
+FLOAT_COLUMNS = ('quantity', 'avg_entry_price', 'exit_price', 'valor_nocional',
+                 'margem', 'pnl_net', 'roi', 'fill_fee')
+
+# Colunas de texto com poucos valores distintos, armazenadas como códigos + categorias
+CATEGORY_COLUMNS = ('symbol', 'position_side', 'exit_type')
+
+# Instantes armazenados como int64 em milissegundos desde a época (UTC)
+TIME_COLUMNS = ('entry_time', 'exit_time')
+
+# Colunas calculadas na leitura a partir das demais (não ocupam memória)
+DERIVED_COLUMNS = ('duration', 'result')
+
+COLUMNS = ('symbol', 'position_side', 'entry_time', 'exit_time', 'duration', 'quantity',
+           'avg_entry_price', 'exit_price', 'valor_nocional', 'margem', 'pnl_net', 'roi',
+           'result', 'exit_type', 'fill_fee')
+
+# Valor usado para instantes ausentes (mesmo sentinela do NaT do pandas)
+NAT_MS = np.iinfo('int64').min
+
+_MS_PER_DAY = 86_400_000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _codes_dtype(n_categories):
+    return np.int8 if n_categories <= 127 else np.int16 if n_categories <= 32767 else np.int32
+
+
+def format_durations(duration_ms, nat=None):
+    """
+    Formata durações em milissegundos exatamente como str(pd.Timedelta(...)),
+    removendo o prefixo '0 days ' e usando '0:00:00' para duração zero.
+    O formatador de strings do pandas é o gargalo aqui, então as partes
+    (dias, horas, minutos, segundos, frações) são calculadas em NumPy.
+    :param nat: Máscara opcional das durações ausentes (formatadas como 'NaT').
+    """
+    ms = np.asarray(duration_ms, dtype='int64')
+    if nat is None:
+        nat = np.zeros(len(ms), dtype=bool)
+    ms = np.where(nat, 0, ms)
+
+    days, rem = np.divmod(ms, _MS_PER_DAY)
+    seconds, frac_ms = np.divmod(rem, 1000)
+    hours, seconds = np.divmod(seconds, 3600)
+    minutes, seconds = np.divmod(seconds, 60)
+
+    formatted = []
+    for is_nat, total, d, h, m, s, f in zip(nat.tolist(), ms.tolist(), days.tolist(), hours.tolist(),
+                                            minutes.tolist(), seconds.tolist(), frac_ms.tolist()):
+        if is_nat:
+            formatted.append('NaT')
+            continue
+        if total == 0:
+            formatted.append('0:00:00')
+            continue
+        text = f"{d} days {'+' if d < 0 else ''}{h:02d}:{m:02d}:{s:02d}"
+        if f:
+            text += f".{f * 1000:06d}"
+        formatted.append(text.replace('0 days ', ''))
+    return formatted
+
+
+def _to_epoch_ms(values):
+    """
+    Converte datetimes (ou ms já numéricos) para int64 em ms, com NAT_MS nos ausentes.
+    """
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_numeric_dtype(values):
+        ms = values.fillna(0).to_numpy().astype('int64')
+    else:
+        values = pd.to_datetime(values)
+        ms = values.to_numpy(dtype='datetime64[ms]').astype('int64')
+    return np.where(values.isna().to_numpy(), NAT_MS, ms)
+
+
+class TradeRow:
+    """
+    Visão leve de uma linha da TradeTable, usada pelos templates (trade.symbol, trade['roi']...).
+    Os valores são decodificados apenas quando acessados.
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            return self._table._value(name, self._index)
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name):
+        return self._table._value(name, self._index)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {column: self[column] for column in COLUMNS}
+
+    def __repr__(self):
+        return f"TradeRow({self.to_dict()!r})"
+
+
+class TradeTable:
+    """
+    Tabela de trades em formato colunar compacto (struct-of-arrays): floats em float64,
+    symbol/position_side/exit_type como códigos inteiros + lista de categorias, e instantes
+    como int64 em ms. Duração e resultado (Lucro/Perda) são derivados na leitura.
+    Fatias (table[a:b]) são views sobre os mesmos arrays, e o pickle grava apenas
+    buffers numéricos em vez de um objeto Python por célula.
+    """
+
+    def __init__(self, floats, codes, categories, times):
+        self._floats = floats
+        self._codes = codes
+        self._categories = categories
+        self._times = times
+        self._duration_cache = None
+
+    # --- Construção ---
+
+    @classmethod
+    def from_columns(cls, symbol, position_side, entry_time, exit_time, exit_type, **floats):
+        """
+        Monta a tabela a partir de arrays/listas por coluna. Instantes podem ser datetimes
+        ou ms; as colunas float ausentes em `floats` são preenchidas com 0.
+        """
+        n_rows = len(symbol)
+        codes, categories = {}, {}
+        for name, values in (('symbol', symbol), ('position_side', position_side), ('exit_type', exit_type)):
+            if np.ndim(values) == 0:
+                values = np.full(n_rows, values, dtype=object)
+            column_codes, uniques = pd.factorize(np.asarray(values, dtype=object), sort=True,
+                                                 use_na_sentinel=False)
+            codes[name] = column_codes.astype(_codes_dtype(len(uniques)))
+            categories[name] = tuple(uniques.tolist())
+
+        float_columns = {
+            name: np.asarray(floats[name], dtype='float64') if name in floats else np.zeros(n_rows)
+            for name in FLOAT_COLUMNS
+        }
+        times = {'entry_time': _to_epoch_ms(entry_time), 'exit_time': _to_epoch_ms(exit_time)}
+        return cls(float_columns, codes, categories, times)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Converte um DataFrame com as colunas de COLUMNS (ex: o formato antigo de all_trades).
+        """
+        return cls.from_columns(
+            df['symbol'].to_numpy(), df['position_side'].to_numpy(),
+            df['entry_time'], df['exit_time'], df['exit_type'].to_numpy(),
+            **{name: df[name].to_numpy(dtype='float64') for name in FLOAT_COLUMNS if name in df.columns})
+
+    @classmethod
+    def empty(cls):
+        return cls.from_columns([], [], [], [], [])
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Concatena tabelas, unificando as categorias.
+        """
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.empty()
+        codes, categories = {}, {}
+        for name in CATEGORY_COLUMNS:
+            merged = sorted(set().union(*(table._categories[name] for table in tables)))
+            position = {value: code for code, value in enumerate(merged)}
+            dtype = _codes_dtype(len(merged))
+            codes[name] = np.concatenate([
+                np.array([position[value] for value in table._categories[name]], dtype=dtype)[table._codes[name]]
+                if table._categories[name] else table._codes[name].astype(dtype)
+                for table in tables
+            ])
+            categories[name] = tuple(merged)
+        floats = {name: np.concatenate([table._floats[name] for table in tables]) for name in FLOAT_COLUMNS}
+        times = {name: np.concatenate([table._times[name] for table in tables]) for name in TIME_COLUMNS}
+        return cls(floats, codes, categories, times)
+
+    # --- Acesso ---
+
+    def __len__(self):
+        return len(self._floats['pnl_net'])
+
+    @property
+    def columns(self):
+        return list(COLUMNS)
+
+    def __getitem__(self, key):
+        """
+        table['coluna'] -> array da coluna (categorias decodificadas, instantes em ms);
+        table[a:b] -> nova TradeTable (view) com as linhas do intervalo.
+        """
+        if isinstance(key, slice):
+            return self._select(key)
+        return self.column(key)
+
+    def take(self, indices):
+        """
+        Nova TradeTable com as linhas nas posições `indices` (cópia).
+        """
+        return self._select(np.asarray(indices))
+
+    def _select(self, selector):
+        return TradeTable(
+            {name: values[selector] for name, values in self._floats.items()},
+            {name: values[selector] for name, values in self._codes.items()},
+            self._categories,
+            {name: values[selector] for name, values in self._times.items()},
+        )
+
+    def codes(self, name):
+        return self._codes[name]
+
+    def categories(self, name):
+        return self._categories[name]
+
+    def column(self, name):
+        if name in self._floats:
+            return self._floats[name]
+        if name in self._codes:
+            return np.array(self._categories[name], dtype=object)[self._codes[name]]
+        if name in self._times:
+            return self._times[name]
+        if name == 'duration':
+            return np.array(self._durations(), dtype=object)
+        if name == 'result':
+            return np.where(self._floats['pnl_net'] > 0, 'Lucro', 'Perda').astype(object)
+        raise KeyError(name)
+
+    def _durations(self):
+        if self._duration_cache is None:
+            entry, exit_ = self._times['entry_time'], self._times['exit_time']
+            nat = (entry == NAT_MS) | (exit_ == NAT_MS)
+            self._duration_cache = format_durations(np.where(nat, 0, exit_ - entry), nat)
+        return self._duration_cache
+
+    def _value(self, name, index):
+        if name in self._floats:
+            return float(self._floats[name][index])
+        if name in self._codes:
+            return self._categories[name][self._codes[name][index]]
+        if name in self._times:
+            ms = int(self._times[name][index])
+            return pd.NaT if ms == NAT_MS else _EPOCH + timedelta(milliseconds=ms)
+        if name == 'duration':
+            return self._durations()[index]
+        if name == 'result':
+            return 'Lucro' if self._floats['pnl_net'][index] > 0 else 'Perda'
+        raise KeyError(name)
+
+    def rows(self, start=0, stop=None):
+        """
+        :return: Lista de TradeRow das linhas [start, stop), para iteração nos templates.
+        """
+        table = self[start:stop]
+        return [TradeRow(table, index) for index in range(len(table))]
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def to_frame(self):
+        """
+        Converte para DataFrame no formato antigo de all_trades (símbolos como Categorical).
+        """
+        data = {}
+        for name in COLUMNS:
+            if name in self._codes:
+                data[name] = pd.Categorical.from_codes(self._codes[name], categories=list(self._categories[name])) \
+                    if self._categories[name] else pd.Categorical([])
+            elif name in self._times:
+                data[name] = pd.to_datetime(self._times[name], unit='ms')
+            else:
+                data[name] = self.column(name)
+        return pd.DataFrame(data, columns=list(COLUMNS))
+
+    @property
+    def nbytes(self):
+        """
+        Memória ocupada pelos arrays (sem contar as listas de categorias).
+        """
+        return sum(values.nbytes for group in (self._floats, self._codes, self._times)
+                   for values in group.values())
+
+    def __getstate__(self):
+        # O cache de durações é recalculado sob demanda e não vai para o pickle
+        return {'floats': self._floats, 'codes': self._codes, 'categories': self._categories,
+                'times': self._times}
+
+    def __setstate__(self, state):
+        self.__init__(state['floats'], state['codes'], state['categories'], state['times'])
+
+    def __repr__(self):
+        return f"TradeTable({len(self)} trades)"